@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Compare augmentation of large `file_list` responses by deep copy against copy-on-write augmenters.
+
+Responses are synthetic, no daemon or database is needed:
+
+    python benchmarks/bench_augmentation.py --files 5000 --rounds 20
+"""
+import os
+import sys
+import copy
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lbryweb'))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(
+    INSTALLED_APPS=['daemon.apps.DaemonConfig'],
+    LBRY_DAEMON='http://localhost:5479/',
+    LBRY_CONTENT_URL='http://localhost:8000/storage/content/',
+)
+django.setup()
+
+from daemon.api import API  # noqa: E402
+
+
+def make_file_list_response(files):
+    return {
+        'id': None,
+        'jsonrpc': '2.0',
+        'result': [
+            {
+                'blobs_completed': 3,
+                'blobs_in_stream': 3,
+                'claim_id': f'{index:040x}',
+                'claim_name': f'claim-{index}',
+                'completed': True,
+                'download_directory': '/storage/download',
+                'download_path': f'/storage/download/file-{index}.mp4',
+                'file_name': f'file-{index}.mp4',
+                'key': 'e4a6d4a8d1b6b4c3a2f1e0d9c8b7a6f5',
+                'metadata': {
+                    'author': 'lbryweb',
+                    'description': 'Synthetic file list entry ' * 4,
+                    'fee': {'address': 'bP4jJ4dHt3Tn3B6ZfR3Hh9t4Xz6GZTRw1X', 'amount': 1.0, 'currency': 'LBC'},
+                    'language': 'en',
+                    'license': 'Public Domain',
+                    'nsfw': False,
+                    'stream_hash': f'{index:096x}',
+                    'tags': ['one', 'two', 'three'],
+                    'thumbnail': f'https://spee.ch/{index}.png',
+                    'title': f'File {index}',
+                    'version': '_0_1_0',
+                },
+                'mime_type': 'video/mp4',
+                'outpoint': f'{index:064x}:0',
+                'points_paid': 0.0,
+                'sd_hash': f'{index:096x}',
+                'status': 'finished',
+                'stopped': True,
+                'stream_hash': f'{index:096x}',
+                'stream_name': f'file-{index}.mp4',
+                'suggested_file_name': f'file-{index}.mp4',
+                'total_bytes': 1048576,
+                'written_bytes': 1048576,
+            }
+            for index in range(files)
+        ]
+    }
+
+
+def augment_deepcopy(api, request, response):
+    """
+    The former pipeline: deep copies of both request and response mutated in place.
+    """
+    copy.deepcopy(request)
+    augmented_response = copy.deepcopy(response)
+    for file_item in augmented_response['result']:
+        file_item['download_path'] = (
+            f'{settings.LBRY_CONTENT_URL}'
+            f'{api.account_id}/outpoints/'
+            f'{file_item["outpoint"]}/{file_item["file_name"]}'
+        )
+    return augmented_response
+
+
+def augment_copy_on_write(api, request, response):
+    api._augment_request(request)
+    return api._augment_response(request, response)
+
+
+def measure(augment, api, request, response, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        augment(api, request, response)
+    elapsed = (time.perf_counter() - started) / rounds
+
+    tracemalloc.start()
+    augmented_response = augment(api, request, response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert augmented_response['result'][-1]['download_path'].startswith('http://')
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    api = API(account_id='abc')
+    request = {'jsonrpc': '2.0', 'method': 'file_list', 'params': {'full_status': True}, 'id': 1}
+    response = make_file_list_response(args.files)
+
+    deep_time, deep_peak = measure(augment_deepcopy, api, request, response, args.rounds)
+    cow_time, cow_peak = measure(augment_copy_on_write, api, request, response, args.rounds)
+
+    print(f'file_list with {args.files} entries, {args.rounds} rounds')
+    print(f'deepcopy:      {deep_time * 1000:8.2f} ms {deep_peak / 2 ** 20:8.2f} MiB peak')
+    print(
+        f'copy-on-write: {cow_time * 1000:8.2f} ms {cow_peak / 2 ** 20:8.2f} MiB peak '
+        f'({deep_time / cow_time:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Compare serving a file by Python-level reads against sendfile, by throughput and CPU time per GB sent.
+
+A temporary file is sent over a local socket pair drained by another thread, no web server is needed:
+
+    python benchmarks/bench_sendfile.py --size 512 --rounds 3
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lbryweb'))
+
+from storage.file_utils import FileRange, RangeFileWrapper, get_block_size  # noqa: E402
+
+
+def drain(sock):
+    while sock.recv(1024 * 1024):
+        pass
+
+
+def send_by_reads(sock, file_handle, size, block_size):
+    for chunk in RangeFileWrapper(file_handle, blksize=block_size, offset=0, length=size):
+        sock.sendall(chunk)
+
+
+def send_by_adaptive_reads(sock, file_handle, size, block_size):
+    wrapper = RangeFileWrapper(
+        file_handle, blksize=get_block_size(size, block_size), offset=0, length=size, readahead=2 * 2 ** 20)
+    for chunk in wrapper:
+        sock.sendall(chunk)
+
+
+def send_by_sendfile(sock, file_handle, size, block_size):
+    # What a WSGI server does with the file handed to wsgi.file_wrapper
+    file_range = FileRange(file_handle, offset=0, length=size)
+    offset = os.lseek(file_range.fileno(), 0, os.SEEK_CUR)
+    sent = 0
+    while sent < size:
+        sent += os.sendfile(sock.fileno(), file_range.fileno(), offset + sent, min(size - sent, 2 ** 30))
+
+
+def measure(send, path, size, block_size, rounds):
+    wall = cpu = 0
+    for _ in range(rounds):
+        sender, receiver = socket.socketpair()
+        drainer = threading.Thread(target=drain, args=(receiver,))
+        drainer.start()
+        with open(path, 'rb') as file_handle:
+            started, started_cpu = time.perf_counter(), time.thread_time()
+            send(sender, file_handle, size, block_size)
+            cpu += time.thread_time() - started_cpu
+        sender.close()
+        drainer.join()
+        wall += time.perf_counter() - started
+        receiver.close()
+    return wall / rounds, cpu / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=512, help='File size in MiB')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    size = args.size * 2 ** 20
+    with tempfile.NamedTemporaryFile() as content_file:
+        block = os.urandom(2 ** 20)
+        for _ in range(args.size):
+            content_file.write(block)
+        content_file.flush()
+
+        print(f'{args.size} MiB file, {args.rounds} rounds, sending thread CPU time')
+        for name, send, block_size in [
+            ('reads of 8 KiB', send_by_reads, 8192),
+            ('reads of 64 KiB', send_by_reads, 64 * 1024),
+            ('adaptive reads', send_by_adaptive_reads, 2 ** 20),
+            ('sendfile', send_by_sendfile, None),
+        ]:
+            wall, cpu = measure(send, content_file.name, size, block_size, args.rounds)
+            print(
+                f'{name:16} {size / wall / 2 ** 20:8.0f} MiB/s '
+                f'{cpu / (size / 2 ** 30):8.3f} CPU secs/GiB')
+
+
+if __name__ == '__main__':
+    main()
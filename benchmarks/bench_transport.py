@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Compare throughput of bare `requests.post` calls against the pooled daemon transport.
+
+A stub JSON-RPC daemon is started on localhost so that only the HTTP client side is measured:
+
+    python benchmarks/bench_transport.py --requests 2000 --threads 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lbryweb'))
+
+from daemon.transport import Transport  # noqa: E402
+
+
+class StubDaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'jsonrpc': '2.0', 'id': None, 'result': {'is_running': True}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubDaemon(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def run(send, total, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for response in executor.map(lambda _: send(), range(total)):
+            response.raise_for_status()
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    server = StubDaemon(('127.0.0.1', 0), StubDaemonHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/'
+    payload = {'method': 'status', 'params': {}}
+
+    bare = run(lambda: requests.post(url, json=payload), args.requests, args.threads)
+    transport = Transport(url, pool_size=args.threads)
+    pooled = run(lambda: transport.post(payload), args.requests, args.threads)
+
+    print(f'{args.requests} requests, {args.threads} threads')
+    print(f'requests.post:    {bare:10.1f} req/s')
+    print(f'pooled transport: {pooled:10.1f} req/s ({pooled / bare:.2f}x)')
+    print(f'pool stats:       {transport.stats()}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,24 @@
+import asyncio
+import contextvars
+import itertools
+import json
 import logging
 import hashlib
-import copy
 import re
+from concurrent.futures import ThreadPoolExecutor
 
+import aiohttp
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import connections
 
-from . import exceptions, signals
+from . import exceptions, signals, streaming, tracing
+from .cache import get_cache, fingerprint
+from .coalescing import single_flight, async_single_flight
 from .profiling import Profiler
+from .routing import get_router
+from .transport import get_transport, get_async_transport
 
 
 logger = logging.getLogger(__name__)
@@ -17,6 +28,20 @@ ACCOUNT_SPECIFIC_METHODS = re.compile(
     r'^(wallet)|(account)|(address)|(transaction)_.+$'
 )
 
+# Not account-specific for the daemon, but results depend on what the account has done
+ACCOUNT_SCOPED_CACHE_METHODS = {'file_list'}
+
+# Sent to the daemon holding the account wallet along with account-specific methods
+ACCOUNT_ROUTED_METHODS = {
+    'get', 'publish', 'file_list', 'file_delete', 'file_set_status',
+    'channel_new', 'channel_list', 'claim_list', 'claim_abandon', 'support_create', 'support_abandon',
+}
+
+# JSON-RPC 2.0 error codes
+INVALID_REQUEST = -32600
+INTERNAL_ERROR = -32603
+SERVER_ERROR = -32000
+
 
 class API:
     """
@@ -30,47 +55,89 @@ class API:
     """
     url = settings.LBRY_DAEMON
 
-    def __init__(self, account_id=None):
+    def __init__(self, account_id=None, url=None):
         """
         Supply account_id if you need to perform `proxy` and `publish` requests,
         omit it if only internal `call`s will be performed.
+
+        Calls are routed among daemons listed in `LBRY_DAEMONS`, supply url to send them all to one daemon.
         """
         self.account_id = account_id
+        if url:
+            self.url = url
         self.profiler = Profiler()
 
+    @property
+    def transport(self):
+        return get_transport(self.url)
+
     def validate_account(self):
         if not self.account_id:
             raise exceptions.AccountMissing('Account ID is required for this type of request')
 
     def _extract_response_data(self, method, response):
         json = response.json()
-        error = json.get('error')
+        self._raise_for_error(method, json.get('error'))
+        return json
+
+    def _raise_for_error(self, method, error):
         if error:
             self.profiler.error(method)
             if "Couldn't find account" in error['message']:
                 raise exceptions.AccountNotFound
             else:
                 raise exceptions.DaemonException(error['message'])
-        return json
+
+    def route(self, method, params=None):
+        """
+        Return URL of the daemon that should receive a `method` call.
+
+        Calls concerning an account go to the daemon holding its wallet, the rest are spread among daemons.
+        """
+        if 'url' in vars(self):
+            return self.url
+        account_id = self.account_id
+        if not account_id and isinstance(params, dict):
+            account_id = params.get('account_id')
+        if account_id and (ACCOUNT_SPECIFIC_METHODS.match(method) or method in ACCOUNT_ROUTED_METHODS):
+            return get_router().daemon_for_account(account_id)
+        return get_router().next_daemon()
+
+    def _post(self, method, payload, stream=False):
+        url = self.route(method, payload.get('params'))
+        read_timeout = settings.LBRY_DAEMON_METHOD_TIMEOUTS.get(method)
+        try:
+            with tracing.span('daemon', method=method, url=url) as span:
+                response = get_transport(url).post(payload, read_timeout=read_timeout, stream=stream)
+                span.set(status=response.status_code)
+        except requests.RequestException as exc:
+            self._daemon_failed(url, method)
+            raise exceptions.DaemonConnectionError(exc)
+        except exceptions.DaemonUnavailable:
+            self._daemon_failed(url, method)
+            raise
+        get_router().mark_succeeded(url)
+        return response
+
+    def _daemon_failed(self, url, method):
+        get_router().mark_failed(url)
+        self.profiler.error(method)
 
     def call(self, method, get_result=True, **kwargs):
         logger.debug('Sending request to lbrynet: %s(%s)', method, kwargs)
         self.profiler.start(method)
-        response = requests.post(self.url, json={'method': method, 'params': kwargs})
-        if get_result:
-            response_result = self._extract_response_data(method, response)['result']
-            logger.debug(
-                'Got response from lbrynet: [%s] %s',
-                response.status_code,
-                response_result)
-        else:
-            response_result = self._extract_response_data(method, response)
-            logger.debug(
-                'Got response from lbrynet: [%s] %s',
-                response.status_code,
-                response_result['result'])
+        response = self._post(method, {'method': method, 'params': kwargs})
+        response_data = self._read_call_response(method, response)
         self.profiler.end(method)
-        return response_result
+        return response_data['result'] if get_result else response_data
+
+    def _read_call_response(self, method, response):
+        response_data = self._extract_response_data(method, response)
+        logger.debug(
+            'Got response from lbrynet: [%s] %s',
+            response.status_code,
+            response_data['result'])
+        return response_data
 
     def publish(self, file_path, client_payload):
         client_payload['params']['file_path'] = file_path
@@ -78,20 +145,80 @@ class API:
         return daemon_response
 
     def proxy(self, request):
+        method = request['method']
+        with tracing.span('proxy', method=method):
+            timer = self.profiler.start(method)
+            with tracing.span('augment_request'):
+                augmented_request = self._augment_request(request)
+            response_data = self._fetch(method, augmented_request)
+            with tracing.span('augment_response'):
+                augmented_response = self._augment_response(request, response_data)
+            self._run_post_handler(request, augmented_request, response_data, augmented_response)
+            self.profiler.end(timer)
+        logger.debug(
+            'Returning augmented for proxied request: %s', augmented_response)
+        return augmented_response, response_data
+
+    def proxy_stream(self, request):
+        """
+        Proxy a call to a list-returning method without holding the whole response in memory.
+
+        Daemon response is parsed as it arrives and each item of its result is augmented on its own.
+        Returns an iterator of JSON chunks of the augmented response. Daemon errors, as well as
+        exceptions raised when augmenting the first item, are raised before it is returned.
+
+        Streamed calls bypass the response cache and call coalescing.
+        """
+        method = request['method']
+        self.profiler.start(method)
+        augmented_request = self._augment_request(request)
+        response = self._post(method, augmented_request, stream=True)
+        try:
+            events = streaming.parse(response)
+            member, first_event = streaming.read_member(events, ('result', 'error'))
+            if member != 'result':
+                error = streaming.build_value(events, first_event) if member else None
+                self._raise_for_error(method, error or {'message': 'No result in daemon response'})
+            if first_event[1] != 'start_array':
+                # Not a list after all, have it augmented as a whole
+                response_data = {
+                    'jsonrpc': '2.0', 'result': streaming.build_value(events, first_event), 'id': request.get('id')}
+                augmented_response = self._augment_response(request, response_data)
+                self.profiler.end(method)
+                return iter([json.dumps(augmented_response)])
+            item_processor = self._get_item_processor(method)
+            items = streaming.iter_array(events)
+            first_items = [item_processor(item) for item in itertools.islice(items, 1)]
+        except Exception:
+            response.close()
+            raise
+        return self._stream_items(
+            method, request, response, itertools.chain(first_items, map(item_processor, items)))
+
+    def _stream_items(self, method, request, response, augmented_items):
+        try:
+            yield from streaming.iter_chunks(request.get('id'), augmented_items)
+        except Exception as exc:
+            logger.error('Exception while streaming proxied request (%s): %s', request, exc)
+            self.profiler.error(method)
+            raise
+        else:
+            self.profiler.end(method)
+        finally:
+            response.close()
+
+    def _augment_request(self, request):
+        """
+        Return request to be sent to the daemon.
+
+        Processors never modify the client request in place, they copy only the parts they change,
+        so both versions can be used afterwards without deep-copying.
+        """
         request_processors = {
             'get': self._augment_get_request
         }
-        response_processors = {
-            'get': self._augment_get_response,
-            'file_list': self._augment_file_list_response,
-        }
-        post_handlers = {
-            'get': self._post_get_response
-        }
-
-        self.profiler.start(request['method'])
         request_processor = request_processors.get(request['method'], self._augment_any_request)
-        augmented_request = request_processor(copy.deepcopy(request))
+        augmented_request = request_processor(request)
 
         if augmented_request == request:
             logger.debug(
@@ -101,25 +228,165 @@ class API:
             logger.debug(
                 'Proxying request to lbrynet: %s(%s) -> (%s)',
                 request['method'], request.get('params', ''), augmented_request.get('params', ''))
-        response = requests.post(self.url, json=augmented_request)
-        response_data = self._extract_response_data(request['method'], response)
-        logger.debug(
-            'Got response from lbrynet for proxied request: [%s] %s',
-            response.status_code, response_data)
+        return augmented_request
+
+    def _augment_response(self, request, response_data):
+        """
+        Return response to be sent to the web client.
 
+        Like request processors, response processors leave `response_data` intact as it's also returned
+        by `proxy`, could be shared by coalesced calls and is passed to post handlers.
+        """
+        response_processors = {
+            'get': self._augment_get_response,
+            'file_list': self._augment_file_list_response,
+        }
         response_processor = response_processors.get(request['method'], self._augment_any_response)
-        augmented_response = response_processor(copy.deepcopy(response_data), request)
+        return response_processor(response_data, request)
 
-        post_handler = post_handlers.get(request['method'])
+    def _get_item_processor(self, method):
+        item_processors = {
+            'file_list': self._augment_file_list_item,
+        }
+        return item_processors.get(method, self._augment_any_item)
+
+    def _get_post_handler(self, method):
+        post_handlers = {
+            'get': self._post_get_response
+        }
+        return post_handlers.get(method)
+
+    def _run_post_handler(self, request, augmented_request, response_data, augmented_response):
+        post_handler = self._get_post_handler(request['method'])
         if post_handler:
-            post_handler(
-                request=request, augmented_request=augmented_request,
-                response=response_data, augmented_response=augmented_response)
+            with tracing.span('post_handler'):
+                post_handler(
+                    request=request, augmented_request=augmented_request,
+                    response=response_data, augmented_response=augmented_response)
 
-        self.profiler.end(request['method'])
+    def _fetch(self, method, augmented_request):
+        """
+        Get daemon response for `augmented_request`, from the response cache if the method is cacheable.
+        """
+        cache = self._get_response_cache(method)
+        response_data = None
+        if cache is not None:
+            cache_key, response_data = self._get_cached(cache, method, augmented_request)
+        if response_data is None:
+            response_data = self._send_coalesced(method, augmented_request)
+            if cache is not None:
+                cache.set(cache_key, method, response_data)
+        return response_data
+
+    def _get_response_cache(self, method):
+        cache = get_cache()
+        if cache is not None and cache.is_cacheable(method):
+            return cache
+
+    def _get_cached(self, cache, method, augmented_request):
+        """
+        Return cache key for `augmented_request` along with its cached response, None if there is none.
+        """
+        cache_key = cache.key(method, augmented_request.get('params'), self._cache_scope(method))
+        response_data = cache.get(cache_key)
+        if response_data is not None:
+            if 'id' in response_data:
+                response_data['id'] = augmented_request.get('id')
+            logger.debug('Got cached response for proxied request: %s', response_data)
+        return cache_key, response_data
+
+    def _send_coalesced(self, method, augmented_request):
+        """
+        Send `augmented_request` unless an identical one is already in flight, then share its response.
+        """
+        if method not in settings.LBRY_DAEMON_COALESCED_METHODS:
+            return self._send(method, augmented_request)
+        sent = []
+
+        def send():
+            sent.append(True)
+            return self._send(method, augmented_request)
+
+        try:
+            response_data = single_flight.do(self._coalescing_key(method, augmented_request), send)
+        except exceptions.DaemonException:
+            if not sent:
+                self.profiler.error(method)
+            raise
+        if not sent:
+            response_data = self._share_response(response_data, augmented_request)
+        return response_data
+
+    def _share_response(self, response_data, augmented_request):
+        # Response of a coalesced call, sent with the id of another caller
+        if 'id' in response_data:
+            return dict(response_data, id=augmented_request.get('id'))
+        return response_data
+
+    def _send(self, method, payload):
+        response = self._post(method, payload)
+        return self._read_proxied_response(method, response)
+
+    def _read_proxied_response(self, method, response):
+        response_data = self._extract_response_data(method, response)
         logger.debug(
-            'Returning augmented for proxied request: %s', augmented_response)
-        return augmented_response, response_data
+            'Got response from lbrynet for proxied request: [%s] %s',
+            response.status_code, response_data)
+        return response_data
+
+    def _coalescing_key(self, method, augmented_request):
+        # Same calls of different accounts can be sent to different daemons
+        return f'{self._cache_scope(method) or "-"}:{fingerprint(method, augmented_request.get("params"))}'
+
+    def _cache_scope(self, method):
+        if ACCOUNT_SPECIFIC_METHODS.match(method) or method in ACCOUNT_SCOPED_CACHE_METHODS:
+            return self.account_id
+
+    def proxy_batch(self, batch):
+        """
+        Proxy a JSON-RPC 2.0 batch, running its calls against the daemon concurrently.
+
+        Every call goes through the same `proxy` pipeline in its own `API` instance.
+        Augmented responses are returned in the order of `batch`, with a JSON-RPC error object
+        in place of every call that has failed.
+        """
+        max_workers = min(len(batch), settings.LBRY_PROXY_BATCH_WORKERS)
+        if max_workers <= 1:
+            return [self._proxy_batch_item(request, close_connections=False) for request in batch]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Have calls traced as part of the current request
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._proxy_batch_item, request)
+                for request in batch
+            ]
+            return [future.result() for future in futures]
+
+    def _proxy_batch_item(self, request, close_connections=True):
+        if not self._is_valid_batch_item(request):
+            return self._error_response(request, INVALID_REQUEST, 'Invalid Request')
+        try:
+            augmented_response, _ = type(self)(account_id=self.account_id).proxy(request)
+            return augmented_response
+        except Exception as exc:
+            return self._batch_item_error_response(request, exc)
+        finally:
+            if close_connections:
+                # Worker threads are discarded after the batch, don't leave their DB connections behind
+                connections.close_all()
+
+    def _is_valid_batch_item(self, request):
+        return isinstance(request, dict) and 'method' in request
+
+    def _batch_item_error_response(self, request, exc):
+        if isinstance(exc, exceptions.DaemonException):
+            logger.error('Exception while proxying batched request (%s): %s', request, exc)
+            return self._error_response(request, SERVER_ERROR, str(exc))
+        logger.exception('Exception while proxying batched request (%s): %s', request, exc)
+        return self._error_response(request, INTERNAL_ERROR, f'Proxy exception: {exc}')
+
+    def _error_response(self, request, code, message):
+        request_id = request.get('id') if isinstance(request, dict) else None
+        return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
 
     ### Requests
 
@@ -141,8 +408,7 @@ class API:
 
     def _attach_account_id(self, request):
         self.validate_account()
-        request.setdefault('params', {})['account_id'] = self.account_id
-        return request
+        return {**request, 'params': {**request.get('params', {}), 'account_id': self.account_id}}
 
     ### Responses
 
@@ -160,8 +426,7 @@ class API:
             f'{self.account_id}/'
             f'{request["params"]["uri"]}'
         )
-        response['result']['download_path'] = download_url
-        return response
+        return {**response, 'result': {**response['result'], 'download_path': download_url}}
 
     def _augment_file_list_response(self, response, request):
         """
@@ -169,17 +434,141 @@ class API:
         at which this content will be served to web client.
         """
         self.validate_account()
-        for file_index, file_item in enumerate(response['result']):
-            download_url = (
-                f'{settings.LBRY_CONTENT_URL}'
-                f'{self.account_id}/outpoints/'
-                f'{file_item["outpoint"]}/{file_item["file_name"]}'
-            )
-            response['result'][file_index]['download_path'] = download_url
-        return response
+        return {**response, 'result': [self._augment_file_list_item(file_item) for file_item in response['result']]}
+
+    ### Response items, for streamed responses
+
+    def _augment_any_item(self, item):
+        return item
+
+    def _augment_file_list_item(self, file_item):
+        self.validate_account()
+        download_url = (
+            f'{settings.LBRY_CONTENT_URL}'
+            f'{self.account_id}/outpoints/'
+            f'{file_item["outpoint"]}/{file_item["file_name"]}'
+        )
+        return {**file_item, 'download_path': download_url}
 
     def _post_get_response(self, request, augmented_request, response, **kwargs):
         self.validate_account()
         signals.download_started.send(
             sender=self, account_id=self.account_id, file_name=response['result']['file_name'],
             lbrynet_data=response['result'], uri=request["params"]["uri"])
+
+
+class AsyncAPI(API):
+    """
+    Asynchronous version of `API` that doesn't block a thread while waiting for the daemon.
+
+    Only the parts awaiting the daemon are its own, request and response handling is shared with `API`.
+    Profiling, post handlers (with signals they send) and response cache access may touch the database
+    or the network, so they are run in threads.
+    """
+
+    @property
+    def transport(self):
+        return get_async_transport(self.url)
+
+    async def _post(self, method, payload):
+        if get_router().is_sharded:
+            # Account's daemon may have to be looked up in the database
+            url = await sync_to_async(self.route)(method, payload.get('params'))
+        else:
+            url = self.route(method, payload.get('params'))
+        read_timeout = settings.LBRY_DAEMON_METHOD_TIMEOUTS.get(method)
+        try:
+            with tracing.span('daemon', method=method, url=url) as span:
+                response = await get_async_transport(url).post(payload, read_timeout=read_timeout)
+                span.set(status=response.status_code)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            await sync_to_async(self._daemon_failed)(url, method)
+            raise exceptions.DaemonConnectionError(exc)
+        except exceptions.DaemonUnavailable:
+            await sync_to_async(self._daemon_failed)(url, method)
+            raise
+        get_router().mark_succeeded(url)
+        return response
+
+    async def call(self, method, get_result=True, **kwargs):
+        logger.debug('Sending request to lbrynet: %s(%s)', method, kwargs)
+        await sync_to_async(self.profiler.start)(method)
+        response = await self._post(method, {'method': method, 'params': kwargs})
+        response_data = await sync_to_async(self._read_call_response)(method, response)
+        await sync_to_async(self.profiler.end)(method)
+        return response_data['result'] if get_result else response_data
+
+    async def publish(self, file_path, client_payload):
+        client_payload['params']['file_path'] = file_path
+        return await self.call(
+            'publish', get_result=False, account_id=self.account_id, **client_payload['params'])
+
+    async def proxy(self, request):
+        method = request['method']
+        with tracing.span('proxy', method=method):
+            timer = await sync_to_async(self.profiler.start)(method)
+            with tracing.span('augment_request'):
+                augmented_request = self._augment_request(request)
+            response_data = await self._fetch(method, augmented_request)
+            with tracing.span('augment_response'):
+                augmented_response = self._augment_response(request, response_data)
+            if self._get_post_handler(method):
+                await sync_to_async(self._run_post_handler)(
+                    request, augmented_request, response_data, augmented_response)
+            await sync_to_async(self.profiler.end)(timer)
+        logger.debug(
+            'Returning augmented for proxied request: %s', augmented_response)
+        return augmented_response, response_data
+
+    async def _fetch(self, method, augmented_request):
+        cache = self._get_response_cache(method)
+        response_data = None
+        if cache is not None:
+            cache_key, response_data = await sync_to_async(self._get_cached)(cache, method, augmented_request)
+        if response_data is None:
+            response_data = await self._send_coalesced(method, augmented_request)
+            if cache is not None:
+                await sync_to_async(cache.set)(cache_key, method, response_data)
+        return response_data
+
+    async def _send_coalesced(self, method, augmented_request):
+        if method not in settings.LBRY_DAEMON_COALESCED_METHODS:
+            return await self._send(method, augmented_request)
+        sent = []
+
+        async def send():
+            sent.append(True)
+            return await self._send(method, augmented_request)
+
+        try:
+            response_data = await async_single_flight.do(
+                self._coalescing_key(method, augmented_request), send)
+        except exceptions.DaemonException:
+            if not sent:
+                await sync_to_async(self.profiler.error)(method)
+            raise
+        if not sent:
+            response_data = self._share_response(response_data, augmented_request)
+        return response_data
+
+    async def _send(self, method, payload):
+        response = await self._post(method, payload)
+        return await sync_to_async(self._read_proxied_response)(method, response)
+
+    async def proxy_batch(self, batch):
+        semaphore = asyncio.Semaphore(settings.LBRY_PROXY_BATCH_WORKERS)
+
+        async def proxy_item(request):
+            async with semaphore:
+                return await self._proxy_batch_item(request)
+
+        return await asyncio.gather(*[proxy_item(request) for request in batch])
+
+    async def _proxy_batch_item(self, request):
+        if not self._is_valid_batch_item(request):
+            return self._error_response(request, INVALID_REQUEST, 'Invalid Request')
+        try:
+            augmented_response, _ = await type(self)(account_id=self.account_id).proxy(request)
+            return augmented_response
+        except Exception as exc:
+            return self._batch_item_error_response(request, exc)
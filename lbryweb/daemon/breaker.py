@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """
+    Stop sending calls to a daemon that keeps failing and let them fail fast instead.
+
+    The breaker opens after `failure_threshold` consecutive failures. After `reset_timeout` seconds
+    it lets a single probe call through (half open): the breaker closes if it succeeds
+    and opens again for another `reset_timeout` if it fails. Zero `failure_threshold` disables it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'<CircuitBreaker {self.name} ({self.state})>'
+
+    def allow(self):
+        """
+        Return whether a call can be made now. Every allowed call must be followed by `record_success`
+        or `record_failure`.
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (
+                    self.state == CLOSED and self.failure_threshold and self.failures >= self.failure_threshold):
+                self._transition(OPEN)
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """
+        Forget an allowed call that has ended without telling anything about the daemon.
+        """
+        with self._lock:
+            self._probing = False
+
+    def _transition(self, state):
+        log = logger.info if state == CLOSED else logger.warning
+        log('Circuit breaker for %s: %s -> %s (%s consecutive failures)', self.name, self.state, state, self.failures)
+        self.state = state
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
+
+
+def get_breaker(url):
+    """
+    Return the process-wide breaker for daemon `url`, shared by its sync and async transports.
+    """
+    breaker = _breakers.get(url)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(url, CircuitBreaker(
+                url,
+                failure_threshold=settings.LBRY_DAEMON_BREAKER_FAILURES,
+                reset_timeout=settings.LBRY_DAEMON_BREAKER_RESET_TIMEOUT,
+            ))
+    return breaker
+
+
+def reset():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+@receiver(setting_changed)
+def reset_on_setting_changed(setting, **kwargs):
+    if setting.startswith('LBRY_DAEMON_BREAKER_'):
+        reset()
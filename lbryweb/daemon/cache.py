@@ -0,0 +1,173 @@
+import json
+import time
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+
+def canonicalize(params):
+    """
+    Serialize request params so that logically equal requests produce equal strings.
+    """
+    return json.dumps(params or {}, sort_keys=True, separators=(',', ':'))
+
+
+def fingerprint(method, params):
+    return f'{method}:' + hashlib.sha1(canonicalize(params).encode('utf-8')).hexdigest()
+
+
+class LocMemBackend:
+    """
+    In-process LRU storage for serialized responses bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return None
+            if expires is not None and expires < time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if len(value) > self.max_bytes:
+            return
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (expires, value)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        _, value = self._data.pop(key)
+        self.size -= len(value)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._data), 'bytes': self.size, 'evictions': self.evictions}
+
+
+class DjangoCacheBackend:
+    """
+    Storage in one of Django's configured caches so that several worker processes can share it.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.cache.set(key, value, ttl)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return {}
+
+
+class ResponseCache:
+    """
+    Read-through cache of raw daemon responses.
+
+    Entries of account-specific methods are keyed on the account. Nothing drops them when the account changes,
+    they are only fresh for as long as their TTL.
+    """
+    prefix = 'lbryweb:daemon'
+
+    def __init__(self, backend, ttls):
+        self.backend = backend
+        self.ttls = ttls
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, method):
+        return method in self.ttls
+
+    def key(self, method, params, account_id=None):
+        return f'{self.prefix}:{account_id or "-"}:{fingerprint(method, params)}'
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is not None:
+            return json.loads(value)
+
+    def set(self, key, method, response):
+        self.backend.set(key, json.dumps(response), self.ttls[method])
+
+    def stats(self):
+        with self._lock:
+            stats = {'hits': self.hits, 'misses': self.misses}
+        stats.update(self.backend.stats())
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the process-wide response cache configured by settings or None if caching is disabled.
+    """
+    global _cache
+    if not settings.LBRY_DAEMON_CACHE_BACKEND:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if settings.LBRY_DAEMON_CACHE_BACKEND == 'django':
+                    backend = DjangoCacheBackend(settings.LBRY_DAEMON_CACHE_ALIAS)
+                else:
+                    backend = LocMemBackend(settings.LBRY_DAEMON_CACHE_MAX_BYTES)
+                _cache = ResponseCache(backend, ttls=settings.LBRY_DAEMON_CACHE_TTLS)
+    return _cache
+
+
+def reset():
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+@receiver(setting_changed)
+def reset_on_setting_changed(setting, **kwargs):
+    if setting.startswith('LBRY_DAEMON_CACHE_'):
+        reset()
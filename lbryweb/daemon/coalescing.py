@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        # Not set when the caller running it has been interrupted by a BaseException
+        self.completed = False
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls so that only one of them does the actual work.
+
+    The first caller with a given key runs the function, callers arriving with the same key while it's
+    running wait for it and receive the same result or have the same exception raised.
+    Callers must treat shared results as read-only.
+
+    If the caller running the function is interrupted by anything other than an `Exception` (like a gevent
+    timeout or `KeyboardInterrupt`), one of the callers waiting for it runs it again.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.deduplicated = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = Call()
+                    self.calls += 1
+                    break
+                self.deduplicated += 1
+            logger.debug('Waiting for in-flight call %s', key)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if call.completed:
+                return call.result
+            # The caller running it was interrupted, make the call again
+
+        try:
+            call.result = function()
+            call.completed = True
+        except Exception as exc:
+            call.error = exc
+            call.completed = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'deduplicated': self.deduplicated, 'in_flight': len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    `SingleFlight` for coroutines running in one event loop.
+
+    If the caller running the function is cancelled, one of the callers waiting for it runs it again.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.deduplicated = 0
+        self._calls = {}
+
+    async def do(self, key, coroutine_function):
+        future = self._calls.get(key)
+        while future is not None:
+            self.deduplicated += 1
+            logger.debug('Waiting for in-flight call %s', key)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # The call was cancelled along with its caller, make it again
+            future = self._calls.get(key)
+
+        future = self._calls[key] = asyncio.get_event_loop().create_future()
+        self.calls += 1
+        try:
+            result = await coroutine_function()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+            if not future.done():
+                # Don't leave waiters hanging when cancelled (e.g. the client has gone)
+                future.cancel()
+
+    def stats(self):
+        return {'calls': self.calls, 'deduplicated': self.deduplicated, 'in_flight': len(self._calls)}
+
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
@@ -10,3 +10,13 @@ class AccountNotFound(DaemonException):
 
 class AccountMissing(DaemonException):
     pass
+
+
+class DaemonConnectionError(DaemonException):
+    pass
+
+
+class DaemonUnavailable(DaemonException):
+    """
+    Raised without contacting the daemon while its circuit breaker is open.
+    """
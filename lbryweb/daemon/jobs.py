@@ -0,0 +1,91 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import tracing
+from .api import API
+from .models import ProxyJob
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.LBRY_JOB_WORKERS, thread_name_prefix='proxy-job')
+    return _executor
+
+
+def submit(account_id, request):
+    """
+    Create a job for proxying `request` on behalf of `account_id` and have it run by the local worker pool.
+    """
+    job = ProxyJob.objects.create(
+        account_id=account_id, request=request,
+        expires=timezone.now() + timedelta(seconds=settings.LBRY_JOB_TTL))
+    # Workers use their own database connections and wouldn't see the job before the commit
+    transaction.on_commit(lambda: get_executor().submit(run_job_in_worker, job.pk))
+    logger.debug('Submitted job %s', job)
+    return job
+
+
+def fail_lost_jobs(queryset=None):
+    """
+    Mark jobs that have been pending or running for over `LBRY_JOB_TIMEOUT` seconds as failed, out of `queryset`
+    or all of them, and return how many there were.
+
+    Jobs are only queued in memory of the worker process that took them, they are lost when it restarts or dies.
+    """
+    now = timezone.now()
+    if queryset is None:
+        queryset = ProxyJob.objects.all()
+    lost = queryset.filter(
+        status__in=[ProxyJob.PENDING, ProxyJob.RUNNING],
+        created__lt=now - timedelta(seconds=settings.LBRY_JOB_TIMEOUT))
+    failed = lost.update(status=ProxyJob.FAILED, error='Job has not finished in time', finished=now)
+    if failed:
+        logger.warning('Marked %s lost jobs as failed', failed)
+    return failed
+
+
+def run_job_in_worker(job_id):
+    try:
+        run_job(job_id)
+    except Exception as exc:
+        logger.exception('Exception while running job %s: %s', job_id, exc)
+    finally:
+        connections.close_all()
+
+
+def run_job(job_id):
+    """
+    Proxy the request of a pending job and store its augmented response or error.
+
+    Returns the job or None if it doesn't exist or has been picked up already.
+    """
+    if not ProxyJob.objects.filter(pk=job_id, status=ProxyJob.PENDING).update(status=ProxyJob.RUNNING):
+        return None
+    job = ProxyJob.objects.get(pk=job_id)
+    try:
+        with tracing.span('job', job_id=str(job_id)):
+            job.response, _ = API(account_id=job.account_id).proxy(job.request)
+        job.status = ProxyJob.DONE
+    except Exception as exc:
+        logger.error('Exception while proxying request of job %s: %s', job, exc)
+        job.error = str(exc)
+        job.status = ProxyJob.FAILED
+    job.finished = timezone.now()
+    job.save(update_fields=['response', 'status', 'error', 'finished'])
+    return job
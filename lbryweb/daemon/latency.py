@@ -0,0 +1,48 @@
+from django.db.models import Aggregate, Count, FloatField, Q
+from django.db.models.functions import Trunc
+
+from .models import Operation
+
+
+class Percentile(Aggregate):
+    """
+    Continuous percentile of an expression, interpolated by the database (PostgreSQL `percentile_cont`).
+    """
+    function = 'PERCENTILE_CONT'
+    name = 'Percentile'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def get_latency(since, until, methods=None, by=None):
+    """
+    Return latency statistics of operations started in [since, until) by operation name,
+    and by `by` ('minute', 'hour' or 'day') period if given.
+
+    Every row has `name`, `calls`, `errors`, `throughput` (calls per second), `error_rate`,
+    `p50`, `p90` and `p99` keys, and `period` with `by`.
+    """
+    operations = Operation.objects.filter(started__gte=since, started__lt=until, duration__isnull=False)
+    if methods:
+        operations = operations.filter(name__in=methods)
+    fields = ['name']
+    if by:
+        operations = operations.annotate(period=Trunc('started', by))
+        fields.append('period')
+    rows = list(operations.values(*fields).annotate(
+        calls=Count('id'),
+        errors=Count('id', filter=Q(errored=True)),
+        p50=Percentile('duration', 0.5),
+        p90=Percentile('duration', 0.9),
+        p99=Percentile('duration', 0.99),
+    ).order_by(*fields))
+    seconds = {
+        'minute': 60, 'hour': 3600, 'day': 86400,
+    }.get(by, (until - since).total_seconds())
+    for row in rows:
+        row['throughput'] = row['calls'] / seconds
+        row['error_rate'] = row['errors'] / row['calls']
+    return rows
@@ -0,0 +1,112 @@
+import json
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from daemon.latency import get_latency
+
+
+DURATION_RE = re.compile(r'^(\d+)([smhd])$')
+DURATION_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+# Column title, row key and format of every column of the table
+COLUMNS = [
+    ('calls', 'calls', '{:d}'),
+    ('calls/s', 'throughput', '{:.2f}'),
+    ('errors %', 'error_rate', '{:.2%}'),
+    ('p50 ms', 'p50', '{:.1f}'),
+    ('p90 ms', 'p90', '{:.1f}'),
+    ('p99 ms', 'p99', '{:.1f}'),
+]
+MILLISECOND_KEYS = {'p50', 'p90', 'p99'}
+
+
+def parse_duration(value):
+    match = DURATION_RE.match(value)
+    if not match:
+        raise CommandError(f'Invalid duration {value!r}, use a number followed by s, m, h or d, like 15m')
+    return timedelta(**{DURATION_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def parse_time(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise CommandError(f'Invalid date and time {value!r}, use ISO 8601 format like 2019-03-01T12:00')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Report latency percentiles, throughput and error rate of daemon calls by method over a time window, '
+        'optionally compared with another window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', default='1h', help='Length of the window, like 30m, 1h or 7d')
+        parser.add_argument('--until', help='End of the window in ISO 8601 format, now by default')
+        parser.add_argument(
+            '--compare', nargs='?', const='', metavar='UNTIL',
+            help='Compare with the window of the same length ending at UNTIL, the preceding one by default')
+        parser.add_argument('--method', action='append', help='Only report on this method, can be repeated')
+        parser.add_argument(
+            '--by', choices=['minute', 'hour', 'day'], help='Break the window down into periods')
+        parser.add_argument('--format', choices=['table', 'json'], default='table')
+
+    def handle(self, *args, **options):
+        window = parse_duration(options['window'])
+        until = parse_time(options['until']) if options['until'] else timezone.now()
+        if options['compare'] is not None and options['by']:
+            raise CommandError('Windows broken down into periods cannot be compared')
+        report = self.get_report(until - window, until, options)
+        if options['compare'] is not None:
+            baseline_until = parse_time(options['compare']) if options['compare'] else until - window
+            report['baseline'] = self.get_report(baseline_until - window, baseline_until, options)
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(report, cls=DjangoJSONEncoder, indent=2))
+        else:
+            self.write_table(report, options['by'])
+
+    def get_report(self, since, until, options):
+        return {
+            'since': since,
+            'until': until,
+            'methods': get_latency(since, until, methods=options['method'], by=options['by']),
+        }
+
+    def write_table(self, report, by):
+        baseline = report.get('baseline')
+        title = f'{report["since"]:%Y-%m-%d %H:%M:%S} - {report["until"]:%Y-%m-%d %H:%M:%S}'
+        if baseline:
+            title += f' vs {baseline["since"]:%Y-%m-%d %H:%M:%S} - {baseline["until"]:%Y-%m-%d %H:%M:%S}'
+        self.stdout.write(title)
+        baseline_rows = {row['name']: row for row in baseline['methods']} if baseline else {}
+        header = ['method'] + (['period'] if by else []) + [column_title for column_title, _, _ in COLUMNS]
+        table = [header]
+        for row in report['methods']:
+            line = [row['name']] + ([f'{row["period"]:%Y-%m-%d %H:%M}'] if by else [])
+            for _, key, value_format in COLUMNS:
+                cell = value_format.format(self.get_value(row, key))
+                if baseline:
+                    cell += f' ({self.get_change(row, baseline_rows.get(row["name"]), key)})'
+                line.append(cell)
+            table.append(line)
+        widths = [max(len(line[column]) for line in table) for column in range(len(header))]
+        for line in table:
+            self.stdout.write('  '.join(
+                cell.ljust(width) if column == 0 else cell.rjust(width)
+                for column, (cell, width) in enumerate(zip(line, widths))).rstrip())
+
+    def get_value(self, row, key):
+        return row[key] * 1000 if key in MILLISECOND_KEYS else row[key]
+
+    def get_change(self, row, baseline_row, key):
+        if baseline_row is None:
+            return 'new'
+        if not baseline_row[key]:
+            return '=' if not row[key] else 'n/a'
+        return f'{(row[key] - baseline_row[key]) / baseline_row[key]:+.0%}'
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from daemon import jobs
+from daemon.models import ProxyJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete background proxy jobs that have expired and mark the ones that have been lost as failed, '
+        'run it periodically.'
+    )
+
+    def handle(self, *args, **options):
+        failed = jobs.fail_lost_jobs()
+        self.stdout.write(f'{failed} lost jobs failed')
+        deleted, _ = ProxyJob.objects.filter(expires__lte=timezone.now()).delete()
+        self.stdout.write(f'{deleted} expired jobs deleted')
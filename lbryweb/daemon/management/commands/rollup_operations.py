@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from daemon import rollup
+
+
+class Command(BaseCommand):
+    help = (
+        'Aggregate profiled operations into per-minute and per-hour rollups and delete the ones '
+        'past their retention, run it periodically.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.LBRY_OPERATION_ROLLUP_BATCH_SIZE,
+            help='Operations rolled up or deleted at a time')
+        parser.add_argument(
+            '--pause', type=float, default=0.1, help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        rolled_up = rollup.roll_up(
+            now - timedelta(seconds=settings.LBRY_PROFILER_FLUSH_INTERVAL + settings.LBRY_OPERATION_ROLLUP_MARGIN),
+            options['batch_size'], options['pause'])
+        self.stdout.write(f'{rolled_up} operations rolled up')
+        deleted_operations, deleted_rollups = rollup.prune(
+            now - timedelta(days=settings.LBRY_OPERATION_RETENTION),
+            now - timedelta(days=settings.LBRY_OPERATION_MINUTE_ROLLUP_RETENTION),
+            options['batch_size'], options['pause'])
+        self.stdout.write(f'{deleted_operations} operations and {deleted_rollups} minute rollups deleted')
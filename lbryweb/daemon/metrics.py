@@ -0,0 +1,253 @@
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .threads import ProcessThread
+
+
+logger = logging.getLogger(__name__)
+
+# Methods beyond LBRY_METRICS_MAX_METHODS, clients can send any method name
+OTHER_METHOD = '_other'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class MethodMetrics:
+
+    __slots__ = ('buckets', 'sum', 'count', 'errors', 'in_flight')
+
+    def __init__(self, bucket_count):
+        # Calls falling into each bucket, the last one is +Inf
+        self.buckets = [0] * (bucket_count + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class DaemonMetrics:
+    """
+    Latency histograms, error counts and in-flight gauges of daemon calls by method.
+
+    Memory is bounded: every method has a fixed number of counters and at most `max_methods` methods
+    are tracked, the rest are counted together as `_other`.
+
+    With `directory` set, every process writes its metrics to a file there each `write_interval` seconds
+    so that `collect` can add up metrics of all processes of the host, counters of processes that have
+    exited included. In-flight gauges are only taken from processes that are still running.
+    """
+
+    def __init__(self, buckets, max_methods=100, directory='', write_interval=5):
+        self.bucket_bounds = sorted(buckets)
+        self.max_methods = max_methods
+        self.directory = directory
+        self.write_interval = write_interval
+        self._methods = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._writer = ProcessThread(self._run, name='metrics-writer')
+        self._writes_at_exit = False
+
+    def _get(self, method):
+        metrics = self._methods.get(method)
+        if metrics is None:
+            if len(self._methods) >= self.max_methods:
+                method = OTHER_METHOD
+                metrics = self._methods.get(method)
+            if metrics is None:
+                metrics = self._methods[method] = MethodMetrics(len(self.bucket_bounds))
+        return metrics
+
+    def call_started(self, method):
+        with self._lock:
+            self._get(method).in_flight += 1
+        self._touch()
+
+    def call_abandoned(self, method):
+        """
+        Forget a started call that won't be reported as finished.
+        """
+        with self._lock:
+            self._get(method).in_flight -= 1
+        self._touch()
+
+    def call_finished(self, method, duration, errored=False):
+        with self._lock:
+            metrics = self._get(method)
+            metrics.in_flight -= 1
+            metrics.buckets[bisect.bisect_left(self.bucket_bounds, duration)] += 1
+            metrics.sum += duration
+            metrics.count += 1
+            if errored:
+                metrics.errors += 1
+        self._touch()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'bucket_bounds': self.bucket_bounds,
+                'methods': {method: metrics.to_dict() for method, metrics in self._methods.items()},
+            }
+
+    def _touch(self):
+        if self.directory:
+            self._changed.set()
+            self._ensure_writer()
+
+    def _ensure_writer(self):
+        if self._writer.ensure_started() and not self._writes_at_exit:
+            self._writes_at_exit = True
+            atexit.register(self.write)
+
+    def _run(self):
+        while True:
+            time.sleep(self.write_interval)
+            if self._changed.is_set():
+                self._changed.clear()
+                try:
+                    self.write()
+                except OSError as exc:
+                    logger.error('Could not write metrics to %s: %s', self.directory, exc)
+
+    def write(self):
+        """
+        Write metrics of this process to its file in `directory`, replacing the previous one atomically.
+        """
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f'{path}.tmp', 'w') as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(f'{path}.tmp', path)
+
+    def read_snapshots(self):
+        """
+        Return snapshots written by other processes along with the live one of this process.
+        """
+        snapshots = [self.snapshot()]
+        if not self.directory:
+            return snapshots
+        own_path = os.path.join(self.directory, f'{os.getpid()}.json')
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            if path == own_path:
+                continue
+            try:
+                with open(path) as snapshot_file:
+                    snapshot = json.load(snapshot_file)
+            except (OSError, ValueError) as exc:
+                logger.warning('Skipping unreadable metrics file %s: %s', path, exc)
+                continue
+            if snapshot.get('bucket_bounds') != self.bucket_bounds:
+                # Written before buckets were reconfigured, can't be added up
+                continue
+            snapshot['alive'] = is_alive(snapshot['pid'])
+            snapshots.append(snapshot)
+        return snapshots
+
+    def collect(self):
+        """
+        Return metrics added up across processes as a dict of method names to `MethodMetrics`.
+        """
+        totals = {}
+        for snapshot in self.read_snapshots():
+            for method, values in snapshot['methods'].items():
+                total = totals.get(method)
+                if total is None:
+                    total = totals[method] = MethodMetrics(len(self.bucket_bounds))
+                total.buckets = [count + added for count, added in zip(total.buckets, values['buckets'])]
+                total.sum += values['sum']
+                total.count += values['count']
+                total.errors += values['errors']
+                if snapshot.get('alive', True):
+                    total.in_flight += values['in_flight']
+        return totals
+
+    def render(self):
+        """
+        Return metrics in Prometheus text exposition format.
+        """
+        totals = [(escape_label(method), metrics) for method, metrics in sorted(self.collect().items())]
+        lines = [
+            '# HELP lbryweb_daemon_call_duration_seconds Duration of daemon calls.',
+            '# TYPE lbryweb_daemon_call_duration_seconds histogram',
+        ]
+        for method, metrics in totals:
+            cumulative = 0
+            for bound, count in zip(self.bucket_bounds + ['+Inf'], metrics.buckets):
+                cumulative += count
+                lines.append(
+                    f'lbryweb_daemon_call_duration_seconds_bucket{{method="{method}",le="{bound}"}} {cumulative}')
+            lines.append(f'lbryweb_daemon_call_duration_seconds_sum{{method="{method}"}} {metrics.sum}')
+            lines.append(f'lbryweb_daemon_call_duration_seconds_count{{method="{method}"}} {metrics.count}')
+        lines += [
+            '# HELP lbryweb_daemon_call_errors_total Daemon calls that have failed.',
+            '# TYPE lbryweb_daemon_call_errors_total counter',
+        ]
+        lines += [
+            f'lbryweb_daemon_call_errors_total{{method="{method}"}} {metrics.errors}' for method, metrics in totals]
+        lines += [
+            '# HELP lbryweb_daemon_calls_in_flight Daemon calls waiting for a response.',
+            '# TYPE lbryweb_daemon_calls_in_flight gauge',
+        ]
+        lines += [
+            f'lbryweb_daemon_calls_in_flight{{method="{method}"}} {metrics.in_flight}' for method, metrics in totals]
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists but belongs to someone else
+        return True
+    return True
+
+
+def get_metrics():
+    """
+    Return the process-wide daemon call metrics configured by settings.
+    """
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = DaemonMetrics(
+                    settings.LBRY_METRICS_BUCKETS,
+                    max_methods=settings.LBRY_METRICS_MAX_METHODS,
+                    directory=settings.LBRY_METRICS_DIR,
+                    write_interval=settings.LBRY_METRICS_WRITE_INTERVAL,
+                )
+    return _metrics
+
+
+def reset():
+    global _metrics
+    with _metrics_lock:
+        _metrics = None
+
+
+@receiver(setting_changed)
+def reset_on_setting_changed(setting, **kwargs):
+    if setting.startswith('LBRY_METRICS_'):
+        reset()
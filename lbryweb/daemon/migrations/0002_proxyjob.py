@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:15
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('daemon', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProxyJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('account_id', models.CharField(db_index=True, max_length=150)),
+                ('request', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('response', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
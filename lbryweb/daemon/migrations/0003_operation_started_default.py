@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:16
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('daemon', '0002_proxyjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='operation',
+            name='started',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
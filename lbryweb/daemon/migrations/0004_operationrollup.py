@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:20
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('daemon', '0003_operation_started_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperationRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('period', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('duration_sum', models.FloatField()),
+                ('duration_min', models.FloatField()),
+                ('duration_max', models.FloatField()),
+                ('p50', models.FloatField()),
+                ('p90', models.FloatField()),
+                ('p99', models.FloatField()),
+                ('histogram', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OperationRollupCursor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_operation_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='operationrollup',
+            index=models.Index(fields=['period', 'bucket'], name='daemon_oper_period_35bd72_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='operationrollup',
+            unique_together={('period', 'name', 'bucket')},
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:25
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Don't block profiled operations from being saved while the index is built
+    atomic = False
+
+    dependencies = [
+        ('daemon', '0004_operationrollup'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='operation',
+            index=models.Index(fields=['started'], name='daemon_oper_started_e44893_idx'),
+        ),
+    ]
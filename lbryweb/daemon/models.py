@@ -1,17 +1,106 @@
+import uuid
+
 from django.db import models
 from django.contrib.postgres.fields import JSONField
+from django.utils import timezone
 
 
 class Operation(models.Model):
-    started = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(default=timezone.now)
     ended = models.DateTimeField(blank=True, null=True)
     duration = models.FloatField(blank=True, null=True)
     name = models.CharField(max_length=200)
     errored = models.BooleanField(default=False)
     meta = JSONField(blank=True, null=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['started'])]
+
     def __str__(self):
         if self.duration is not None:
             return f'[{self.name}] {self.duration:.4f} secs'
         else:
             return f'[{self.name}] {self.started} - ...'
+
+
+class OperationRollup(models.Model):
+    """
+    Timings of operations of the same name aggregated over a minute or an hour.
+
+    `histogram` maps indexes of logarithmic duration buckets (see `daemon.rollup`) to counts,
+    so that rollups can be merged and their percentiles estimated.
+    """
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    PERIOD_CHOICES = (
+        (MINUTE, 'Minute'),
+        (HOUR, 'Hour'),
+    )
+
+    name = models.CharField(max_length=200)
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    errors = models.PositiveIntegerField(default=0)
+    duration_sum = models.FloatField()
+    duration_min = models.FloatField()
+    duration_max = models.FloatField()
+    p50 = models.FloatField()
+    p90 = models.FloatField()
+    p99 = models.FloatField()
+    histogram = JSONField(default=dict)
+
+    class Meta:
+        unique_together = ('period', 'name', 'bucket')
+        indexes = [models.Index(fields=['period', 'bucket'])]
+
+    def __str__(self):
+        return f'[{self.name}] {self.period} {self.bucket}: {self.count} ops, p50 {self.p50:.4f} secs'
+
+    @property
+    def duration_mean(self):
+        return self.duration_sum / self.count
+
+
+class OperationRollupCursor(models.Model):
+    """
+    Position of rollups in the Operation table: operations up to `last_operation_id` are rolled up.
+    """
+    last_operation_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Operations rolled up to #{self.last_operation_id}'
+
+
+class ProxyJob(models.Model):
+    """
+    Proxied daemon call run in the background, polled by the web client for its outcome.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account_id = models.CharField(max_length=150, db_index=True)
+    request = JSONField()
+    response = JSONField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(blank=True, null=True)
+    expires = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'[{self.request.get("method")}] {self.id} ({self.status})'
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
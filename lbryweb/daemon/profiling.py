@@ -1,38 +1,193 @@
+import atexit
+import collections
 import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
 from django.utils import timezone
 
+from . import tracing
+from .metrics import get_metrics
 from .models import Operation
+from .threads import ProcessThread
+
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+class OperationBuffer:
+    """
+    Collect finished operations in memory and save them in bulk from a background thread.
+
+    Operations are flushed once `flush_size` of them have been collected or every `flush_interval` seconds,
+    whichever comes first, and at interpreter exit. When the database can't keep up and `max_size` operations
+    are waiting, the oldest ones are dropped.
+    """
+
+    def __init__(self, max_size=10000, flush_size=500, flush_interval=5, background=True):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.background = background
+        self.flushed = 0
+        self.dropped = 0
+        self._operations = collections.deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = ProcessThread(self._run, name='profiler-flush')
+
+    def add(self, operation):
+        if not self.background:
+            operation.save()
+            return
+        with self._lock:
+            if len(self._operations) >= self.max_size:
+                self._operations.popleft()
+                self.dropped += 1
+            self._operations.append(operation)
+            should_flush = len(self._operations) >= self.flush_size
+        self._ensure_flusher()
+        if should_flush:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Save all collected operations, return how many have been saved.
+        """
+        with self._flush_lock:
+            with self._lock:
+                operations = list(self._operations)
+                self._operations.clear()
+            if not operations:
+                return 0
+            try:
+                Operation.objects.bulk_create(operations)
+            except Exception as exc:
+                logger.error('Dropping %s operations that could not be saved: %s', len(operations), exc)
+                with self._lock:
+                    self.dropped += len(operations)
+                return 0
+            with self._lock:
+                self.flushed += len(operations)
+            return len(operations)
+
+    def _ensure_flusher(self):
+        self._flusher.ensure_started()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # Don't keep a connection open between flushes
+                connection.close()
+
+    def stats(self):
+        with self._lock:
+            return {'buffered': len(self._operations), 'flushed': self.flushed, 'dropped': self.dropped}
+
+
+def get_buffer():
+    """
+    Return the process-wide buffer of finished operations configured by settings.
+    """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = OperationBuffer(
+                    max_size=settings.LBRY_PROFILER_BUFFER_SIZE,
+                    flush_size=settings.LBRY_PROFILER_FLUSH_SIZE,
+                    flush_interval=settings.LBRY_PROFILER_FLUSH_INTERVAL,
+                    background=settings.LBRY_PROFILER_FLUSH_IN_BACKGROUND,
+                )
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+class Timer:
+
+    __slots__ = ('name', 'started', 'started_monotonic', 'trace_id')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = timezone.now()
+        self.started_monotonic = time.monotonic()
+        span = tracing.get_current_span()
+        self.trace_id = span.trace_id if span else None
+
+    def __repr__(self):
+        return f'<Timer {self.name}>'
 
 
 class Profiler:
 
     def __init__(self):
-        self.timers = {}
+        # Started operations, the same operation can be in progress more than once
+        self.timers = []
         self.logger = logging.getLogger(__name__)
 
+    def __del__(self):
+        # Calls that raised before being reported as done or errored must not stay in flight forever
+        for timer in self.timers:
+            get_metrics().call_abandoned(timer.name)
+
     def start(self, operation_name):
-        self.timers[operation_name] = Operation.objects.create(name=operation_name)
-
-    def _close_op(self, operation_name, errored=False):
-        op_instance = self.timers[operation_name]
-        now = timezone.now()
-        op_instance.ended = now
-        op_instance.duration = (now - op_instance.started).total_seconds()
-        op_instance.errored = errored
-        op_instance.save()
-        del self.timers[operation_name]
-        return op_instance.duration
-
-    def end(self, operation_name):
+        """
+        Start timing an operation, return its handle.
+
+        `end` and `error` take either the handle or the operation name, which stands for
+        the operation of that name started last.
+        """
+        timer = Timer(operation_name)
+        self.timers.append(timer)
+        get_metrics().call_started(operation_name)
+        return timer
+
+    def _pop_timer(self, operation):
+        if isinstance(operation, Timer):
+            if operation in self.timers:
+                self.timers.remove(operation)
+                return operation
+        else:
+            for index in range(len(self.timers) - 1, -1, -1):
+                if self.timers[index].name == operation:
+                    return self.timers.pop(index)
+        raise KeyError(operation)
+
+    def _close_op(self, operation, errored=False):
+        timer = self._pop_timer(operation)
+        duration = time.monotonic() - timer.started_monotonic
+        get_metrics().call_finished(timer.name, duration, errored=errored)
+        get_buffer().add(Operation(
+            name=timer.name,
+            started=timer.started,
+            ended=timer.started + timedelta(seconds=duration),
+            duration=duration,
+            errored=errored,
+            meta={'trace_id': timer.trace_id} if timer.trace_id else None,
+        ))
+        return timer.name, duration
+
+    def end(self, operation):
         try:
-            duration = self._close_op(operation_name)
+            operation_name, duration = self._close_op(operation)
             self.logger.info('Operation %s done in %.2f secs', operation_name, duration)
         except KeyError:
-            self.logger.error('Operation %s was done but never was reported as started', operation_name)
+            self.logger.error('Operation %s was done but never was reported as started', operation)
 
-    def error(self, operation_name):
+    def error(self, operation):
         try:
-            duration = self._close_op(operation_name, errored=True)
+            operation_name, duration = self._close_op(operation, errored=True)
             self.logger.info('Operation %s errored in %.2f secs', operation_name, duration)
         except KeyError:
-            self.logger.error('Operation %s has errored but never reported as started', operation_name)
+            self.logger.error('Operation %s has errored but never reported as started', operation)
@@ -0,0 +1,208 @@
+import logging
+import math
+import time
+from datetime import timedelta
+from functools import reduce
+
+from django.db import models, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Trunc
+
+from .models import Operation, OperationRollup, OperationRollupCursor
+
+
+logger = logging.getLogger(__name__)
+
+# Durations are counted in logarithmic buckets, BUCKETS_PER_DOUBLING of them each time the duration doubles
+# from MIN_DURATION on. Percentiles estimated from them are off by 9% at most
+MIN_DURATION = 0.001
+BUCKETS_PER_DOUBLING = 4
+PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+
+class DurationBucket(models.Func):
+    """
+    Index of the logarithmic bucket of a duration, computed by the database.
+    """
+    template = (
+        f'FLOOR({BUCKETS_PER_DOUBLING} * LN(GREATEST(%(expressions)s, {MIN_DURATION}) / {MIN_DURATION}) / LN(2))')
+    output_field = models.IntegerField()
+
+
+def get_bucket_bounds(index):
+    low = MIN_DURATION * 2 ** (index / BUCKETS_PER_DOUBLING)
+    return low, low * 2 ** (1 / BUCKETS_PER_DOUBLING)
+
+
+def estimate_percentile(rollup, fraction):
+    """
+    Estimate a percentile of rolled up durations as the geometric middle of the bucket it falls into.
+    """
+    rank = fraction * rollup.count
+    seen = 0
+    for index in sorted(rollup.histogram, key=int):
+        seen += rollup.histogram[index]
+        if seen >= rank:
+            low, high = get_bucket_bounds(int(index))
+            return min(max(math.sqrt(low * high), rollup.duration_min), rollup.duration_max)
+    return rollup.duration_max
+
+
+def merge(rollup, other):
+    """
+    Add durations rolled up by `other` to `rollup`.
+    """
+    rollup.count += other.count
+    rollup.errors += other.errors
+    rollup.duration_sum += other.duration_sum
+    rollup.duration_min = min(rollup.duration_min, other.duration_min)
+    rollup.duration_max = max(rollup.duration_max, other.duration_max)
+    for index, count in other.histogram.items():
+        rollup.histogram[index] = rollup.histogram.get(index, 0) + count
+    return rollup
+
+
+def copy(rollup, period, bucket):
+    return OperationRollup(
+        name=rollup.name, period=period, bucket=bucket, count=rollup.count, errors=rollup.errors,
+        duration_sum=rollup.duration_sum, duration_min=rollup.duration_min, duration_max=rollup.duration_max,
+        histogram=dict(rollup.histogram))
+
+
+def save(period, rollups, replace=False):
+    """
+    Save rollups of a period keyed by their name and bucket, merging them into the saved ones
+    or replacing them when `replace` is set. Must be called in a transaction.
+    """
+    if not rollups:
+        return
+    saved = OperationRollup.objects.select_for_update().filter(
+        period=period,
+        name__in={name for name, _ in rollups},
+        bucket__in={bucket for _, bucket in rollups},
+    )
+    new_rollups = dict(rollups)
+    for saved_rollup in saved:
+        rollup = new_rollups.pop((saved_rollup.name, saved_rollup.bucket), None)
+        if rollup is None:
+            continue
+        if replace:
+            rollup.pk = saved_rollup.pk
+        else:
+            rollup = merge(saved_rollup, rollup)
+        set_percentiles(rollup)
+        rollup.save()
+    for rollup in new_rollups.values():
+        set_percentiles(rollup)
+    OperationRollup.objects.bulk_create(new_rollups.values())
+
+
+def set_percentiles(rollup):
+    for field, fraction in PERCENTILES.items():
+        setattr(rollup, field, estimate_percentile(rollup, fraction))
+
+
+def roll_up_minutes(after_id, last_id):
+    """
+    Add operations with ids in (after_id, last_id] to minute rollups.
+
+    Returns the number of rolled up operations and the hours they fall into.
+    """
+    rows = Operation.objects.filter(id__gt=after_id, id__lte=last_id, duration__isnull=False).annotate(
+        bucket=Trunc('started', 'minute'),
+        duration_bucket=DurationBucket('duration'),
+    ).values('name', 'bucket', 'duration_bucket').annotate(
+        count=Count('id'),
+        errors=Count('id', filter=Q(errored=True)),
+        duration_sum=Sum('duration'),
+        duration_min=Min('duration'),
+        duration_max=Max('duration'),
+    ).order_by()
+    rollups = {}
+    for row in rows:
+        duration_bucket = str(row.pop('duration_bucket'))
+        rollup = OperationRollup(period=OperationRollup.MINUTE, histogram={duration_bucket: row['count']}, **row)
+        key = (rollup.name, rollup.bucket)
+        rollups[key] = merge(rollups[key], rollup) if key in rollups else rollup
+    save(OperationRollup.MINUTE, rollups)
+    count = sum(rollup.count for rollup in rollups.values())
+    return count, {bucket.replace(minute=0) for _, bucket in rollups}
+
+
+def roll_up_hours(hours):
+    """
+    Rebuild hour rollups of `hours` from their minute rollups.
+    """
+    if not hours:
+        return
+    minute_rollups = OperationRollup.objects.filter(
+        reduce(Q.__or__, (Q(bucket__gte=hour, bucket__lt=hour + timedelta(hours=1)) for hour in hours)),
+        period=OperationRollup.MINUTE,
+    )
+    rollups = {}
+    for minute_rollup in minute_rollups:
+        key = (minute_rollup.name, minute_rollup.bucket.replace(minute=0))
+        if key in rollups:
+            merge(rollups[key], minute_rollup)
+        else:
+            rollups[key] = copy(minute_rollup, OperationRollup.HOUR, key[1])
+    save(OperationRollup.HOUR, rollups, replace=True)
+
+
+def roll_up(ended_before, batch_size, pause=0):
+    """
+    Roll up operations saved since the previous run, `batch_size` of them per transaction.
+
+    Worker processes save operations in batches that don't commit in the order of their ids, so the cursor
+    only goes as far as the last operation that ended before `ended_before`. Leave enough time for batches
+    of operations that ended before it to have been committed.
+
+    Returns the number of operations that have been rolled up.
+    """
+    last_id = Operation.objects.filter(
+        Q(ended__lt=ended_before) | Q(ended__isnull=True, started__lt=ended_before)
+    ).aggregate(last_id=Max('id'))['last_id'] or 0
+    rolled_up = 0
+    while True:
+        with transaction.atomic():
+            # Also keeps concurrent runs from rolling up the same operations
+            cursor, _ = OperationRollupCursor.objects.select_for_update().get_or_create(pk=1)
+            after_id = cursor.last_operation_id
+            if after_id >= last_id:
+                return rolled_up
+            cursor.last_operation_id = min(after_id + batch_size, last_id)
+            count, hours = roll_up_minutes(after_id, cursor.last_operation_id)
+            roll_up_hours(hours)
+            cursor.save()
+        rolled_up += count
+        logger.debug('Rolled up operations #%s-%s', after_id + 1, cursor.last_operation_id)
+        time.sleep(pause)
+
+
+def delete_in_batches(queryset, batch_size, pause=0):
+    """
+    Delete objects of a queryset, `batch_size` of them per query, return how many have been deleted.
+    """
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+        time.sleep(pause)
+
+
+def prune(operations_before, minute_rollups_before, batch_size, pause=0):
+    """
+    Delete rolled up operations started before `operations_before` and minute rollups before
+    `minute_rollups_before`. Returns numbers of deleted operations and rollups.
+    """
+    cursor = OperationRollupCursor.objects.filter(pk=1).first()
+    operations = Operation.objects.filter(
+        started__lt=operations_before, id__lte=cursor.last_operation_id if cursor else 0)
+    minute_rollups = OperationRollup.objects.filter(
+        period=OperationRollup.MINUTE, bucket__lt=minute_rollups_before)
+    return (
+        delete_in_batches(operations, batch_size, pause),
+        delete_in_batches(minute_rollups, batch_size, pause),
+    )
@@ -0,0 +1,159 @@
+import bisect
+import hashlib
+import itertools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+ROUTER_SETTINGS = {
+    'LBRY_DAEMONS', 'LBRY_DAEMON_VIRTUAL_NODES', 'LBRY_DAEMON_ROUTE_TTL', 'LBRY_DAEMON_RETRY_INTERVAL',
+}
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def hash_key(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to nodes.
+
+    Every node is placed on the ring `virtual_nodes` times so that keys are spread evenly,
+    adding or removing a node only moves keys between that node and the rest.
+    """
+
+    def __init__(self, nodes, virtual_nodes=100):
+        points = sorted(
+            (hash_key(f'{node}#{index}'), node) for node in nodes for index in range(virtual_nodes))
+        self.nodes = list(nodes)
+        self._hashes = [point_hash for point_hash, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get_node(self, key):
+        index = bisect.bisect(self._hashes, hash_key(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+class Router:
+    """
+    Pick a daemon for every call when there is more than one configured.
+
+    Accounts live on the daemon recorded in `account_data['daemon_url']` when they were registered
+    (accounts registered before that are on the first daemon). Lookups are memoized for `route_ttl`
+    seconds. Calls not tied to an account are spread round-robin over daemons that haven't failed
+    to connect in the last `retry_interval` seconds.
+    """
+
+    def __init__(self, urls, virtual_nodes=100, route_ttl=60, retry_interval=30):
+        self.urls = list(urls)
+        self.ring = HashRing(self.urls, virtual_nodes)
+        self.route_ttl = route_ttl
+        self.retry_interval = retry_interval
+        self._routes = {}
+        self._failures = {}
+        self._round_robin = itertools.cycle(self.urls)
+        self._lock = threading.Lock()
+
+    @property
+    def is_sharded(self):
+        return len(self.urls) > 1
+
+    def daemon_for_key(self, key):
+        """
+        Return daemon where a new account identified by `key` should be created.
+        """
+        return self.ring.get_node(key)
+
+    def daemon_for_account(self, account_id):
+        if not self.is_sharded:
+            return self.urls[0]
+        now = time.monotonic()
+        with self._lock:
+            route = self._routes.get(account_id)
+        if route is not None and route[1] > now:
+            return route[0]
+        account_data = get_user_model().objects.filter(
+            account_id=account_id).values_list('account_data', flat=True).first()
+        url = (account_data or {}).get('daemon_url') or self.urls[0]
+        with self._lock:
+            self._routes[account_id] = (url, now + self.route_ttl)
+        return url
+
+    def forget_account(self, account_id):
+        with self._lock:
+            self._routes.pop(account_id, None)
+
+    def next_daemon(self):
+        if not self.is_sharded:
+            return self.urls[0]
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.urls)):
+                url = next(self._round_robin)
+                failed = self._failures.get(url)
+                if failed is None or failed + self.retry_interval <= now:
+                    return url
+        # All of them are failing, no point in being picky
+        return url
+
+    def mark_failed(self, url):
+        with self._lock:
+            if url not in self._failures:
+                logger.warning('Daemon %s is unavailable, leaving it out for %s secs', url, self.retry_interval)
+            self._failures[url] = time.monotonic()
+
+    def mark_succeeded(self, url):
+        if url in self._failures:
+            with self._lock:
+                if self._failures.pop(url, None) is not None:
+                    logger.info('Daemon %s is available again', url)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'daemons': self.urls,
+                'unavailable': [
+                    url for url, failed in self._failures.items() if failed + self.retry_interval > now],
+                'routes': len(self._routes),
+            }
+
+
+def get_router():
+    """
+    Return the process-wide router for daemons listed in `LBRY_DAEMONS`.
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = Router(
+                    settings.LBRY_DAEMONS,
+                    virtual_nodes=settings.LBRY_DAEMON_VIRTUAL_NODES,
+                    route_ttl=settings.LBRY_DAEMON_ROUTE_TTL,
+                    retry_interval=settings.LBRY_DAEMON_RETRY_INTERVAL,
+                )
+    return _router
+
+
+def reset():
+    global _router
+    with _router_lock:
+        _router = None
+
+
+@receiver(setting_changed)
+def reset_on_setting_changed(setting, **kwargs):
+    if setting in ROUTER_SETTINGS:
+        reset()
@@ -0,0 +1,93 @@
+import json
+import logging
+
+import ijson
+import urllib3
+
+from . import exceptions
+
+
+logger = logging.getLogger(__name__)
+
+# Serialized items are collected into chunks of about this size before being sent to the client
+CHUNK_SIZE = 64 * 1024
+
+CONTAINER_START = ('start_map', 'start_array')
+CONTAINER_END = ('end_map', 'end_array')
+
+
+def parse(response):
+    """
+    Yield ijson events of a streamed daemon response, read from the socket as they are needed.
+    """
+    response.raw.decode_content = True
+    try:
+        yield from ijson.parse(response.raw, use_float=True)
+    except (urllib3.exceptions.HTTPError, OSError) as exc:
+        raise exceptions.DaemonConnectionError(exc)
+    except ijson.JSONError as exc:
+        raise exceptions.DaemonException(f'Malformed daemon response: {exc}')
+
+
+def build_value(events, first_event):
+    """
+    Build a complete value out of `events`, `first_event` being the one that has already been read.
+    """
+    _, event, value = first_event
+    if event not in CONTAINER_START:
+        return value
+    builder = ijson.ObjectBuilder()
+    builder.event(event, value)
+    depth = 1
+    for _, event, value in events:
+        builder.event(event, value)
+        if event in CONTAINER_START:
+            depth += 1
+        elif event in CONTAINER_END:
+            depth -= 1
+            if depth == 0:
+                break
+    return builder.value
+
+
+def read_member(events, names):
+    """
+    Skip top-level members of a JSON-RPC response until one of `names` is found.
+
+    Returns the member name and the first event of its value, or `(None, None)` if there was none.
+    """
+    for prefix, event, value in events:
+        if prefix == '' and event == 'map_key':
+            member_event = next(events)
+            if value in names:
+                return value, member_event
+            build_value(events, member_event)
+    return None, None
+
+
+def iter_array(events):
+    """
+    Yield items of an array whose `start_array` event has already been read.
+    """
+    for event in events:
+        if event[1] == 'end_array':
+            return
+        yield build_value(events, event)
+
+
+def iter_chunks(request_id, items):
+    """
+    Serialize JSON-RPC response with `items` as its result in chunks of about `CHUNK_SIZE`.
+    """
+    buffer = ['{"jsonrpc": "2.0", "result": [']
+    size = 0
+    for index, item in enumerate(items):
+        serialized = json.dumps(item)
+        buffer.append(f', {serialized}' if index else serialized)
+        size += len(serialized)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(f'], "id": {json.dumps(request_id)}}}')
+    yield ''.join(buffer)
@@ -4,12 +4,14 @@ from unittest import mock
 from contextlib import contextmanager
 
 import responses
+from aioresponses import CallbackResult, aioresponses
 from django.test import TestCase
 from django.conf import settings
 
 from .. import signals
-from ..api import API
+from ..api import API, AsyncAPI
 from .. import exceptions
+from .test_transport import closing_async_transports
 
 
 @contextmanager
@@ -132,6 +134,52 @@ class APITest(TestCase):
             json.loads(DAEMON_FILE_LIST_RESPONSE)
         )
 
+    @responses.activate
+    def test_proxy_stream_file_list(self):
+        responses.add(
+            responses.POST, API.url,
+            body=DAEMON_FILE_LIST_RESPONSE, status=200, content_type='application/json')
+        responses.add(
+            responses.POST, API.url,
+            body=DAEMON_FILE_LIST_RESPONSE, status=200, content_type='application/json', stream=True)
+
+        api = API(account_id='abc')
+        web_client_payload = {'jsonrpc': '2.0', 'method': 'file_list', 'params': {}, 'id': 7}
+        augmented_response, _ = api.proxy(web_client_payload)
+        streamed_response = json.loads(''.join(api.proxy_stream(web_client_payload)))
+        self.assertEqual(streamed_response, dict(augmented_response, id=7))
+        self.assertEqual(responses.calls[1].request.body, responses.calls[0].request.body)
+
+    @responses.activate
+    def test_proxy_stream_chunks(self):
+        file_item = json.loads(DAEMON_FILE_LIST_RESPONSE)['result'][0]
+        responses.add(
+            responses.POST, API.url,
+            json={'jsonrpc': '2.0', 'result': [file_item] * 100, 'id': None}, status=200, stream=True)
+
+        api = API(account_id='abc')
+        with mock.patch('daemon.streaming.CHUNK_SIZE', 10000):
+            chunks = list(api.proxy_stream({'method': 'file_list', 'params': {}}))
+        self.assertGreater(len(chunks), 2)
+        result = json.loads(''.join(chunks))['result']
+        self.assertEqual(len(result), 100)
+        self.assertTrue(all(item['download_path'].startswith('http://') for item in result))
+
+    @responses.activate
+    def test_proxy_stream_error(self):
+        responses.add(
+            responses.POST, API.url,
+            json={'jsonrpc': '2.0', 'id': None, 'error': {'code': -32500, 'message': 'Daemon error'}},
+            status=200, stream=True)
+
+        with self.assertRaisesMessage(exceptions.DaemonException, 'Daemon error'):
+            API(account_id='abc').proxy_stream({'method': 'file_list', 'params': {}})
+        responses.replace(
+            responses.POST, API.url,
+            body=DAEMON_FILE_LIST_RESPONSE, status=200, content_type='application/json', stream=True)
+        with self.assertRaises(exceptions.AccountMissing):
+            API().proxy_stream({'method': 'file_list', 'params': {}})
+
     @responses.activate
     def test_proxy_status(self):
         responses.add(
@@ -164,6 +212,105 @@ class APITest(TestCase):
             json.loads(responses.calls[0].request.body),
             augmented_payload
         )
+        self.assertEqual(web_client_payload, {'method' :'account_balance'})
+
+    @responses.activate
+    def test_proxy_batch(self):
+        def daemon_callback(request):
+            payload = json.loads(request.body)
+            if payload['method'] == 'file_list':
+                body = json.loads(DAEMON_FILE_LIST_RESPONSE)
+            elif payload['method'] == 'status':
+                body = json.loads(DAEMON_STATUS_RESPONSE)
+            else:
+                body = {'error': {'code': -32601, 'message': 'Invalid method requested.'}}
+            body['id'] = payload.get('id')
+            return (200, {}, json.dumps(body))
+
+        responses.add_callback(
+            responses.POST, API.url, callback=daemon_callback, content_type='application/json')
+        account_id = 'abc'
+        api = API(account_id=account_id)
+        batch = [
+            {'jsonrpc': '2.0', 'method': 'status', 'params': {}, 'id': 1},
+            {'jsonrpc': '2.0', 'method': 'nonexistent', 'params': {}, 'id': 2},
+            {'jsonrpc': '2.0', 'method': 'file_list', 'params': {}, 'id': 3},
+            {'jsonrpc': '2.0', 'id': 4},
+        ]
+        with self.settings(LBRY_PROXY_BATCH_WORKERS=3):
+            results = api.proxy_batch(batch)
+
+        self.assertEqual([result['id'] for result in results], [1, 2, 3, 4])
+        self.assertEqual(results[0]['result'], json.loads(DAEMON_STATUS_RESPONSE)['result'])
+        self.assertIn('Invalid method requested.', results[1]['error']['message'])
+        self.assertEqual(
+            results[2]['result'][0]['download_path'],
+            f'{settings.LBRY_CONTENT_URL}{account_id}/outpoints/'
+            f'{results[2]["result"][0]["outpoint"]}/{results[2]["result"][0]["file_name"]}'
+        )
+        self.assertEqual(results[3]['error']['code'], -32600)
+        self.assertEqual(len(responses.calls), 3)
+
+
+@closing_async_transports
+class AsyncAPITest(TestCase):
+
+    async def test_error_response(self):
+        api = AsyncAPI()
+        with aioresponses() as daemon_mock:
+            daemon_mock.post(api.url, payload={
+                'error': {'code': -32700, 'data': [], 'message': 'Parse Error. Data is not valid JSON.'},
+                'id': None, 'jsonrpc': '2.0'
+            })
+            with self.assertRaisesMessage(exceptions.DaemonException, 'Parse Error. Data is not valid JSON.'):
+                await api.call('account_create', account_name='test')
+
+    async def test_proxy_get(self):
+        account_id = 'abc'
+        uri = 'what'
+        api = AsyncAPI(account_id=account_id)
+        with aioresponses() as daemon_mock:
+            daemon_mock.post(api.url, body=DAEMON_GET_RESPONSE, content_type='application/json')
+            with assertSignalSent(
+                signals.download_started, uri=uri, file_name='test', account_id=account_id,
+                    lbrynet_data=json.loads(DAEMON_GET_RESPONSE)['result']):
+                augmented_response, actual_response = await api.proxy({'method': 'get', 'params': {'uri': uri}})
+        self.assertEqual(
+            augmented_response['result']['download_path'],
+            f'{settings.LBRY_CONTENT_URL}{account_id}/{uri}'
+        )
+        self.assertEqual(actual_response, json.loads(DAEMON_GET_RESPONSE))
+
+    async def test_proxy_account_balance(self):
+        account_id = 'abc'
+        api = AsyncAPI(account_id=account_id)
+        with aioresponses() as daemon_mock:
+            daemon_mock.post(api.url, body=DAEMON_ACCOUNT_RESPONSE, content_type='application/json')
+            await api.proxy({'method': 'account_balance'})
+            (_, request), = daemon_mock.requests.items()
+        self.assertEqual(
+            request[0].kwargs['json'],
+            {'method': 'account_balance', 'params': {'account_id': account_id}}
+        )
+
+    async def test_proxy_batch(self):
+        def daemon_callback(url, json, **kwargs):
+            # Calls run concurrently, responses can't be matched by their order
+            if json['method'] == 'status':
+                return CallbackResult(body=DAEMON_STATUS_RESPONSE, content_type='application/json')
+            return CallbackResult(payload={'error': {'code': -32601, 'message': 'Invalid method requested.'}})
+
+        api = AsyncAPI(account_id='abc')
+        with aioresponses() as daemon_mock:
+            daemon_mock.post(api.url, callback=daemon_callback, repeat=True)
+            results = await api.proxy_batch([
+                {'jsonrpc': '2.0', 'method': 'status', 'params': {}, 'id': 1},
+                {'jsonrpc': '2.0', 'method': 'nonexistent', 'params': {}, 'id': 2},
+                {'jsonrpc': '2.0', 'id': 3},
+            ])
+        self.assertEqual(results[0]['result'], json.loads(DAEMON_STATUS_RESPONSE)['result'])
+        self.assertIn('Invalid method requested.', results[1]['error']['message'])
+        self.assertEqual(results[2]['error']['code'], -32600)
 
 
 DAEMON_GET_RESPONSE = """
@@ -0,0 +1,101 @@
+from unittest import mock
+
+import requests
+import responses
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import breaker, exceptions, transport
+from ..api import API
+
+
+class CircuitBreakerTest(TestCase):
+
+    def test_states(self):
+        circuit = breaker.CircuitBreaker('daemon', failure_threshold=3, reset_timeout=30)
+        with mock.patch('daemon.breaker.time.monotonic', return_value=1000):
+            for _ in range(2):
+                self.assertTrue(circuit.allow())
+                circuit.record_failure()
+            self.assertEqual(circuit.state, breaker.CLOSED)
+            self.assertTrue(circuit.allow())
+            circuit.record_failure()
+            self.assertEqual(circuit.state, breaker.OPEN)
+            self.assertFalse(circuit.allow())
+
+        with mock.patch('daemon.breaker.time.monotonic', return_value=1030):
+            # Only a single probe is let through
+            self.assertTrue(circuit.allow())
+            self.assertEqual(circuit.state, breaker.HALF_OPEN)
+            self.assertFalse(circuit.allow())
+            circuit.record_failure()
+            self.assertEqual(circuit.state, breaker.OPEN)
+            self.assertFalse(circuit.allow())
+
+        with mock.patch('daemon.breaker.time.monotonic', return_value=1060):
+            self.assertTrue(circuit.allow())
+            circuit.record_success()
+            self.assertEqual(circuit.state, breaker.CLOSED)
+            self.assertTrue(circuit.allow())
+        self.assertEqual(circuit.stats(), {'state': breaker.CLOSED, 'failures': 0, 'rejected': 3})
+
+    def test_success_resets_failures(self):
+        circuit = breaker.CircuitBreaker('daemon', failure_threshold=2)
+        circuit.record_failure()
+        circuit.record_success()
+        circuit.record_failure()
+        self.assertEqual(circuit.state, breaker.CLOSED)
+
+
+@override_settings(LBRY_DAEMON_BREAKER_FAILURES=2)
+class DaemonBreakerTest(TestCase):
+
+    def setUp(self):
+        transport.reset()
+
+    def tearDown(self):
+        transport.reset()
+
+    @responses.activate
+    def test_fail_fast(self):
+        responses.add(responses.POST, API.url, body=requests.ConnectionError('Connection refused'))
+        api = API()
+        for _ in range(2):
+            with self.assertRaises(exceptions.DaemonConnectionError):
+                api.call('status')
+        with self.assertRaises(exceptions.DaemonUnavailable):
+            api.call('status')
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(api.transport.stats()['breaker']['state'], breaker.OPEN)
+
+    @responses.activate
+    def test_server_errors(self):
+        responses.add(responses.POST, API.url, body='Internal Server Error', status=500)
+        api = API()
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                api.call('status')
+        self.assertEqual(api.transport.stats()['breaker']['state'], breaker.OPEN)
+
+    @responses.activate
+    def test_proxy_view_unavailable(self):
+        responses.add(responses.POST, API.url, body=requests.ConnectionError('Connection refused'))
+        query = {'method': 'status', 'params': {}}
+        for _ in range(2):
+            response = self.client.post(reverse('api_proxy'), query, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('api_proxy'), query, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+class MethodTimeoutTest(TestCase):
+
+    @override_settings(LBRY_DAEMON_METHOD_TIMEOUTS={'resolve': 5})
+    def test_method_timeouts(self):
+        with mock.patch('daemon.transport.Transport.post') as post:
+            post.return_value.json.return_value = {'jsonrpc': '2.0', 'id': None, 'result': {}}
+            API().call('resolve', urls=['what'])
+            self.assertEqual(post.call_args[1]['read_timeout'], 5)
+            API().call('status')
+            self.assertIsNone(post.call_args[1]['read_timeout'])
@@ -0,0 +1,91 @@
+import json
+
+import responses
+from django.core.cache import caches
+from django.test import TestCase, SimpleTestCase, override_settings
+
+from .. import cache
+from ..api import API
+from .test_api import DAEMON_FILE_LIST_RESPONSE
+
+
+DAEMON_RESOLVE_RESPONSE = json.dumps({
+    'id': 1,
+    'jsonrpc': '2.0',
+    'result': {'what': {'claim': {'name': 'what'}}},
+})
+
+DAEMON_PUBLISH_RESPONSE = json.dumps({'id': 3, 'jsonrpc': '2.0', 'result': {'txid': 'abc'}})
+
+
+class LocMemBackendTest(SimpleTestCase):
+
+    def test_lru_eviction_by_size(self):
+        backend = cache.LocMemBackend(max_bytes=10)
+        backend.set('a', '1234')
+        backend.set('b', '1234')
+        backend.get('a')
+        backend.set('c', '1234')
+        self.assertEqual(backend.get('a'), '1234')
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), '1234')
+        self.assertEqual(backend.stats(), {'entries': 2, 'bytes': 8, 'evictions': 1})
+
+    def test_expiry(self):
+        backend = cache.LocMemBackend(max_bytes=10)
+        backend.set('a', '1234', ttl=-1)
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend.stats()['bytes'], 0)
+
+
+# file_list is streamed rather than cached by default, but the cache has to keep it per account when asked to
+@override_settings(LBRY_DAEMON_CACHE_BACKEND='locmem', LBRY_DAEMON_CACHE_TTLS={'resolve': 60, 'file_list': 5})
+class ResponseCacheTest(TestCase):
+
+    def tearDown(self):
+        cache.reset()
+
+    @responses.activate
+    def test_proxy_resolve_cached(self):
+        responses.add(
+            responses.POST, API.url, body=DAEMON_RESOLVE_RESPONSE, status=200, content_type='application/json')
+        api = API()
+        augmented_response, _ = api.proxy(
+            {'jsonrpc': '2.0', 'method': 'resolve', 'params': {'urls': ['what']}, 'id': 1})
+        cached_response, _ = api.proxy(
+            {'jsonrpc': '2.0', 'method': 'resolve', 'params': {'urls': ['what']}, 'id': 2})
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(cached_response['id'], 2)
+        self.assertEqual(cached_response['result'], augmented_response['result'])
+        self.assertEqual(cache.get_cache().stats()['hits'], 1)
+        self.assertEqual(cache.get_cache().stats()['misses'], 1)
+
+    @responses.activate
+    def test_proxy_uncacheable_method(self):
+        responses.add(
+            responses.POST, API.url, body=DAEMON_PUBLISH_RESPONSE, status=200, content_type='application/json')
+        api = API()
+        api.proxy({'method': 'status', 'params': {}})
+        api.proxy({'method': 'status', 'params': {}})
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_file_list_is_account_scoped(self):
+        responses.add(
+            responses.POST, API.url, body=DAEMON_FILE_LIST_RESPONSE, status=200, content_type='application/json')
+        first_response, _ = API(account_id='abc').proxy({'method': 'file_list', 'params': {}})
+        second_response, _ = API(account_id='def').proxy({'method': 'file_list', 'params': {}})
+        self.assertEqual(len(responses.calls), 2)
+        self.assertIn('/abc/', first_response['result'][0]['download_path'])
+        self.assertIn('/def/', second_response['result'][0]['download_path'])
+
+    @responses.activate
+    @override_settings(LBRY_DAEMON_CACHE_BACKEND='django')
+    def test_django_backend(self):
+        responses.add(
+            responses.POST, API.url, body=DAEMON_RESOLVE_RESPONSE, status=200, content_type='application/json')
+        API().proxy({'method': 'resolve', 'params': {'urls': ['what']}})
+        API().proxy({'method': 'resolve', 'params': {'urls': ['what']}})
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIsInstance(cache.get_cache().backend, cache.DjangoCacheBackend)
+        caches['default'].clear()
@@ -0,0 +1,158 @@
+import json
+import time
+import asyncio
+import threading
+
+import responses
+from django.db import connections
+from django.test import TestCase, SimpleTestCase
+
+from .. import exceptions
+from ..api import API
+from ..coalescing import SingleFlight, AsyncSingleFlight, single_flight
+from .test_cache import DAEMON_RESOLVE_RESPONSE
+
+
+def run_concurrently(function, count):
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = function()
+        except Exception as exc:
+            results[index] = exc
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SingleFlightTest(SimpleTestCase):
+
+    def test_concurrent_calls_share_result(self):
+        flight = SingleFlight()
+        executed = []
+
+        def work():
+            executed.append(True)
+            time.sleep(0.2)
+            return 'result'
+
+        results = run_concurrently(lambda: flight.do('key', work), 5)
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(len(executed), 1)
+        self.assertEqual(flight.stats(), {'calls': 1, 'deduplicated': 4, 'in_flight': 0})
+
+    def test_concurrent_calls_share_error(self):
+        flight = SingleFlight()
+
+        def work():
+            time.sleep(0.2)
+            raise ValueError('Failed')
+
+        results = run_concurrently(lambda: flight.do('key', work), 3)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(flight.stats()['calls'], 1)
+
+    def test_interrupted_leader(self):
+        flight = SingleFlight()
+        leader_started = threading.Event()
+
+        def interrupted():
+            leader_started.set()
+            time.sleep(0.2)
+            raise KeyboardInterrupt()
+
+        def interrupt_leader():
+            try:
+                flight.do('key', interrupted)
+            except KeyboardInterrupt:
+                pass
+
+        leader = threading.Thread(target=interrupt_leader)
+        leader.start()
+        leader_started.wait()
+        # Waiting for the leader, then runs the call by itself
+        self.assertEqual(flight.do('key', lambda: 'result'), 'result')
+        leader.join()
+        self.assertEqual(flight.stats(), {'calls': 2, 'deduplicated': 1, 'in_flight': 0})
+
+    def test_sequential_calls_not_coalesced(self):
+        flight = SingleFlight()
+        flight.do('key', lambda: 1)
+        flight.do('key', lambda: 2)
+        self.assertEqual(flight.stats(), {'calls': 2, 'deduplicated': 0, 'in_flight': 0})
+
+
+class AsyncSingleFlightTest(SimpleTestCase):
+
+    async def test_concurrent_calls_share_result(self):
+        flight = AsyncSingleFlight()
+        executed = []
+
+        async def work():
+            executed.append(True)
+            await asyncio.sleep(0.1)
+            return 'result'
+
+        results = await asyncio.gather(*[flight.do('key', work) for _ in range(5)])
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(len(executed), 1)
+        self.assertEqual(flight.stats(), {'calls': 1, 'deduplicated': 4, 'in_flight': 0})
+
+    async def test_cancelled_leader(self):
+        flight = AsyncSingleFlight()
+        executed = []
+
+        async def work():
+            executed.append(True)
+            await asyncio.sleep(0.1)
+            return 'result'
+
+        leader = asyncio.ensure_future(flight.do('key', work))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(flight.do('key', work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*waiters), timeout=5)
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(results, ['result'] * 3)
+        # One of the waiters has made the call again for all of them
+        self.assertEqual(len(executed), 2)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+
+class APICoalescingTest(TestCase):
+
+    @responses.activate
+    def test_proxy_resolve_coalesced(self):
+        def daemon_callback(request):
+            time.sleep(0.3)
+            return (200, {}, DAEMON_RESOLVE_RESPONSE)
+
+        responses.add_callback(
+            responses.POST, API.url, callback=daemon_callback, content_type='application/json')
+        deduplicated = single_flight.stats()['deduplicated']
+        payload = {'jsonrpc': '2.0', 'method': 'resolve', 'params': {'urls': ['what']}, 'id': 1}
+        results = run_concurrently(lambda: API().proxy(payload)[0], 4)
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(single_flight.stats()['deduplicated'] - deduplicated, 3)
+        for result in results:
+            self.assertEqual(result['result'], json.loads(DAEMON_RESOLVE_RESPONSE)['result'])
+
+    @responses.activate
+    def test_proxy_error_shared(self):
+        def daemon_callback(request):
+            time.sleep(0.3)
+            return (200, {}, json.dumps({'error': {'code': -32500, 'message': 'Daemon is busy'}}))
+
+        responses.add_callback(
+            responses.POST, API.url, callback=daemon_callback, content_type='application/json')
+        results = run_concurrently(lambda: API().proxy({'method': 'status', 'params': {}}), 3)
+        self.assertEqual(len(responses.calls), 1)
+        self.assertTrue(all(isinstance(result, exceptions.DaemonException) for result in results))
@@ -0,0 +1,83 @@
+import json
+from io import StringIO
+from datetime import timedelta
+
+import responses
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from storage.models import Content
+from users.models import User
+from .. import jobs
+from ..api import API
+from ..models import ProxyJob
+from .test_api import DAEMON_GET_RESPONSE
+
+
+class JobsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test@lbry.io', account_id='abc')
+
+    def test_submit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = jobs.submit('abc', {'method': 'get', 'params': {'uri': 'what'}})
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(job.status, ProxyJob.PENDING)
+        self.assertGreater(job.expires, timezone.now())
+
+    @responses.activate
+    def test_run_job(self):
+        responses.add(
+            responses.POST, API.url, body=DAEMON_GET_RESPONSE, status=200, content_type='application/json')
+        job = ProxyJob.objects.create(
+            account_id='abc', request={'method': 'get', 'params': {'uri': 'what'}}, expires=timezone.now())
+
+        job = jobs.run_job(job.pk)
+        self.assertEqual(job.status, ProxyJob.DONE)
+        self.assertIsNotNone(job.finished)
+        job.refresh_from_db()
+        self.assertTrue(job.response['result']['download_path'].startswith('http://'))
+        # Post handlers have run as well
+        self.assertTrue(Content.objects.filter(
+            outpoint=json.loads(DAEMON_GET_RESPONSE)['result']['outpoint'], downloaded_by=self.user).exists())
+        # Finished jobs are not run again
+        self.assertIsNone(jobs.run_job(job.pk))
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_run_job_error(self):
+        responses.add(
+            responses.POST, API.url, json={'jsonrpc': '2.0', 'error': {'code': -32500, 'message': 'No such claim'}})
+        job = ProxyJob.objects.create(
+            account_id='abc', request={'method': 'get', 'params': {'uri': 'what'}}, expires=timezone.now())
+
+        job = jobs.run_job(job.pk)
+        self.assertEqual(job.status, ProxyJob.FAILED)
+        self.assertIn('No such claim', job.error)
+
+    def test_purge(self):
+        request = {'method': 'get', 'params': {'uri': 'what'}}
+        ProxyJob.objects.create(account_id='abc', request=request, expires=timezone.now() - timedelta(seconds=1))
+        job = ProxyJob.objects.create(account_id='abc', request=request, expires=timezone.now() + timedelta(hours=1))
+        out = StringIO()
+        call_command('purge_proxy_jobs', stdout=out)
+        self.assertIn('1 expired jobs deleted', out.getvalue())
+        self.assertEqual(list(ProxyJob.objects.all()), [job])
+
+    @override_settings(LBRY_JOB_TIMEOUT=60)
+    def test_purge_lost(self):
+        request = {'method': 'get', 'params': {'uri': 'what'}}
+        expires = timezone.now() + timedelta(hours=1)
+        lost = ProxyJob.objects.create(
+            account_id='abc', request=request, expires=expires, created=timezone.now() - timedelta(seconds=61))
+        job = ProxyJob.objects.create(account_id='abc', request=request, expires=expires)
+        out = StringIO()
+        call_command('purge_proxy_jobs', stdout=out)
+        self.assertIn('1 lost jobs failed', out.getvalue())
+        lost.refresh_from_db()
+        self.assertEqual(lost.status, ProxyJob.FAILED)
+        self.assertTrue(lost.error)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProxyJob.PENDING)
@@ -0,0 +1,74 @@
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from ..latency import get_latency
+from ..models import Operation
+
+
+class LatencyTest(TestCase):
+
+    def setUp(self):
+        # Async tests run outside of the test transaction and their operations stay around
+        Operation.objects.all().delete()
+        self.until = datetime(2019, 3, 1, 13, tzinfo=dt_timezone.utc)
+
+    def add_operations(self, name, started, durations, errored=False):
+        Operation.objects.bulk_create(
+            Operation(name=name, started=started, duration=duration, errored=errored) for duration in durations)
+
+    def test_get_latency(self):
+        hour_ago = self.until - timedelta(hours=1)
+        self.add_operations('resolve', hour_ago, [0.1, 0.2, 0.3])
+        self.add_operations('resolve', hour_ago + timedelta(minutes=30), [0.4], errored=True)
+        self.add_operations('status', hour_ago, [1])
+        # Out of the window
+        self.add_operations('resolve', self.until, [10])
+        self.add_operations('resolve', hour_ago - timedelta(seconds=1), [10])
+
+        resolve, status = get_latency(hour_ago, self.until)
+        self.assertEqual((resolve['name'], resolve['calls'], resolve['errors']), ('resolve', 4, 1))
+        self.assertAlmostEqual(resolve['throughput'], 4 / 3600)
+        self.assertEqual(resolve['error_rate'], 0.25)
+        self.assertAlmostEqual(resolve['p50'], 0.25)
+        self.assertAlmostEqual(resolve['p90'], 0.37)
+        self.assertEqual(status['p99'], 1)
+
+        self.assertEqual([row['name'] for row in get_latency(hour_ago, self.until, methods=['status'])], ['status'])
+        first_half, second_half = get_latency(hour_ago, self.until, methods=['resolve'], by='minute')
+        self.assertEqual((first_half['period'], first_half['calls']), (hour_ago, 3))
+        self.assertEqual(second_half['throughput'], 1 / 60)
+
+    def test_command_compare(self):
+        self.add_operations('resolve', self.until - timedelta(minutes=10), [0.2, 0.2])
+        self.add_operations('resolve', self.until - timedelta(minutes=40), [0.1])
+        self.add_operations('status', self.until - timedelta(minutes=10), [0.5])
+        out = StringIO()
+        call_command(
+            'daemon_latency', '--window=30m', '--until=2019-03-01T13:00', '--compare', '--format=json', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['since'], '2019-03-01T12:30:00Z')
+        self.assertEqual([row['calls'] for row in report['methods']], [2, 1])
+        self.assertEqual(report['baseline']['until'], '2019-03-01T12:30:00Z')
+        self.assertEqual([row['name'] for row in report['baseline']['methods']], ['resolve'])
+
+        out = StringIO()
+        call_command('daemon_latency', '--window=30m', '--until=2019-03-01T13:00', '--compare', stdout=out)
+        title, header, resolve, status = out.getvalue().splitlines()
+        self.assertEqual(
+            title, '2019-03-01 12:30:00 - 2019-03-01 13:00:00 vs 2019-03-01 12:00:00 - 2019-03-01 12:30:00')
+        self.assertEqual(
+            header.split(), ['method', 'calls', 'calls/s', 'errors', '%', 'p50', 'ms', 'p90', 'ms', 'p99', 'ms'])
+        self.assertIn('2 (+100%)', resolve)
+        self.assertIn('200.0 (+100%)', resolve)
+        self.assertIn('500.0 (new)', status)
+
+    def test_command_invalid(self):
+        with self.assertRaisesMessage(CommandError, 'Invalid duration'):
+            call_command('daemon_latency', '--window=an hour')
+        with self.assertRaisesMessage(CommandError, 'cannot be compared'):
+            call_command('daemon_latency', '--by=minute', '--compare')
@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import metrics
+from ..metrics import DaemonMetrics, OTHER_METHOD
+from ..profiling import Profiler
+
+
+class DaemonMetricsTest(TestCase):
+
+    def test_call_finished(self):
+        daemon_metrics = DaemonMetrics([0.1, 1])
+        daemon_metrics.call_started('resolve')
+        daemon_metrics.call_started('resolve')
+        daemon_metrics.call_finished('resolve', 0.5)
+        daemon_metrics.call_started('resolve')
+        daemon_metrics.call_finished('resolve', 2, errored=True)
+        resolve = daemon_metrics.collect()['resolve']
+        self.assertEqual(resolve.buckets, [0, 1, 1])
+        self.assertEqual((resolve.sum, resolve.count, resolve.errors, resolve.in_flight), (2.5, 2, 1, 1))
+
+    def test_max_methods(self):
+        daemon_metrics = DaemonMetrics([1], max_methods=2)
+        for method in ['resolve', 'status', 'nonexistent', 'whatever']:
+            daemon_metrics.call_started(method)
+        self.assertEqual(sorted(daemon_metrics.collect()), [OTHER_METHOD, 'resolve', 'status'])
+        self.assertEqual(daemon_metrics.collect()[OTHER_METHOD].in_flight, 2)
+
+    def test_render(self):
+        daemon_metrics = DaemonMetrics([0.1, 1])
+        daemon_metrics.call_started('res"olve')
+        daemon_metrics.call_finished('res"olve', 0.5, errored=True)
+        self.assertEqual(daemon_metrics.render().splitlines(), [
+            '# HELP lbryweb_daemon_call_duration_seconds Duration of daemon calls.',
+            '# TYPE lbryweb_daemon_call_duration_seconds histogram',
+            'lbryweb_daemon_call_duration_seconds_bucket{method="res\\"olve",le="0.1"} 0',
+            'lbryweb_daemon_call_duration_seconds_bucket{method="res\\"olve",le="1"} 1',
+            'lbryweb_daemon_call_duration_seconds_bucket{method="res\\"olve",le="+Inf"} 1',
+            'lbryweb_daemon_call_duration_seconds_sum{method="res\\"olve"} 0.5',
+            'lbryweb_daemon_call_duration_seconds_count{method="res\\"olve"} 1',
+            '# HELP lbryweb_daemon_call_errors_total Daemon calls that have failed.',
+            '# TYPE lbryweb_daemon_call_errors_total counter',
+            'lbryweb_daemon_call_errors_total{method="res\\"olve"} 1',
+            '# HELP lbryweb_daemon_calls_in_flight Daemon calls waiting for a response.',
+            '# TYPE lbryweb_daemon_calls_in_flight gauge',
+            'lbryweb_daemon_calls_in_flight{method="res\\"olve"} 0',
+        ])
+
+    @mock.patch.object(DaemonMetrics, '_ensure_writer')
+    def test_collect_processes(self, ensure_writer):
+        with tempfile.TemporaryDirectory() as directory:
+            daemon_metrics = DaemonMetrics([1], directory=directory)
+            daemon_metrics.call_started('resolve')
+            daemon_metrics.write()
+            self.assertEqual(os.listdir(directory), [f'{os.getpid()}.json'])
+            values = {'buckets': [3, 1], 'sum': 4.0, 'count': 4, 'errors': 1, 'in_flight': 2}
+            for pid in [os.getppid(), 2 ** 22 + 1]:
+                with open(os.path.join(directory, f'{pid}.json'), 'w') as snapshot_file:
+                    json.dump({'pid': pid, 'bucket_bounds': [1], 'methods': {'resolve': values}}, snapshot_file)
+            with open(os.path.join(directory, 'stale.json'), 'w') as snapshot_file:
+                json.dump({'pid': 1, 'bucket_bounds': [2], 'methods': {'resolve': values}}, snapshot_file)
+            resolve = daemon_metrics.collect()['resolve']
+        self.assertEqual(resolve.buckets, [6, 2])
+        self.assertEqual((resolve.count, resolve.errors), (8, 2))
+        # Calls of processes that have exited aren't in flight anymore
+        self.assertEqual(resolve.in_flight, 3)
+
+
+class ProfilerMetricsTest(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_profiler(self):
+        profiler = Profiler()
+        profiler.start('resolve')
+        profiler.start('status')
+        self.assertEqual(metrics.get_metrics().collect()['resolve'].in_flight, 1)
+        profiler.end('resolve')
+        profiler.error('status')
+        collected = metrics.get_metrics().collect()
+        self.assertEqual((collected['resolve'].count, collected['resolve'].in_flight), (1, 0))
+        self.assertEqual((collected['status'].errors, collected['status'].in_flight), (1, 0))
+
+    def test_profiler_abandoned(self):
+        profiler = Profiler()
+        profiler.start('resolve')
+        del profiler
+        self.assertEqual(metrics.get_metrics().collect()['resolve'].in_flight, 0)
+
+
+class MetricsViewTest(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_get(self):
+        Profiler().start('resolve')
+        response = self.client.get(reverse('daemon_metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('lbryweb_daemon_calls_in_flight{method="resolve"} 0', response.content.decode())
+
+    @override_settings(LBRY_METRICS_TOKEN='secret')
+    def test_get_token(self):
+        response = self.client.get(reverse('daemon_metrics'))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse('daemon_metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse('daemon_metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
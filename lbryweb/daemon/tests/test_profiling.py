@@ -0,0 +1,89 @@
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import tracing
+from ..models import Operation
+from ..profiling import OperationBuffer, Profiler
+
+
+class ProfilerTest(TestCase):
+
+    def setUp(self):
+        # Async tests run outside of the test transaction and their operations stay around
+        Operation.objects.all().delete()
+
+    def test_end(self):
+        profiler = Profiler()
+        profiler.start('resolve')
+        profiler.start('status')
+        profiler.end('resolve')
+        profiler.error('status')
+        resolve, status = Operation.objects.order_by('name')
+        self.assertEqual((resolve.name, resolve.errored), ('resolve', False))
+        self.assertEqual((status.name, status.errored), ('status', True))
+        self.assertLessEqual(resolve.started, resolve.ended)
+        self.assertLessEqual(resolve.ended, timezone.now())
+        self.assertGreaterEqual(resolve.duration, 0)
+
+    def test_end_overlapping(self):
+        profiler = Profiler()
+        first = profiler.start('resolve')
+        profiler.start('resolve')
+        profiler.start('resolve')
+        profiler.end(first)
+        profiler.error('resolve')
+        self.assertEqual(Operation.objects.filter(name='resolve', errored=False).count(), 1)
+        self.assertEqual(Operation.objects.filter(name='resolve', errored=True).count(), 1)
+        self.assertEqual(len(profiler.timers), 1)
+        profiler.end(first)
+        self.assertEqual(Operation.objects.count(), 2)
+
+    def test_end_traced(self):
+        profiler = Profiler()
+        with tracing.span('request') as span:
+            profiler.end(profiler.start('resolve'))
+        self.assertEqual(Operation.objects.get().meta, {'trace_id': span.trace_id})
+
+    def test_end_not_started(self):
+        Profiler().end('resolve')
+        self.assertFalse(Operation.objects.exists())
+
+
+@mock.patch.object(OperationBuffer, '_ensure_flusher')
+class OperationBufferTest(TestCase):
+
+    def setUp(self):
+        Operation.objects.all().delete()
+
+    def make_operation(self, name):
+        return Operation(name=name, started=timezone.now(), ended=timezone.now(), duration=0)
+
+    def test_flush(self, ensure_flusher):
+        buffer = OperationBuffer(flush_size=2)
+        buffer.add(self.make_operation('resolve'))
+        self.assertFalse(buffer._wakeup.is_set())
+        buffer.add(self.make_operation('status'))
+        self.assertTrue(buffer._wakeup.is_set())
+        self.assertFalse(Operation.objects.exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(Operation.objects.count(), 2)
+        self.assertEqual(buffer.stats(), {'buffered': 0, 'flushed': 2, 'dropped': 0})
+
+    def test_drop_oldest(self, ensure_flusher):
+        buffer = OperationBuffer(max_size=2)
+        for name in ['resolve', 'status', 'get']:
+            buffer.add(self.make_operation(name))
+        buffer.flush()
+        self.assertEqual(sorted(Operation.objects.values_list('name', flat=True)), ['get', 'status'])
+        self.assertEqual(buffer.stats()['dropped'], 1)
+
+    def test_flush_error(self, ensure_flusher):
+        buffer = OperationBuffer()
+        buffer.add(self.make_operation('resolve'))
+        with mock.patch.object(Operation.objects, 'bulk_create', side_effect=DatabaseError):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.stats(), {'buffered': 0, 'flushed': 0, 'dropped': 1})
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import rollup
+from ..models import Operation, OperationRollup, OperationRollupCursor
+
+
+class RollupTest(TestCase):
+
+    def setUp(self):
+        # Async tests run outside of the test transaction and their operations stay around
+        Operation.objects.all().delete()
+        self.hour = datetime(2019, 3, 1, 12, tzinfo=dt_timezone.utc)
+        self.now = timezone.now()
+
+    def add_operations(self, name, minute, durations, errored=False):
+        started = self.hour + timedelta(minutes=minute)
+        Operation.objects.bulk_create(
+            Operation(name=name, started=started, duration=duration, errored=errored) for duration in durations)
+
+    def test_roll_up(self):
+        self.add_operations('resolve', 0, [0.01] * 90 + [1] * 9)
+        self.add_operations('resolve', 0, [10], errored=True)
+        self.add_operations('resolve', 1, [0.5])
+        self.add_operations('status', 0, [0.1])
+        self.assertEqual(rollup.roll_up(self.now, batch_size=7), 102)
+
+        resolve = OperationRollup.objects.get(period=OperationRollup.MINUTE, name='resolve', bucket=self.hour)
+        self.assertEqual((resolve.count, resolve.errors), (100, 1))
+        self.assertEqual((resolve.duration_min, resolve.duration_max), (0.01, 10))
+        self.assertAlmostEqual(resolve.duration_sum, 19.9)
+        self.assertAlmostEqual(resolve.p50, 0.01, delta=0.001)
+        self.assertAlmostEqual(resolve.p90, 0.01, delta=0.001)
+        self.assertAlmostEqual(resolve.p99, 1, delta=0.09)
+        self.assertEqual(OperationRollup.objects.filter(period=OperationRollup.MINUTE).count(), 3)
+
+        resolve_hour = OperationRollup.objects.get(period=OperationRollup.HOUR, name='resolve')
+        self.assertEqual(resolve_hour.bucket, self.hour)
+        self.assertEqual((resolve_hour.count, resolve_hour.errors, resolve_hour.duration_max), (101, 1, 10))
+        self.assertEqual(OperationRollup.objects.filter(period=OperationRollup.HOUR).count(), 2)
+
+    def test_roll_up_again(self):
+        self.add_operations('resolve', 0, [0.01, 0.02])
+        rollup.roll_up(self.now, batch_size=100)
+        self.assertEqual(rollup.roll_up(self.now, batch_size=100), 0)
+        self.add_operations('resolve', 30, [0.03])
+        self.add_operations('resolve', 0, [0.04])
+        self.assertEqual(rollup.roll_up(self.now, batch_size=100), 2)
+        minute = OperationRollup.objects.get(period=OperationRollup.MINUTE, name='resolve', bucket=self.hour)
+        self.assertEqual((minute.count, minute.duration_max), (3, 0.04))
+        hour = OperationRollup.objects.get(period=OperationRollup.HOUR, name='resolve')
+        self.assertEqual(hour.count, 4)
+        self.assertEqual(OperationRollupCursor.objects.get().last_operation_id, Operation.objects.latest('id').id)
+
+    def test_recent_operations_left_for_later(self):
+        self.add_operations('resolve', 0, [0.01])
+        Operation.objects.create(
+            name='resolve', started=self.hour + timedelta(minutes=59), ended=self.hour + timedelta(minutes=61),
+            duration=120)
+        # Operations with lower ids saved by other workers could still be committing
+        self.assertEqual(rollup.roll_up(self.hour + timedelta(minutes=60), batch_size=100), 1)
+        self.assertEqual(
+            OperationRollupCursor.objects.get().last_operation_id, Operation.objects.earliest('id').id)
+        self.assertEqual(rollup.roll_up(self.hour + timedelta(minutes=62), batch_size=100), 1)
+        self.assertEqual(OperationRollupCursor.objects.get().last_operation_id, Operation.objects.latest('id').id)
+
+    def test_prune(self):
+        self.add_operations('resolve', 0, [0.01, 0.02])
+        rollup.roll_up(self.now, batch_size=100)
+        self.add_operations('resolve', 0, [0.03])
+        deleted = rollup.prune(self.hour + timedelta(days=1), self.hour, batch_size=1)
+        # Operations that haven't been rolled up are kept
+        self.assertEqual(deleted, (2, 0))
+        self.assertEqual(Operation.objects.count(), 1)
+        deleted = rollup.prune(self.hour, self.hour + timedelta(days=1), batch_size=1)
+        self.assertEqual(deleted, (0, 1))
+        self.assertEqual(OperationRollup.objects.get().period, OperationRollup.HOUR)
+
+
+class RollupOperationsCommandTest(TestCase):
+
+    def setUp(self):
+        Operation.objects.all().delete()
+
+    @override_settings(LBRY_OPERATION_RETENTION=1)
+    def test_handle(self):
+        now = timezone.now()
+        Operation.objects.create(name='resolve', started=now - timedelta(days=2), duration=0.1)
+        Operation.objects.create(name='resolve', started=now - timedelta(hours=1), duration=0.2)
+        # Not rolled up yet, it may have been saved along with operations that are still being committed
+        Operation.objects.create(name='resolve', started=now, ended=now, duration=0.3)
+        out = StringIO()
+        call_command('rollup_operations', '--pause=0', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            '2 operations rolled up',
+            '1 operations and 0 minute rollups deleted',
+        ])
+        self.assertEqual(sorted(Operation.objects.values_list('duration', flat=True)), [0.2, 0.3])
+        self.assertEqual(OperationRollup.objects.filter(period=OperationRollup.HOUR).count(), 2)
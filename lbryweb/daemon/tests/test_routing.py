@@ -0,0 +1,77 @@
+import responses
+from django.test import TestCase, override_settings
+
+from users.models import User
+from .. import routing
+from ..api import API
+
+
+DAEMONS = ['http://daemon1:5279/', 'http://daemon2:5279/', 'http://daemon3:5279/']
+
+
+class HashRingTest(TestCase):
+
+    def test_spread(self):
+        ring = routing.HashRing(DAEMONS)
+        keys = [f'user{index}@lbry.io' for index in range(3000)]
+        counts = {daemon: 0 for daemon in DAEMONS}
+        for key in keys:
+            counts[ring.get_node(key)] += 1
+        for count in counts.values():
+            self.assertGreater(count, 700)
+
+    def test_adding_node_moves_few_keys(self):
+        keys = [f'user{index}@lbry.io' for index in range(3000)]
+        ring = routing.HashRing(DAEMONS)
+        bigger_ring = routing.HashRing(DAEMONS + ['http://daemon4:5279/'])
+        moved = [key for key in keys if ring.get_node(key) != bigger_ring.get_node(key)]
+        self.assertLess(len(moved), len(keys) * 0.35)
+        # Keys only ever move to the new node
+        self.assertEqual({bigger_ring.get_node(key) for key in moved}, {'http://daemon4:5279/'})
+
+
+@override_settings(LBRY_DAEMONS=DAEMONS)
+class RouterTest(TestCase):
+
+    def tearDown(self):
+        routing.reset()
+
+    def test_next_daemon_skips_failed(self):
+        router = routing.get_router()
+        self.assertEqual({router.next_daemon() for _ in range(3)}, set(DAEMONS))
+        router.mark_failed(DAEMONS[1])
+        self.assertNotIn(DAEMONS[1], {router.next_daemon() for _ in range(6)})
+        self.assertEqual(router.stats()['unavailable'], [DAEMONS[1]])
+        router.mark_succeeded(DAEMONS[1])
+        self.assertIn(DAEMONS[1], {router.next_daemon() for _ in range(3)})
+
+    def test_daemon_for_account(self):
+        User.objects.create(username='test@lbry.io', account_id='abc', account_data={'daemon_url': DAEMONS[2]})
+        User.objects.create(username='old@lbry.io', account_id='def', account_data={})
+        router = routing.get_router()
+        self.assertEqual(router.daemon_for_account('abc'), DAEMONS[2])
+        self.assertEqual(router.daemon_for_account('def'), DAEMONS[0])
+        User.objects.filter(account_id='abc').update(account_data={'daemon_url': DAEMONS[1]})
+        with self.assertNumQueries(0):
+            self.assertEqual(router.daemon_for_account('abc'), DAEMONS[2])
+        router.forget_account('abc')
+        self.assertEqual(router.daemon_for_account('abc'), DAEMONS[1])
+
+    @responses.activate
+    def test_api_routing(self):
+        User.objects.create(username='test@lbry.io', account_id='abc', account_data={'daemon_url': DAEMONS[2]})
+        for daemon in DAEMONS:
+            responses.add(responses.POST, daemon, json={'jsonrpc': '2.0', 'id': None, 'result': []})
+        api = API(account_id='abc')
+        for method in ['account_balance', 'file_list', 'get']:
+            self.assertEqual(api.route(method), DAEMONS[2])
+        self.assertEqual(API().route('account_list', {'account_id': 'abc'}), DAEMONS[2])
+        self.assertEqual(API(url=DAEMONS[1]).route('account_balance'), DAEMONS[1])
+
+        api.proxy({'method': 'file_list', 'params': {}})
+        for _ in range(3):
+            api.proxy({'method': 'claim_search', 'params': {'name': 'what'}})
+        self.assertEqual(
+            [call.request.url for call in responses.calls],
+            [DAEMONS[2]] + DAEMONS
+        )
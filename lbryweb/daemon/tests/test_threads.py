@@ -0,0 +1,39 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..threads import ProcessThread
+
+
+class ProcessThreadTest(SimpleTestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.runs = []
+
+    def tearDown(self):
+        self.release.set()
+
+    def run_until_released(self):
+        self.runs.append(True)
+        self.release.wait()
+
+    def test_started_once(self):
+        thread = ProcessThread(self.run_until_released, name='test')
+        self.assertTrue(thread.ensure_started())
+        self.assertFalse(thread.ensure_started())
+        self.assertEqual(thread._thread.name, 'test')
+
+    def test_restarted_when_dead(self):
+        thread = ProcessThread(lambda: None, name='test')
+        thread.ensure_started()
+        thread._thread.join()
+        self.assertTrue(thread.ensure_started())
+
+    def test_restarted_in_forked_process(self):
+        thread = ProcessThread(self.run_until_released, name='test')
+        thread.ensure_started()
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertTrue(thread.ensure_started())
+            self.assertFalse(thread.ensure_started())
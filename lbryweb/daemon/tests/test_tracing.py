@@ -0,0 +1,70 @@
+import json
+
+import responses
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import tracing
+from ..api import API
+from .test_api import DAEMON_STATUS_RESPONSE
+
+
+@override_settings(LBRY_TRACE_MIN_DURATION=0)
+class TracingTest(TestCase):
+
+    def get_spans(self, logs):
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_span(self):
+        with self.assertLogs('daemon.tracing', 'INFO') as logs:
+            with tracing.span('request', path='/') as request_span:
+                with tracing.span('decode') as decode_span:
+                    self.assertIs(tracing.get_current_span(), decode_span)
+                with self.assertRaises(ValueError):
+                    with tracing.span('daemon'):
+                        raise ValueError('Boom')
+            self.assertIsNone(tracing.get_current_span())
+        decode, daemon, request = self.get_spans(logs)
+        self.assertEqual([decode['name'], daemon['name'], request['name']], ['decode', 'daemon', 'request'])
+        self.assertEqual({decode['trace_id'], daemon['trace_id']}, {request_span.trace_id})
+        self.assertEqual((decode['parent_id'], daemon['parent_id'], request['parent_id']), (
+            request_span.span_id, request_span.span_id, None))
+        self.assertEqual(request['attributes'], {'path': '/'})
+        self.assertEqual(daemon['error'], "ValueError('Boom')")
+        self.assertGreaterEqual(request['duration'], decode['duration'] + daemon['duration'])
+
+    def test_span_fast(self):
+        with self.settings(LBRY_TRACE_MIN_DURATION=60), self.assertLogs('daemon.tracing', 'INFO') as logs:
+            with tracing.span('request'):
+                pass
+            # assertLogs wants something logged
+            tracing.logger.info('-')
+        self.assertEqual(len(logs.records), 1)
+
+    @responses.activate
+    def test_proxy_batch(self):
+        responses.add(responses.POST, API.url, body=DAEMON_STATUS_RESPONSE, content_type='application/json')
+        batch = [{'jsonrpc': '2.0', 'method': 'status', 'params': {}, 'id': request_id} for request_id in [1, 2]]
+        # Identical calls running at the same time would otherwise share a single daemon call
+        with self.settings(LBRY_PROXY_BATCH_WORKERS=2, LBRY_DAEMON_COALESCED_METHODS=[]), \
+                self.assertLogs('daemon.tracing', 'INFO') as logs:
+            with tracing.span('request') as request_span:
+                API().proxy_batch(batch)
+        spans = self.get_spans(logs)
+        # Calls run in worker threads are part of the same trace
+        self.assertEqual({span['trace_id'] for span in spans}, {request_span.trace_id})
+        proxy_span_ids = {span['span_id'] for span in spans if span['name'] == 'proxy'}
+        self.assertEqual(len(proxy_span_ids), 2)
+        self.assertEqual(
+            {span['parent_id'] for span in spans if span['name'] == 'daemon'}, proxy_span_ids)
+
+    @responses.activate
+    def test_middleware(self):
+        responses.add(responses.POST, API.url, body=DAEMON_STATUS_RESPONSE, content_type='application/json')
+        with self.assertLogs('daemon.tracing', 'INFO') as logs:
+            response = self.client.post(reverse('api_proxy'), {'method': 'status'}, content_type='application/json')
+        spans = self.get_spans(logs)
+        self.assertEqual({span['trace_id'] for span in spans}, {response['X-Trace-Id']})
+        self.assertEqual(
+            {span['name'] for span in spans},
+            {'request', 'auth', 'decode', 'proxy', 'augment_request', 'daemon', 'augment_response', 'serialize'})
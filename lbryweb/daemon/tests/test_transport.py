@@ -0,0 +1,117 @@
+import json
+import asyncio
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from django.test import TestCase, override_settings
+
+from .. import transport, exceptions
+from ..api import API
+
+
+def closing_async_transports(test_class):
+    """
+    Close async transports at the end of each async test of `test_class`, in the event loop of the test.
+    """
+    def closing(test_method):
+        @functools.wraps(test_method)
+        async def test(*args, **kwargs):
+            try:
+                return await test_method(*args, **kwargs)
+            finally:
+                await transport.close_async_transports()
+        return test
+
+    for name, test_method in list(vars(test_class).items()):
+        if name.startswith('test') and asyncio.iscoroutinefunction(test_method):
+            setattr(test_class, name, closing(test_method))
+    return test_class
+
+
+class StubDaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    delay = 0
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.delay)
+        body = json.dumps({'jsonrpc': '2.0', 'id': payload.get('id'), 'result': payload['method']}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubDaemon(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TransportTest(TestCase):
+
+    def setUp(self):
+        transport.reset()
+        self.server = StubDaemon(('127.0.0.1', 0), StubDaemonHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def tearDown(self):
+        StubDaemonHandler.delay = 0
+        self.server.shutdown()
+        self.server.server_close()
+        transport.reset()
+
+    def test_connection_reused(self):
+        daemon_transport = transport.Transport(self.url, pool_size=2)
+        for _ in range(5):
+            response = daemon_transport.post({'method': 'status', 'params': {}})
+            self.assertEqual(response.json()['result'], 'status')
+        stats = daemon_transport.stats()
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_idle'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_pool_size_bounds_idle_connections(self):
+        daemon_transport = transport.Transport(self.url, pool_size=2)
+        StubDaemonHandler.delay = 0.1
+        threads = [
+            threading.Thread(target=daemon_transport.post, args=({'method': 'status'},))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = daemon_transport.stats()
+        self.assertEqual(stats['requests'], 4)
+        self.assertLessEqual(stats['connections_idle'], 2)
+
+    def test_read_timeout(self):
+        StubDaemonHandler.delay = 0.5
+        with override_settings(LBRY_DAEMON_READ_TIMEOUT=0.1, LBRY_DAEMON_METHOD_TIMEOUTS={}):
+            api = API()
+            api.url = self.url
+            with self.assertRaises(exceptions.DaemonConnectionError):
+                api.call('status')
+        self.assertEqual(api.transport.stats()['errors'], 1)
+
+    def test_get_transport_is_shared(self):
+        self.assertIs(transport.get_transport(self.url), transport.get_transport(self.url))
+        self.assertEqual([stats['url'] for stats in transport.get_stats()], [self.url])
+
+    async def test_close_async_transports(self):
+        async_transport = transport.get_async_transport(self.url)
+        response = await async_transport.post({'method': 'status', 'params': {}})
+        self.assertEqual(response.json()['result'], 'status')
+        session = async_transport.session
+        await transport.close_async_transports()
+        self.assertTrue(session.closed)
+        self.assertIsNot(transport.get_async_transport(self.url), async_transport)
@@ -0,0 +1,32 @@
+import os
+import threading
+
+
+class ProcessThread:
+    """
+    Daemon thread running `target` in the background of the current process.
+
+    Threads don't survive forking, so it's started again in workers forked from a preloaded app,
+    as well as if it has died.
+    """
+
+    def __init__(self, target, name):
+        self.target = target
+        self.name = name
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """
+        Start the thread unless it's running in this process already, return whether it has been started.
+        """
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return False
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.target, name=self.name, daemon=True)
+            self._thread.start()
+            return True
@@ -0,0 +1,105 @@
+import contextvars
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Trace:
+    """
+    Spans of a single incoming request (or of a piece of background work), exported together once it's over.
+    """
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []
+
+
+class Span:
+    """
+    A timed stage of a trace, nested in the stage that was current when it started.
+    """
+
+    def __init__(self, name, trace, parent=None, attributes=None):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.attributes = attributes or {}
+        self.error = None
+        self.started = timezone.now()
+        self.duration = None
+        self._started_monotonic = time.monotonic()
+
+    def __repr__(self):
+        return f'<Span {self.name} {self.trace.trace_id}/{self.span_id}>'
+
+    @property
+    def trace_id(self):
+        return self.trace.trace_id
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.monotonic() - self._started_monotonic
+        self.trace.spans.append(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent else None,
+            'name': self.name,
+            'start': self.started.isoformat(),
+            'end': (self.started + timedelta(seconds=self.duration)).isoformat(),
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+def get_current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block as a span named `name`, child of the current span.
+
+    Without a current span a new trace is started, and its spans are exported when this span is over.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent.trace if parent else Trace(), parent, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = repr(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+        if parent is None:
+            export(current)
+
+
+def export(root):
+    """
+    Log spans of the trace of `root` as JSON lines if it has taken at least `LBRY_TRACE_MIN_DURATION` secs.
+    """
+    if not settings.LBRY_TRACING or root.duration < settings.LBRY_TRACE_MIN_DURATION:
+        return
+    for finished in root.trace.spans:
+        logger.info(json.dumps(finished.to_dict(), default=str))
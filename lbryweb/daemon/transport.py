@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import threading
+import weakref
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import exceptions
+from .breaker import CircuitBreaker, get_breaker, reset as reset_breakers
+
+
+logger = logging.getLogger(__name__)
+
+
+class Transport:
+    """
+    Pooled keep-alive HTTP transport for talking to a single lbrynet daemon URL.
+
+    A single connection pool (`HTTPAdapter`) is shared by all threads of the process,
+    while `requests.Session` objects, which are not guaranteed to be thread-safe,
+    are kept per thread and all mount that shared adapter.
+
+    Calls are refused with `DaemonUnavailable` while the daemon's circuit breaker is open.
+    """
+
+    def __init__(self, url, pool_size=10, connect_timeout=3.05, read_timeout=60, breaker=None):
+        self.url = url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.breaker = breaker or CircuitBreaker(url)
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._in_flight = 0
+
+    def __repr__(self):
+        return f'<Transport {self.url} (pool_size={self.pool_size})>'
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self._local.session = session
+        return session
+
+    def post(self, payload, read_timeout=None, stream=False):
+        """
+        Send JSON-RPC `payload` to the daemon, reusing a pooled connection if one is available.
+
+        With `stream`, response body is left unread and its connection is only returned to the pool
+        once the response has been read or closed.
+        """
+        if not self.breaker.allow():
+            raise exceptions.DaemonUnavailable(f'Daemon {self.url} is unavailable')
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        with self._lock:
+            self._requests += 1
+            self._in_flight += 1
+        failed = True
+        try:
+            response = self.session.post(self.url, json=payload, timeout=timeout, stream=stream)
+            failed = response.status_code >= 500
+            return response
+        except requests.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+    def stats(self):
+        """
+        Return a snapshot of request counters and underlying connection pool state.
+        """
+        connections_opened = 0
+        requests_sent = 0
+        idle_connections = 0
+        # `pools` is a RecentlyUsedContainer keyed by (scheme, host, port)
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections_opened += pool.num_connections
+            requests_sent += pool.num_requests
+            if pool.pool is not None:
+                idle_connections += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        with self._lock:
+            return {
+                'url': self.url,
+                'pool_size': self.pool_size,
+                'requests': self._requests,
+                'errors': self._errors,
+                'in_flight': self._in_flight,
+                'connections_opened': connections_opened,
+                'connections_idle': idle_connections,
+                'pool_requests': requests_sent,
+                'breaker': self.breaker.stats(),
+            }
+
+    def close(self):
+        self.adapter.close()
+
+
+class AsyncResponse:
+    """
+    Daemon response read by `AsyncTransport`, quacking like `requests.Response` where `API` needs it.
+    """
+
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class AsyncTransport:
+    """
+    Non-blocking counterpart of `Transport` for use from a single event loop.
+    """
+
+    def __init__(self, url, pool_size=1000, connect_timeout=3.05, read_timeout=60, breaker=None):
+        self.url = url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.breaker = breaker or CircuitBreaker(url)
+        self._session = None
+        self._requests = 0
+        self._errors = 0
+        self._in_flight = 0
+
+    def __repr__(self):
+        return f'<AsyncTransport {self.url} (pool_size={self.pool_size})>'
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+            )
+        return self._session
+
+    async def post(self, payload, read_timeout=None):
+        if not self.breaker.allow():
+            raise exceptions.DaemonUnavailable(f'Daemon {self.url} is unavailable')
+        timeout = None
+        if read_timeout:
+            timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=read_timeout)
+        self._requests += 1
+        self._in_flight += 1
+        succeeded = None
+        try:
+            async with self.session.post(self.url, json=payload, timeout=timeout) as response:
+                succeeded = response.status < 500
+                return AsyncResponse(response.status, await response.json(content_type=None))
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            succeeded = False
+            self._errors += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            if succeeded is None:
+                # Cancelled, most likely because the client has gone, which says nothing about the daemon
+                self.breaker.release()
+            elif succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def stats(self):
+        connector = self._session.connector if self._session is not None else None
+        return {
+            'url': self.url,
+            'pool_size': self.pool_size,
+            'requests': self._requests,
+            'errors': self._errors,
+            'in_flight': self._in_flight,
+            'connections_idle': sum(len(conns) for conns in connector._conns.values()) if connector else 0,
+            'breaker': self.breaker.stats(),
+        }
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+# aiohttp sessions are bound to the event loop they were created in
+_async_transports = weakref.WeakKeyDictionary()
+
+
+def get_transport(url):
+    """
+    Return the process-wide transport for daemon `url`, creating it on first use.
+    """
+    transport = _transports.get(url)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(url)
+            if transport is None:
+                transport = Transport(
+                    url,
+                    pool_size=settings.LBRY_DAEMON_POOL_SIZE,
+                    connect_timeout=settings.LBRY_DAEMON_CONNECT_TIMEOUT,
+                    read_timeout=settings.LBRY_DAEMON_READ_TIMEOUT,
+                    breaker=get_breaker(url),
+                )
+                _transports[url] = transport
+                logger.debug('Created %s', transport)
+    return transport
+
+
+def get_async_transport(url):
+    """
+    Return the transport for daemon `url` bound to the running event loop, creating it on first use.
+    """
+    loop_transports = _async_transports.setdefault(asyncio.get_event_loop(), {})
+    transport = loop_transports.get(url)
+    if transport is None:
+        transport = loop_transports[url] = AsyncTransport(
+            url,
+            pool_size=settings.LBRY_DAEMON_ASYNC_POOL_SIZE,
+            connect_timeout=settings.LBRY_DAEMON_CONNECT_TIMEOUT,
+            read_timeout=settings.LBRY_DAEMON_READ_TIMEOUT,
+            breaker=get_breaker(url),
+        )
+        logger.debug('Created %s', transport)
+    return transport
+
+
+async def close_async_transports():
+    """
+    Close and forget transports bound to the running event loop, to be awaited before the loop is closed.
+    """
+    loop_transports = _async_transports.pop(asyncio.get_event_loop(), {})
+    for transport in loop_transports.values():
+        await transport.close()
+
+
+def get_stats():
+    stats = [transport.stats() for transport in list(_transports.values())]
+    for loop_transports in list(_async_transports.values()):
+        stats.extend(transport.stats() for transport in loop_transports.values())
+    return stats
+
+
+def reset():
+    """
+    Close and forget all transports and their circuit breakers. Mostly useful in tests and after forking.
+    """
+    with _transports_lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
+    # Async sessions can only be closed from their own loop (see `close_async_transports`),
+    # which may be gone already
+    _async_transports.clear()
+    reset_breakers()
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.generic import View
+
+from .metrics import CONTENT_TYPE, get_metrics
+
+
+class MetricsView(View):
+
+    def get(self, request, *args, **kwargs):
+        """
+        Serve daemon call metrics of all worker processes for Prometheus to scrape.
+
+        Requires `Authorization: Bearer <LBRY_METRICS_TOKEN>` header when the token is set.
+        """
+        if settings.LBRY_METRICS_TOKEN and not constant_time_compare(
+                request.headers.get('Authorization', ''), f'Bearer {settings.LBRY_METRICS_TOKEN}'):
+            return HttpResponseForbidden('Metrics token is missing or invalid')
+        return HttpResponse(get_metrics().render(), content_type=CONTENT_TYPE)
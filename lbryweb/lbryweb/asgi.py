@@ -0,0 +1,40 @@
+"""
+ASGI config for lbryweb project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Daemon proxy and publishing views are served by their asynchronous versions here,
+so slow daemon calls don't hold up a worker each. Run with an ASGI server, e.g.:
+
+    uvicorn lbryweb.asgi:application
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lbryweb.settings')
+os.environ.setdefault('LBRY_ASYNC_VIEWS', '1')
+
+django_application = get_asgi_application()
+
+from daemon.transport import close_async_transports  # noqa: E402 (needs settings configured above)
+
+
+async def application(scope, receive, send):
+    """
+    Django application that also handles lifespan events, which Django doesn't, so that sessions
+    kept by async transports in the server's event loop are closed on shutdown.
+    """
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_transports()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
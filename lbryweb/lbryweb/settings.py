@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.TracingMiddleware',
+    'main.middleware.CPUProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,6 +80,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'lbryweb.wsgi.application'
+ASGI_APPLICATION = 'lbryweb.asgi.application'
 
 
 # Database
@@ -94,6 +97,9 @@ DATABASES = {
     }
 }
 
+# Keep integer primary keys, BigAutoField would need migrations for every model
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -148,6 +154,9 @@ LOGGING = {
         'simple': {
             'format': '%(levelname)s %(asctime)s %(message)s'
         },
+        'json_lines': {
+            'format': '%(message)s'
+        },
     },
     'handlers': {
         'file': {
@@ -162,6 +171,13 @@ LOGGING = {
             'filename': 'daemon_profiling.log',
             'formatter': 'simple',
         },
+        'daemon_traces_file': {
+            'level': 'INFO',
+            'class': 'logging.FileHandler',
+            'filename': 'daemon_traces.log',
+            'formatter': 'json_lines',
+            'delay': True,
+        },
         'timber': {
             'level': 'DEBUG',
             'class': 'timber.TimberHandler',
@@ -191,10 +207,20 @@ LOGGING = {
             # 'level': 'DEBUG',
             'propagate': True,
         },
+        'daemon.tracing': {
+            'handlers': ['daemon_traces_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'storage.views': {
             'handlers': ['console'],
             'level': 'DEBUG',
             'propagate': True,
+        },
+        'storage.file_utils': {
+            'handlers': ['console'],
+            'level': 'DEBUG',
+            'propagate': True,
         }
     },
 }
@@ -203,6 +229,7 @@ STATIC_ROOT = os.path.join(BASE_DIR, '../static/')
 
 if 'test' in ' '.join(sys.argv):
     LOGGING['loggers']['daemon.api']['handlers'] = ['console']
+    LOGGING['loggers']['daemon.tracing']['handlers'] = []
 else:
     import sentry_sdk
     from sentry_sdk.integrations.django import DjangoIntegration
@@ -213,7 +240,9 @@ else:
     )
 
 # Default: for running code on your host machine and access daemon_test_local container from docker-compose
-LBRY_DAEMON = os.getenv('LBRY_DAEMON', 'http://localhost:5479/')
+# Can be a comma-separated list of daemons to spread accounts among, LBRY_DAEMON is then the first of them
+LBRY_DAEMONS = [url.strip() for url in os.getenv('LBRY_DAEMON', 'http://localhost:5479/').split(',') if url.strip()]
+LBRY_DAEMON = LBRY_DAEMONS[0]
 # Default: shared dir for daemon_test_local
 LBRY_DOWNLOAD_DIRECTORY = os.getenv(
     'LBRY_DOWNLOAD_DIRECTORY',
@@ -227,4 +256,155 @@ LBRY_PUBLISH_FEED = os.getenv(
     'LBRY_PUBLISH_FEED',
     '/storage/publish'
 )
+# Largest file accepted for publishing in bytes, uploads are broken off as soon as they exceed it. 0 for no limit
+LBRY_PUBLISH_MAX_SIZE = int(os.getenv('LBRY_PUBLISH_MAX_SIZE', 4 * 1024 * 1024 * 1024))
+# Seconds a resumable upload is kept after its last chunk, expired ones are deleted by the purge_uploads command
+LBRY_PUBLISH_UPLOAD_TTL = int(os.getenv('LBRY_PUBLISH_UPLOAD_TTL', 24 * 3600))
 LBRY_CONTENT_URL = os.getenv('LBRY_CONTENT_URL', 'http://localhost:8000/storage/content/')
+# Serve downloaded files through wsgi.file_wrapper, which has them sent by the kernel under servers that
+# send Content-Length bytes from the current position of the file with sendfile (gunicorn does)
+LBRY_CONTENT_SENDFILE = bool(int(os.getenv('LBRY_CONTENT_SENDFILE', 1)))
+# Have the front-end server send downloaded files after Django has checked the request: 'nginx' redirects
+# to LBRY_CONTENT_OFFLOAD_LOCATION, an internal location aliased to LBRY_DOWNLOAD_DIRECTORY (X-Accel-Redirect),
+# 'apache' passes the file path to mod_xsendfile (X-Sendfile). Empty to send them from Django
+LBRY_CONTENT_OFFLOAD = os.getenv('LBRY_CONTENT_OFFLOAD', '')
+LBRY_CONTENT_OFFLOAD_LOCATION = os.getenv('LBRY_CONTENT_OFFLOAD_LOCATION', '/protected-content/')
+# Requests for more ranges than this, left after overlapping ones are coalesced, get the whole file
+LBRY_CONTENT_MAX_RANGES = int(os.getenv('LBRY_CONTENT_MAX_RANGES', 20))
+# Cache-Control of downloads that are complete, which never change, and of those still in progress.
+# 'public' would let shared caches serve content to users who haven't logged in
+LBRY_CONTENT_CACHE_CONTROL = os.getenv('LBRY_CONTENT_CACHE_CONTROL', 'private, max-age=31536000, immutable')
+LBRY_CONTENT_INCOMPLETE_CACHE_CONTROL = os.getenv('LBRY_CONTENT_INCOMPLETE_CACHE_CONTROL', 'no-cache')
+# Descriptors of downloaded content (path, sizes and type) kept by each process, so that the range requests
+# of a player don't query the database, 0 to disable. Files are checked for changes on every request,
+# database fields are loaded again after LBRY_CONTENT_DESCRIPTOR_TTL secs
+LBRY_CONTENT_DESCRIPTOR_CACHE_SIZE = int(os.getenv('LBRY_CONTENT_DESCRIPTOR_CACHE_SIZE', 1000))
+LBRY_CONTENT_DESCRIPTOR_TTL = float(os.getenv('LBRY_CONTENT_DESCRIPTOR_TTL', 60))
+# Streams of files the daemon is still downloading wait for the bytes they need instead of padding them, and
+# break off once neither the file nor the download, checked every LBRY_CONTENT_FOLLOW_STATUS_INTERVAL secs
+# with file_list, has progressed for LBRY_CONTENT_FOLLOW_TIMEOUT secs. A waiting stream occupies its worker
+LBRY_CONTENT_FOLLOW = bool(int(os.getenv('LBRY_CONTENT_FOLLOW', 1)))
+LBRY_CONTENT_FOLLOW_TIMEOUT = float(os.getenv('LBRY_CONTENT_FOLLOW_TIMEOUT', 30))
+LBRY_CONTENT_FOLLOW_STATUS_INTERVAL = float(os.getenv('LBRY_CONTENT_FOLLOW_STATUS_INTERVAL', 2))
+# Largest reads when files are streamed by Python, shorter ranges are read in smaller blocks
+LBRY_CONTENT_BLOCK_SIZE = int(os.getenv('LBRY_CONTENT_BLOCK_SIZE', 1024 * 1024))
+# Tell the kernel streamed ranges are read sequentially and have it read LBRY_CONTENT_READAHEAD bytes
+# of them in advance (posix_fadvise)
+LBRY_CONTENT_FADVISE = bool(int(os.getenv('LBRY_CONTENT_FADVISE', 1)))
+LBRY_CONTENT_READAHEAD = int(os.getenv('LBRY_CONTENT_READAHEAD', 2 * 1024 * 1024))
+# Points each daemon gets on the hash ring assigning new accounts to daemons
+LBRY_DAEMON_VIRTUAL_NODES = int(os.getenv('LBRY_DAEMON_VIRTUAL_NODES', 100))
+# Seconds an account's daemon is remembered by each worker process without looking it up again
+LBRY_DAEMON_ROUTE_TTL = int(os.getenv('LBRY_DAEMON_ROUTE_TTL', 60))
+# Seconds a daemon that failed to connect is left out of calls not tied to an account
+LBRY_DAEMON_RETRY_INTERVAL = int(os.getenv('LBRY_DAEMON_RETRY_INTERVAL', 30))
+# Size of the keep-alive connection pool kept per daemon URL by each worker process
+LBRY_DAEMON_POOL_SIZE = int(os.getenv('LBRY_DAEMON_POOL_SIZE', 10))
+# Seconds to wait for a connection to the daemon to be established and for its response, respectively
+LBRY_DAEMON_CONNECT_TIMEOUT = float(os.getenv('LBRY_DAEMON_CONNECT_TIMEOUT', 3.05))
+LBRY_DAEMON_READ_TIMEOUT = float(os.getenv('LBRY_DAEMON_READ_TIMEOUT', 120))
+# Read timeouts overriding LBRY_DAEMON_READ_TIMEOUT for methods that are expected to be quick or slow
+LBRY_DAEMON_METHOD_TIMEOUTS = {
+    'status': 5,
+    'resolve': 10,
+    'claim_show': 10,
+    'claim_search': 15,
+    'account_balance': 15,
+    'get': 300,
+    'publish': 300,
+}
+# Consecutive failures after which calls to a daemon fail fast for LBRY_DAEMON_BREAKER_RESET_TIMEOUT seconds,
+# then a single call is let through to check whether it has recovered. 0 disables the breaker
+LBRY_DAEMON_BREAKER_FAILURES = int(os.getenv('LBRY_DAEMON_BREAKER_FAILURES', 5))
+LBRY_DAEMON_BREAKER_RESET_TIMEOUT = float(os.getenv('LBRY_DAEMON_BREAKER_RESET_TIMEOUT', 30))
+# Connection limit per daemon URL for async views, which can have many more calls in flight than threads
+LBRY_DAEMON_ASYNC_POOL_SIZE = int(os.getenv('LBRY_DAEMON_ASYNC_POOL_SIZE', 1000))
+# Serve daemon proxy and publish views by their async versions, set by lbryweb/asgi.py.
+# Django spools whole request bodies under ASGI, so publish uploads aren't streamed or cut off early there
+LBRY_ASYNC_VIEWS = bool(int(os.getenv('LBRY_ASYNC_VIEWS', 0)))
+# Maximum number of calls in a JSON-RPC batch sent to /api/proxy and how many of them run concurrently
+LBRY_PROXY_BATCH_MAX_SIZE = int(os.getenv('LBRY_PROXY_BATCH_MAX_SIZE', 100))
+LBRY_PROXY_BATCH_WORKERS = int(os.getenv('LBRY_PROXY_BATCH_WORKERS', 8))
+# List-returning methods whose responses are parsed and sent to the client item by item
+# instead of being loaded into memory as a whole. Not applied to async views
+LBRY_PROXY_STREAMING_METHODS = [
+    'file_list',
+]
+# Methods that can be run as background jobs polled at /api/jobs/<id>, by how many threads of each worker process
+# and for how many seconds job results are kept
+LBRY_JOB_METHODS = [
+    'get',
+]
+LBRY_JOB_WORKERS = int(os.getenv('LBRY_JOB_WORKERS', 4))
+LBRY_JOB_TTL = int(os.getenv('LBRY_JOB_TTL', 3600))
+# Seconds after which jobs that haven't finished are reported as failed, their worker process has most likely
+# been restarted or died
+LBRY_JOB_TIMEOUT = int(os.getenv('LBRY_JOB_TIMEOUT', 600))
+# Timings of daemon calls are saved in bulk once LBRY_PROFILER_FLUSH_SIZE of them are collected or every
+# LBRY_PROFILER_FLUSH_INTERVAL seconds, at most LBRY_PROFILER_BUFFER_SIZE of them are kept waiting
+LBRY_PROFILER_BUFFER_SIZE = int(os.getenv('LBRY_PROFILER_BUFFER_SIZE', 10000))
+LBRY_PROFILER_FLUSH_SIZE = int(os.getenv('LBRY_PROFILER_FLUSH_SIZE', 500))
+LBRY_PROFILER_FLUSH_INTERVAL = float(os.getenv('LBRY_PROFILER_FLUSH_INTERVAL', 5))
+LBRY_PROFILER_FLUSH_IN_BACKGROUND = True
+# Operations are aggregated into per-minute and per-hour rollups by the rollup_operations command, run it
+# periodically. Operations are kept for LBRY_OPERATION_RETENTION days and minute rollups for
+# LBRY_OPERATION_MINUTE_ROLLUP_RETENTION days, hour rollups are kept for good
+LBRY_OPERATION_RETENTION = int(os.getenv('LBRY_OPERATION_RETENTION', 7))
+LBRY_OPERATION_MINUTE_ROLLUP_RETENTION = int(os.getenv('LBRY_OPERATION_MINUTE_ROLLUP_RETENTION', 30))
+# Operations are rolled up once they have ended LBRY_PROFILER_FLUSH_INTERVAL + LBRY_OPERATION_ROLLUP_MARGIN
+# seconds ago, by then batches saved by all workers should have been committed
+LBRY_OPERATION_ROLLUP_MARGIN = float(os.getenv('LBRY_OPERATION_ROLLUP_MARGIN', 60))
+# Operations rolled up or deleted in a single transaction, to keep locks short
+LBRY_OPERATION_ROLLUP_BATCH_SIZE = int(os.getenv('LBRY_OPERATION_ROLLUP_BATCH_SIZE', 5000))
+# Spans of requests taking at least LBRY_TRACE_MIN_DURATION seconds, from authentication to serializing
+# the response, are written to daemon_traces.log as JSON lines
+LBRY_TRACING = bool(int(os.getenv('LBRY_TRACING', 1)))
+LBRY_TRACE_MIN_DURATION = float(os.getenv('LBRY_TRACE_MIN_DURATION', 1))
+# cProfile dumps of a LBRY_CPU_PROFILE_SAMPLE_RATE fraction of requests to LBRY_CPU_PROFILE_VIEWS and of those
+# with `X-Profile: <LBRY_CPU_PROFILE_TOKEN>` header are written to LBRY_CPU_PROFILE_DIR, oldest dumps are deleted
+# beyond LBRY_CPU_PROFILE_MAX_BYTES. Profiling is off unless a sample rate or a token is set
+LBRY_CPU_PROFILE_SAMPLE_RATE = float(os.getenv('LBRY_CPU_PROFILE_SAMPLE_RATE', 0))
+LBRY_CPU_PROFILE_TOKEN = os.getenv('LBRY_CPU_PROFILE_TOKEN', '')
+LBRY_CPU_PROFILE_VIEWS = ['api_proxy', 'content', 'content_outpoints']
+LBRY_CPU_PROFILE_DIR = os.getenv('LBRY_CPU_PROFILE_DIR', os.path.join(BASE_DIR, '../profiles/'))
+LBRY_CPU_PROFILE_MAX_BYTES = int(os.getenv('LBRY_CPU_PROFILE_MAX_BYTES', 100 * 1024 * 1024))
+# Latency histograms, error counts and in-flight gauges of daemon calls are served at /daemon/metrics.
+# Worker processes write them to LBRY_METRICS_DIR every LBRY_METRICS_WRITE_INTERVAL seconds to have them
+# added up (empty to serve metrics of the scraped process only), the directory should be emptied on deploy
+LBRY_METRICS_DIR = os.getenv('LBRY_METRICS_DIR', '')
+LBRY_METRICS_WRITE_INTERVAL = float(os.getenv('LBRY_METRICS_WRITE_INTERVAL', 5))
+# Upper bounds of latency histogram buckets in seconds and how many methods get metrics of their own
+LBRY_METRICS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+LBRY_METRICS_MAX_METHODS = int(os.getenv('LBRY_METRICS_MAX_METHODS', 100))
+# Bearer token required for scraping metrics, empty to leave them open
+LBRY_METRICS_TOKEN = os.getenv('LBRY_METRICS_TOKEN', '')
+# Cache for responses of idempotent daemon methods: 'locmem' (per process), 'django' (shared through
+# the Django cache named by LBRY_DAEMON_CACHE_ALIAS) or empty to disable
+LBRY_DAEMON_CACHE_BACKEND = os.getenv('LBRY_DAEMON_CACHE_BACKEND', 'locmem')
+LBRY_DAEMON_CACHE_ALIAS = os.getenv('LBRY_DAEMON_CACHE_ALIAS', 'default')
+LBRY_DAEMON_CACHE_MAX_BYTES = int(os.getenv('LBRY_DAEMON_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Seconds a response of each cacheable method stays fresh. Responses of LBRY_PROXY_STREAMING_METHODS
+# aren't cached (nor coalesced) by the sync proxy, which streams them. Only methods whose responses are the
+# same for every account are cached: responses of account-specific ones would be kept per account,
+# but nothing drops them when the account changes
+LBRY_DAEMON_CACHE_TTLS = {
+    'resolve': 60,
+    'claim_show': 60,
+    'claim_search': 30,
+}
+# Read-only methods for which identical concurrent calls share a single daemon request
+LBRY_DAEMON_COALESCED_METHODS = [
+    'resolve', 'claim_show', 'claim_search', 'status',
+]
+
+if 'test' in ' '.join(sys.argv):
+    # Tests mock daemon responses individually, cached ones would leak between them
+    LBRY_DAEMON_CACHE_BACKEND = ''
+    # Same for the state of circuit breakers
+    LBRY_DAEMON_BREAKER_FAILURES = 0
+    # Save timings right away, within the test transaction
+    LBRY_PROFILER_FLUSH_IN_BACKGROUND = False
+    # Rows of rolled back test transactions would be served from it
+    LBRY_CONTENT_DESCRIPTOR_CACHE_SIZE = 0
+    # Files shorter than reported are padded unless a test mocks the daemon for following their download
+    LBRY_CONTENT_FOLLOW = False
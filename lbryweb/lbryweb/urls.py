@@ -21,5 +21,6 @@ urlpatterns = [
     path('registration/', include('registration.urls')),
     path('users/', include('users.urls')),
     path('storage/', include('storage.urls')),
+    path('daemon/', include('daemon.urls')),
     path('', include('main.urls')),
 ]
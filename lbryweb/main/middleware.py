@@ -1,14 +1,138 @@
+import asyncio
+import cProfile
+import glob
 import logging
+import os
+import random
+import uuid
+from django.conf import settings
 from django.contrib.auth import authenticate, login
-from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.utils.deprecation import MiddlewareMixin
 
+from daemon import tracing
 from users.models import User
 
 
 logger = logging.getLogger(__name__)
 
 
+class TracingMiddleware(MiddlewareMixin):
+    """
+    Trace every request in a span enclosing all others, report its trace ID in X-Trace-Id header.
+    """
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with tracing.span('request', http_method=request.method, path=request.path) as span:
+            response = self.get_response(request)
+            span.set(status=response.status_code)
+        response['X-Trace-Id'] = span.trace_id
+        return response
+
+    async def __acall__(self, request):
+        with tracing.span('request', http_method=request.method, path=request.path) as span:
+            response = await self.get_response(request)
+            span.set(status=response.status_code)
+        response['X-Trace-Id'] = span.trace_id
+        return response
+
+
+class CPUProfilingMiddleware(MiddlewareMixin):
+    """
+    Profile a sample of requests to views named in `LBRY_CPU_PROFILE_VIEWS` with cProfile.
+
+    `LBRY_CPU_PROFILE_SAMPLE_RATE` of requests are profiled, as well as every request with
+    `X-Profile: <LBRY_CPU_PROFILE_TOKEN>` header. Profiles cover streaming of the response and are dumped
+    to `LBRY_CPU_PROFILE_DIR` as `<view name>.<HTTP method>.<time>.<id>.prof`, the oldest dumps are deleted
+    once they take more than `LBRY_CPU_PROFILE_MAX_BYTES`. Requests to async views are not profiled.
+    """
+    def __init__(self, get_response):
+        if not settings.LBRY_CPU_PROFILE_SAMPLE_RATE and not settings.LBRY_CPU_PROFILE_TOKEN:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        view_name = self.get_view_name(request)
+        if not view_name or not self.should_profile(request):
+            return self.get_response(request)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        file_name = f'{view_name}.{request.method}.{timezone.now():%Y%m%dT%H%M%S}.{uuid.uuid4().hex[:8]}.prof'
+        response['X-Profile-Dump'] = file_name
+        if response.streaming:
+            response.streaming_content = self.profile_streaming(profile, response.streaming_content, file_name)
+        else:
+            self.dump(profile, file_name)
+        return response
+
+    def get_view_name(self, request):
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+        if url_name in settings.LBRY_CPU_PROFILE_VIEWS:
+            return url_name
+
+    def should_profile(self, request):
+        token = settings.LBRY_CPU_PROFILE_TOKEN
+        if token and constant_time_compare(request.headers.get('X-Profile', ''), token):
+            return True
+        return random.random() < settings.LBRY_CPU_PROFILE_SAMPLE_RATE
+
+    def profile_streaming(self, profile, chunks, file_name):
+        chunks = iter(chunks)
+        try:
+            while True:
+                profile.enable()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    profile.disable()
+                yield chunk
+        finally:
+            self.dump(profile, file_name)
+
+    def dump(self, profile, file_name):
+        directory = settings.LBRY_CPU_PROFILE_DIR
+        try:
+            os.makedirs(directory, exist_ok=True)
+            profile.dump_stats(os.path.join(directory, file_name))
+            self.rotate(directory)
+        except OSError as exc:
+            logger.error('Could not dump profile %s: %s', file_name, exc)
+
+    def rotate(self, directory):
+        dumps = []
+        for path in glob.glob(os.path.join(directory, '*.prof')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Rotated by another process
+                continue
+            dumps.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in dumps)
+        for _, size, path in sorted(dumps):
+            if total_size <= settings.LBRY_CPU_PROFILE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
 class LbrynetAccountMiddleware(MiddlewareMixin):
     """
     Authenticate user by X-Lbrynet-Account-Id header
@@ -16,15 +140,16 @@ class LbrynetAccountMiddleware(MiddlewareMixin):
     def process_request(self, request):
         if not hasattr(request, 'user'):
             raise ImproperlyConfigured()
-        if request.user.is_authenticated:
-            return
-        try:
-            user = User.objects.get(account_id=request.META['HTTP_X_LBRYNET_ACCOUNT_ID'])
-        except (User.DoesNotExist, KeyError):
-            pass
-        else:
-            request.user = user
-            login(request, user)
+        with tracing.span('auth'):
+            if request.user.is_authenticated:
+                return
+            try:
+                user = User.objects.get(account_id=request.META['HTTP_X_LBRYNET_ACCOUNT_ID'])
+            except (User.DoesNotExist, KeyError):
+                pass
+            else:
+                request.user = user
+                login(request, user)
 
 
 class AccountIdCookieMiddleware(MiddlewareMixin):
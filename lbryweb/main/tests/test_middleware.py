@@ -0,0 +1,76 @@
+import os
+import pstats
+import tempfile
+from unittest.mock import patch
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import reverse
+
+from ..middleware import CPUProfilingMiddleware
+
+
+class CPUProfilingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.content_url = reverse('content', kwargs={'account_id': 'abc', 'uri': 'what'})
+        self.factory = RequestFactory()
+
+    def get_middleware(self, response_class=HttpResponse, *args):
+        return CPUProfilingMiddleware(lambda request: response_class(*args))
+
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            self.get_middleware()
+
+    @override_settings(LBRY_CPU_PROFILE_TOKEN='secret')
+    def test_token(self):
+        with self.settings(LBRY_CPU_PROFILE_DIR=self.directory.name):
+            middleware = self.get_middleware()
+            response = middleware(self.factory.get(self.content_url))
+            self.assertNotIn('X-Profile-Dump', response)
+            response = middleware(self.factory.get(self.content_url, HTTP_X_PROFILE='wrong'))
+            self.assertNotIn('X-Profile-Dump', response)
+            response = middleware(self.factory.get(self.content_url, HTTP_X_PROFILE='secret'))
+        file_name = response['X-Profile-Dump']
+        self.assertTrue(file_name.startswith('content.GET.'))
+        self.assertEqual(os.listdir(self.directory.name), [file_name])
+        pstats.Stats(os.path.join(self.directory.name, file_name))
+
+    @override_settings(LBRY_CPU_PROFILE_SAMPLE_RATE=0.5)
+    def test_sample_rate(self):
+        with self.settings(LBRY_CPU_PROFILE_DIR=self.directory.name):
+            middleware = self.get_middleware()
+            with patch('main.middleware.random.random', return_value=0.6):
+                response = middleware(self.factory.get(self.content_url))
+            self.assertNotIn('X-Profile-Dump', response)
+            with patch('main.middleware.random.random', return_value=0.4):
+                response = middleware(self.factory.post(reverse('api_proxy')))
+                self.assertTrue(response['X-Profile-Dump'].startswith('api_proxy.POST.'))
+                # Only listed views are profiled
+                response = middleware(self.factory.get(reverse('main')))
+                self.assertNotIn('X-Profile-Dump', response)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+    @override_settings(LBRY_CPU_PROFILE_SAMPLE_RATE=1)
+    def test_streaming(self):
+        with self.settings(LBRY_CPU_PROFILE_DIR=self.directory.name):
+            middleware = self.get_middleware(StreamingHttpResponse, iter([b'a', b'b']))
+            response = middleware(self.factory.get(self.content_url))
+            self.assertEqual(os.listdir(self.directory.name), [])
+            self.assertEqual(b''.join(response.streaming_content), b'ab')
+        self.assertEqual(os.listdir(self.directory.name), [response['X-Profile-Dump']])
+
+    @override_settings(LBRY_CPU_PROFILE_SAMPLE_RATE=1)
+    def test_rotate(self):
+        for index in range(3):
+            path = os.path.join(self.directory.name, f'content.GET.{index}.prof')
+            with open(path, 'wb') as dump_file:
+                dump_file.write(b'x' * 100)
+            os.utime(path, (index, index))
+        with self.settings(LBRY_CPU_PROFILE_DIR=self.directory.name, LBRY_CPU_PROFILE_MAX_BYTES=250):
+            CPUProfilingMiddleware(None).rotate(self.directory.name)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['content.GET.1.prof', 'content.GET.2.prof'])
@@ -1,13 +1,21 @@
 import json
+import uuid
+from datetime import timedelta
 from unittest.mock import patch
 
-from django.test import TestCase
+from aioresponses import aioresponses
+from django.test import TestCase, AsyncRequestFactory, override_settings
 from django.urls import reverse
 from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser
+from django.utils import timezone
 
 from daemon.api import API
+from daemon.models import ProxyJob
+from daemon.tests.test_transport import closing_async_transports
 from users.models import User
 from registration.daemon_plug import Account
+from ..views import AsyncAPIProxyView
 
 
 class MainViewTest(TestCase):
@@ -115,6 +123,43 @@ class APIProxyViewTest(TestCase):
         response = self.client.post(reverse('api_proxy'), '{}', content_type='application/json')
         self.assertEqual(response.status_code, 400, response.content)
 
+    def test_post_batch(self):
+        batch = [
+            {'jsonrpc': '2.0', 'method': 'resolve', 'params': {'urls': ['what']}, 'id': 1},
+            {'jsonrpc': '2.0', 'method': 'file_list', 'params': {}, 'id': 2},
+        ]
+        fake_daemon_response = [
+            {'jsonrpc': '2.0', 'id': 1, 'result': {}},
+            {'jsonrpc': '2.0', 'id': 2, 'error': {'code': -32000, 'message': 'Error'}},
+        ]
+        user = User.objects.create(username='test@lbry.io')
+        self.client.force_login(user)
+        with patch('daemon.api.API') as mock_proxy:
+            instance = mock_proxy.return_value
+            instance.proxy_batch.return_value = fake_daemon_response
+            response = self.client.post(reverse('api_proxy'), batch, content_type='application/json')
+            mock_proxy.assert_called_with(account_id=user.account_id)
+            instance.proxy_batch.assert_called_with(batch)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), fake_daemon_response)
+
+    def test_post_file_list_streamed(self):
+        query = {'jsonrpc': '2.0', 'method': 'file_list', 'params': {}, 'id': 1}
+        user = User.objects.create(username='test@lbry.io')
+        self.client.force_login(user)
+        with patch('daemon.api.API') as mock_proxy:
+            instance = mock_proxy.return_value
+            instance.proxy_stream.return_value = iter(['{"jsonrpc": "2.0", "result": [', '], "id": 1}'])
+            response = self.client.post(reverse('api_proxy'), query, content_type='application/json')
+            instance.proxy_stream.assert_called_with(query)
+            instance.proxy.assert_not_called()
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), {'jsonrpc': '2.0', 'result': [], 'id': 1})
+
+    def test_post_batch_empty(self):
+        response = self.client.post(reverse('api_proxy'), [], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
     def test_post_real(self):
         uri = 'what'
         query = {'method' :'get', 'params': {'uri': uri}}
@@ -128,3 +173,107 @@ class APIProxyViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         response_data = json.loads(response.content)
         self.assertTrue(response_data['result']['download_path'].startswith('http://'))
+
+
+class APIJobViewTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='test@lbry.io', account_id='abc')
+        self.query = {'method': 'get', 'params': {'uri': 'what'}}
+
+    def test_post_get_job(self):
+        self.client.force_login(self.user)
+        with patch('daemon.api.API.proxy') as mock_proxy:
+            response = self.client.post(
+                reverse('api_proxy'), self.query, content_type='application/json', HTTP_PREFER='respond-async')
+            mock_proxy.assert_not_called()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Preference-Applied'], 'respond-async')
+        response_data = json.loads(response.content)
+        job = ProxyJob.objects.get(pk=response_data['job_id'])
+        self.assertEqual((job.account_id, job.request), ('abc', self.query))
+        self.assertEqual(response_data['status'], ProxyJob.PENDING)
+        self.assertTrue(response_data['status_url'].endswith(reverse('api_job', kwargs={'job_id': job.pk})))
+
+    def test_post_get_job_anonymous(self):
+        response = self.client.post(
+            reverse('api_proxy'), self.query, content_type='application/json', HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ProxyJob.objects.exists())
+
+    def test_get(self):
+        job = ProxyJob.objects.create(
+            account_id='abc', request=self.query, expires=timezone.now() + timedelta(hours=1))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_job', kwargs={'job_id': job.pk}))
+        self.assertEqual(json.loads(response.content), {'job_id': str(job.pk), 'status': ProxyJob.PENDING})
+
+        job.status = ProxyJob.DONE
+        job.response = {'jsonrpc': '2.0', 'result': {'download_path': 'http://'}}
+        job.save()
+        response = self.client.get(reverse('api_job', kwargs={'job_id': job.pk}))
+        self.assertEqual(json.loads(response.content)['response'], job.response)
+
+    @override_settings(LBRY_JOB_TIMEOUT=60)
+    def test_get_lost(self):
+        job = ProxyJob.objects.create(
+            account_id='abc', request=self.query, expires=timezone.now() + timedelta(hours=1),
+            created=timezone.now() - timedelta(seconds=61), status=ProxyJob.RUNNING)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_job', kwargs={'job_id': job.pk}))
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['status'], ProxyJob.FAILED)
+        self.assertTrue(response_data['error'])
+
+    def test_get_not_found(self):
+        job = ProxyJob.objects.create(
+            account_id='abc', request=self.query, expires=timezone.now() + timedelta(hours=1))
+        expired_job = ProxyJob.objects.create(account_id='abc', request=self.query, expires=timezone.now())
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_job', kwargs={'job_id': expired_job.pk}))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('api_job', kwargs={'job_id': uuid.uuid4()}))
+        self.assertEqual(response.status_code, 404)
+        # Jobs of other accounts are not visible
+        self.client.force_login(User.objects.create(username='other@lbry.io', account_id='def'))
+        response = self.client.get(reverse('api_job', kwargs={'job_id': job.pk}))
+        self.assertEqual(response.status_code, 404)
+
+
+@closing_async_transports
+class AsyncAPIProxyViewTest(TestCase):
+
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.view = AsyncAPIProxyView.as_view()
+
+    async def test_post(self):
+        request = self.factory.post(
+            '/api/proxy', {'method': 'account_balance'}, content_type='application/json')
+        request.user = User(username='test@lbry.io', account_id='abc')
+        with aioresponses() as daemon_mock:
+            daemon_mock.post(API.url, payload={'id': None, 'jsonrpc': '2.0', 'result': 1.0})
+            response = await self.view(request)
+            (_, daemon_request), = daemon_mock.requests.items()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['result'], 1.0)
+        self.assertEqual(daemon_request[0].kwargs['json']['params'], {'account_id': 'abc'})
+
+    async def test_post_get_anonymous(self):
+        request = self.factory.post(
+            '/api/proxy', {'method': 'get', 'params': {'uri': 'what'}}, content_type='application/json')
+        request.user = AnonymousUser()
+        response = await self.view(request)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_post_malformed(self):
+        request = self.factory.post('/api/proxy', 'zzz{}', content_type='application/json')
+        request.user = AnonymousUser()
+        response = await self.view(request)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_get_not_allowed(self):
+        request = self.factory.get('/api/proxy')
+        request.user = AnonymousUser()
+        response = await self.view(request)
+        self.assertEqual(response.status_code, 405)
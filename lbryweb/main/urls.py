@@ -1,11 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 
 from . import views
 
 
+if settings.LBRY_ASYNC_VIEWS:
+    APIProxyView = views.AsyncAPIProxyView
+else:
+    APIProxyView = views.APIProxyView
+
 urlpatterns = [
     path('', views.MainView.as_view(), name='main'),
-    path('api/proxy', csrf_exempt(views.APIProxyView.as_view()), name='api_proxy'),
+    path('api/proxy', csrf_exempt(APIProxyView.as_view()), name='api_proxy'),
+    path('api/jobs/<uuid:job_id>', views.APIJobView.as_view(), name='api_job'),
     path('app/', views.AppView.as_view(), name='app'),
 ]
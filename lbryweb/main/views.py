@@ -1,16 +1,36 @@
 import json
+import asyncio
 import logging
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.decorators import classonlymethod
 from django.views.generic import View, TemplateView
-from django.shortcuts import redirect
-from django.http import HttpResponseForbidden, JsonResponse, HttpResponseBadRequest
+from django.shortcuts import redirect, get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.http import (
+    HttpResponse, HttpResponseForbidden, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+)
 
-from daemon import api
+from daemon import api, exceptions, jobs, tracing
+from daemon.models import ProxyJob
 
 
 logger = logging.getLogger(__name__)
 
 
+def service_unavailable(exc):
+    response = HttpResponse(f'Proxy exception: {exc}', status=503)
+    response['Retry-After'] = int(settings.LBRY_DAEMON_BREAKER_RESET_TIMEOUT)
+    return response
+
+
+def get_account_id(request):
+    if request.user.is_authenticated:
+        return request.user.account_id
+
+
 class MainView(TemplateView):
     template_name = 'main.html'
 
@@ -19,23 +39,158 @@ class APIProxyView(View):
 
     def post(self, request, *args, **kwargs):
         """
-        A view for proxying web app requests to internal daemon instance
+        A view for proxying web app requests to internal daemon instance.
+
+        Accepts either a single JSON-RPC call or a JSON-RPC 2.0 batch (an array of calls).
+        Responses of methods listed in `LBRY_PROXY_STREAMING_METHODS` are streamed,
+        calls of methods listed in `LBRY_JOB_METHODS` are run in the background when asked by
+        `Prefer: respond-async` header.
         """
+        parsed_data, error_response = self.decode(request)
+        if error_response:
+            return error_response
+        api_client = api.API(account_id=get_account_id(request))
+        if isinstance(parsed_data, list):
+            return self.post_batch(api_client, parsed_data)
+        if self.wants_job(request, parsed_data):
+            return self.post_job(request, api_client, parsed_data)
+        if isinstance(parsed_data, dict) and parsed_data.get('method') in settings.LBRY_PROXY_STREAMING_METHODS:
+            return self.post_streaming(api_client, parsed_data)
         try:
-            parsed_data = json.loads(request.body)
+            response, _ = api_client.proxy(parsed_data)
+        except Exception as exc:
+            return self.proxy_error_response(parsed_data, exc)
+        return self.serialize(response)
+
+    def decode(self, request):
+        """
+        Return client JSON-RPC payload, or an error response in its place if it isn't valid JSON.
+        """
+        try:
+            with tracing.span('decode'):
+                return json.loads(request.body), None
         except json.JSONDecodeError as exc:
             logger.error('Exception while decoding client json: %s', exc)
-            return HttpResponseBadRequest('Malformed JSON')
-        if request.user.is_authenticated:
-            api_client = api.API(account_id=request.user.account_id)
-        else:
-            api_client = api.API()
+            return None, HttpResponseBadRequest('Malformed JSON')
+
+    def serialize(self, response, safe=True):
+        with tracing.span('serialize'):
+            return JsonResponse(response, safe=safe)
+
+    def proxy_error_response(self, parsed_data, exc):
+        if isinstance(exc, exceptions.DaemonUnavailable):
+            logger.warning('Daemon unavailable for proxied request (%s): %s', parsed_data, exc)
+            return service_unavailable(exc)
+        logger.error('Exception while proxying request (%s): %s', parsed_data, exc)
+        return HttpResponseBadRequest(f'Proxy exception: {exc}')
+
+    def post_streaming(self, api_client, parsed_data):
         try:
-            response, _ = api_client.proxy(parsed_data)
+            chunks = api_client.proxy_stream(parsed_data)
         except Exception as exc:
-            logger.error('Exception while proxying request (%s): %s', parsed_data, exc)
+            return self.proxy_error_response(parsed_data, exc)
+        return StreamingHttpResponse(chunks, content_type='application/json')
+
+    def wants_job(self, request, parsed_data):
+        return (
+            isinstance(parsed_data, dict) and parsed_data.get('method') in settings.LBRY_JOB_METHODS and
+            'respond-async' in request.headers.get('Prefer', '')
+        )
+
+    def post_job(self, request, api_client, parsed_data):
+        """
+        Start a background job for the call and respond with the URL to poll for its outcome.
+        """
+        try:
+            api_client.validate_account()
+        except exceptions.AccountMissing as exc:
             return HttpResponseBadRequest(f'Proxy exception: {exc}')
-        return JsonResponse(response)
+        job = jobs.submit(api_client.account_id, parsed_data)
+        status_url = reverse('api_job', kwargs={'job_id': job.pk})
+        response = JsonResponse({
+            'job_id': str(job.pk),
+            'status': job.status,
+            'status_url': request.build_absolute_uri(status_url),
+        }, status=202)
+        response['Location'] = status_url
+        response['Preference-Applied'] = 'respond-async'
+        return response
+
+    def post_batch(self, api_client, batch):
+        error_response = self.validate_batch(batch)
+        if error_response:
+            return error_response
+        return self.serialize(api_client.proxy_batch(batch), safe=False)
+
+    def validate_batch(self, batch):
+        if not batch:
+            return HttpResponseBadRequest('Empty batch')
+        if len(batch) > settings.LBRY_PROXY_BATCH_MAX_SIZE:
+            return HttpResponseBadRequest(f'Batch is limited to {settings.LBRY_PROXY_BATCH_MAX_SIZE} calls')
+
+
+class AsyncView(View):
+    """
+    Base for class-based views with coroutine handlers, which Django doesn't detect by itself before 4.1.
+    """
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Make the request handler await the view instead of running it in a thread
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        return super().http_method_not_allowed(request, *args, **kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+
+class AsyncAPIProxyView(AsyncView, APIProxyView):
+    """
+    Version of `APIProxyView` that doesn't occupy a worker while waiting for the daemon, served under ASGI.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        parsed_data, error_response = self.decode(request)
+        if error_response:
+            return error_response
+        api_client = api.AsyncAPI(account_id=await sync_to_async(get_account_id)(request))
+        if isinstance(parsed_data, list):
+            return await self.post_batch(api_client, parsed_data)
+        if self.wants_job(request, parsed_data):
+            return await sync_to_async(self.post_job)(request, api_client, parsed_data)
+        try:
+            response, _ = await api_client.proxy(parsed_data)
+        except Exception as exc:
+            return self.proxy_error_response(parsed_data, exc)
+        return self.serialize(response)
+
+    async def post_batch(self, api_client, batch):
+        error_response = self.validate_batch(batch)
+        if error_response:
+            return error_response
+        return self.serialize(await api_client.proxy_batch(batch), safe=False)
+
+
+class APIJobView(View):
+
+    def get(self, request, job_id, *args, **kwargs):
+        """
+        Report status of a background job of the account, along with its outcome once it has finished.
+        """
+        job = get_object_or_404(
+            ProxyJob, pk=job_id, account_id=get_account_id(request) or '', expires__gt=timezone.now())
+        if not job.is_finished and jobs.fail_lost_jobs(ProxyJob.objects.filter(pk=job.pk)):
+            job.refresh_from_db()
+        job_data = {'job_id': str(job.pk), 'status': job.status}
+        if job.status == ProxyJob.DONE:
+            job_data['response'] = job.response
+        elif job.status == ProxyJob.FAILED:
+            job_data['error'] = job.error
+        return JsonResponse(job_data)
 
 
 class AppView(TemplateView):
@@ -1,6 +1,9 @@
 import logging
 
+from django.conf import settings
+
 from daemon.api import API
+from daemon.routing import get_router
 
 
 logger = logging.getLogger(__name__)
@@ -17,12 +20,21 @@ class Account:
         self.user = user
         self.api = API()
 
+    @property
+    def daemon_url(self):
+        """
+        URL of the daemon holding account wallet, accounts registered before there were several are on the first.
+        """
+        return (self.user.account_data or {}).get('daemon_url') or settings.LBRY_DAEMON
+
     def register(self):
         self.user.refresh_from_db()
         if self.user.is_bound:
             raise AccountAlreadyExists
-        account_data = self.api.call('account_create', account_name=self.user.username)
+        daemon_url = get_router().daemon_for_key(self.user.username)
+        account_data = API(url=daemon_url).call('account_create', account_name=self.user.username)
         assert account_data['status'] == 'created'
+        account_data['daemon_url'] = daemon_url
         self.user.account_id = account_data['id']
         self.user.account_data = account_data
         self.user.save()
@@ -31,10 +43,38 @@ class Account:
         assert self.user.is_bound
         response = self.api.call('account_remove', account_id=self.user.account_id)
         assert response['status'] == 'removed'
+        get_router().forget_account(self.user.account_id)
         self.user.account_id = ''
         self.user.account_data = None
         self.user.save()
 
+    def move(self, daemon_url):
+        """
+        Add account wallet to another daemon and route the account there, return URL of the daemon it was on.
+
+        Worker processes keep sending calls of the account to the old daemon until their routes expire,
+        so the wallet is left there, remove it with `remove_from` once `LBRY_DAEMON_ROUTE_TTL` has passed.
+        Files downloaded by the account are only known to the old daemon.
+        """
+        assert self.user.is_bound
+        source_url = self.daemon_url
+        details = API(url=source_url).call('account_list', account_id=self.user.account_id, show_seed=True)
+        added = API(url=daemon_url).call('account_add', account_name=details['name'], seed=details['seed'])
+        assert added['id'] == self.user.account_id
+        self.user.account_data = dict(self.user.account_data or {}, daemon_url=daemon_url)
+        self.user.save()
+        get_router().forget_account(self.user.account_id)
+        logger.info('Moved account %s from %s to %s', self.user.account_id, source_url, daemon_url)
+        return source_url
+
+    def remove_from(self, daemon_url):
+        """
+        Remove account wallet from a daemon it has been moved away from.
+        """
+        assert self.user.is_bound and daemon_url != self.daemon_url
+        response = API(url=daemon_url).call('account_remove', account_id=self.user.account_id)
+        assert response['status'] == 'removed'
+
     def get_details(self):
         assert self.user.is_bound
         return self.api.call('account_list', account_id=self.user.account_id)
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from daemon.exceptions import DaemonException
+from daemon.routing import get_router
+from storage.models import Content
+from users.models import User
+from registration.daemon_plug import Account
+
+
+class Command(BaseCommand):
+    help = (
+        'Move account wallets to daemons the hash ring assigns them to, '
+        'run after daemons have been added to or removed from LBRY_DAEMON. Accounts that have downloaded '
+        'files are left where they are, their daemons are the only ones knowing the files.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true', help='Only list accounts that would be moved')
+
+    def handle(self, *args, **options):
+        router = get_router()
+        moved = []
+        skipped = failed = 0
+        for user in User.objects.exclude(account_id='').order_by('pk').iterator():
+            account = Account(user)
+            daemon_url = router.daemon_for_key(user.username)
+            if account.daemon_url == daemon_url:
+                continue
+            if Content.objects.filter(downloaded_by=user).exists():
+                self.stderr.write(f'Not moving {user.account_id}, it has downloaded files on {account.daemon_url}')
+                skipped += 1
+                continue
+            self.stdout.write(f'{user.username} ({user.account_id}): {account.daemon_url} -> {daemon_url}')
+            if options['dry_run']:
+                moved.append((account, account.daemon_url))
+                continue
+            try:
+                moved.append((account, account.move(daemon_url)))
+            except (DaemonException, AssertionError) as exc:
+                self.stderr.write(f'Failed to move {user.account_id}: {exc!r}')
+                failed += 1
+        if moved and not options['dry_run']:
+            # Workers send calls to the old daemons until the routes they remember expire
+            self.stdout.write(f'Waiting {settings.LBRY_DAEMON_ROUTE_TTL} secs before removing moved wallets')
+            time.sleep(settings.LBRY_DAEMON_ROUTE_TTL)
+            for account, source_url in moved:
+                try:
+                    account.remove_from(source_url)
+                except (DaemonException, AssertionError) as exc:
+                    self.stderr.write(f'Failed to remove {account.user.account_id} from {source_url}: {exc!r}')
+        verb = 'would be moved' if options['dry_run'] else 'moved'
+        self.stdout.write(f'{len(moved)} accounts {verb}, {skipped} skipped, {failed} failed')
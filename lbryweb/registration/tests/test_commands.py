@@ -0,0 +1,92 @@
+import json
+from io import StringIO
+from unittest import mock
+
+import responses
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from daemon import routing
+from storage.models import Content
+from users.models import User
+
+
+DAEMONS = ['http://daemon1:5279/', 'http://daemon2:5279/']
+
+
+@override_settings(LBRY_DAEMONS=DAEMONS)
+class RebalanceDaemonsTest(TestCase):
+
+    def setUp(self):
+        self.wallets = {daemon: {} for daemon in DAEMONS}
+        for daemon in DAEMONS:
+            responses.add_callback(responses.POST, daemon, callback=self.daemon_callback(daemon))
+        for index in range(10):
+            account_id = f'account{index}'
+            User.objects.create(
+                username=f'user{index}@lbry.io', account_id=account_id,
+                account_data={'id': account_id, 'daemon_url': DAEMONS[0]})
+            self.wallets[DAEMONS[0]][account_id] = {'id': account_id, 'name': f'user{index}', 'seed': account_id}
+
+    def tearDown(self):
+        routing.reset()
+
+    def daemon_callback(self, daemon):
+        wallets = self.wallets[daemon]
+
+        def callback(request):
+            payload = json.loads(request.body)
+            params = payload['params']
+            if payload['method'] == 'account_list':
+                result = wallets[params['account_id']]
+            elif payload['method'] == 'account_add':
+                result = wallets[params['seed']] = {'id': params['seed'], 'name': params['account_name']}
+            elif payload['method'] == 'account_remove':
+                del wallets[params['account_id']]
+                result = {'status': 'removed'}
+            return (200, {}, json.dumps({'jsonrpc': '2.0', 'id': None, 'result': result}))
+        return callback
+
+    def expected_daemons(self):
+        router = routing.get_router()
+        return {user.account_id: router.daemon_for_key(user.username) for user in User.objects.all()}
+
+    @responses.activate
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('rebalance_daemons', dry_run=True, stdout=out)
+        to_move = [account_id for account_id, daemon in self.expected_daemons().items() if daemon != DAEMONS[0]]
+        self.assertTrue(to_move)
+        self.assertIn(f'{len(to_move)} accounts would be moved', out.getvalue())
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_rebalance(self):
+        def wait(seconds):
+            # Moved accounts are on both daemons meanwhile
+            self.assertEqual(seconds, 60)
+            self.assertEqual(len(self.wallets[DAEMONS[0]]), 10)
+
+        with self.settings(LBRY_DAEMON_ROUTE_TTL=60), \
+                mock.patch('registration.management.commands.rebalance_daemons.time.sleep', side_effect=wait) as sleep:
+            call_command('rebalance_daemons', stdout=StringIO())
+        sleep.assert_called_once()
+        for account_id, daemon in self.expected_daemons().items():
+            self.assertIn(account_id, self.wallets[daemon])
+            self.assertEqual(User.objects.get(account_id=account_id).account_data['daemon_url'], daemon)
+            self.assertEqual(routing.get_router().daemon_for_account(account_id), daemon)
+        self.assertEqual(sum(len(wallets) for wallets in self.wallets.values()), 10)
+
+    @responses.activate
+    def test_accounts_with_downloads_left(self):
+        account_id, daemon = next(
+            (account_id, daemon) for account_id, daemon in self.expected_daemons().items() if daemon != DAEMONS[0])
+        Content.objects.create(
+            downloaded_by=User.objects.get(account_id=account_id), file_name='what.mp4', uri='what',
+            claim_name='what', outpoint='abc:0', lbrynet_data={})
+        err = StringIO()
+        with mock.patch('registration.management.commands.rebalance_daemons.time.sleep'):
+            call_command('rebalance_daemons', stdout=StringIO(), stderr=err)
+        self.assertIn(f'Not moving {account_id}', err.getvalue())
+        self.assertIn(account_id, self.wallets[DAEMONS[0]])
+        self.assertNotIn(account_id, self.wallets[daemon])
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# What serving a content file takes: `size` is the one reported by the daemon, `real_size` the one on disk,
+# `account_id` the one of the account that downloaded it, whose daemon has the file
+ContentDescriptor = namedtuple('ContentDescriptor', [
+    'outpoint', 'account_id', 'file_name', 'path', 'size', 'real_size', 'mtime', 'mtime_ns', 'mime_type'])
+
+
+def describe(content_instance, file_stat):
+    return ContentDescriptor(
+        outpoint=content_instance.outpoint,
+        account_id=content_instance.downloaded_by.account_id,
+        file_name=content_instance.file_name,
+        path=content_instance.get_physical_file(),
+        size=content_instance.lbrynet_data['total_bytes'],
+        real_size=file_stat.st_size,
+        mtime=file_stat.st_mtime,
+        mtime_ns=file_stat.st_mtime_ns,
+        mime_type=content_instance.get_mime_type(),
+    )
+
+
+class DescriptorCache:
+    """
+    In-process LRU of content descriptors keyed by the field views look content up by, at most `max_size` of them.
+
+    A hit costs a single stat of the file, descriptors of files that have changed on disk are refreshed from it.
+    Database fields are loaded again once an entry has been invalidated or is older than `ttl` seconds,
+    which bounds how long changes made by other processes go unnoticed.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        # Bumped on invalidation so that descriptors loaded before it aren't cached
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, field, value, load):
+        """
+        Return descriptor of the content with `field` equal to `value`, calling `load` for the Content
+        object on misses. Exceptions raised by `load` and by stat'ing the file are propagated.
+        """
+        key = (field, value)
+        with self._lock:
+            generation = self._generation
+            loaded, descriptor = self._data.get(key, (None, None))
+            if descriptor is not None and self.ttl is not None and loaded + self.ttl < time.monotonic():
+                descriptor = None
+            if descriptor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+        if descriptor is None:
+            content_instance = load()
+            descriptor = describe(content_instance, content_instance.get_physical_file().stat())
+            loaded = time.monotonic()
+        else:
+            try:
+                file_stat = descriptor.path.stat()
+            except OSError:
+                self.pop(key)
+                raise
+            if (file_stat.st_size, file_stat.st_mtime_ns) != (descriptor.real_size, descriptor.mtime_ns):
+                logger.debug('File of %s has changed', descriptor.outpoint)
+                descriptor = descriptor._replace(
+                    real_size=file_stat.st_size, mtime=file_stat.st_mtime, mtime_ns=file_stat.st_mtime_ns)
+        with self._lock:
+            if self.max_size and generation == self._generation:
+                self._data[key] = (loaded, descriptor)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+        return descriptor
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self, outpoint=None, uri=None):
+        """
+        Drop descriptors of the content with `outpoint` and any looked up by `uri`.
+        """
+        with self._lock:
+            self._generation += 1
+            for key, (_, descriptor) in list(self._data.items()):
+                if descriptor.outpoint == outpoint or key == ('uri', uri):
+                    del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+
+def get_cache():
+    """
+    Return the process-wide content descriptor cache configured by settings.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DescriptorCache(
+                    settings.LBRY_CONTENT_DESCRIPTOR_CACHE_SIZE, ttl=settings.LBRY_CONTENT_DESCRIPTOR_TTL)
+    return _cache
+
+
+def reset():
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+@receiver(setting_changed)
+def reset_on_setting_changed(setting, **kwargs):
+    # Paths of descriptors depend on the download directory
+    if setting.startswith('LBRY_CONTENT_DESCRIPTOR_') or setting == 'LBRY_DOWNLOAD_DIRECTORY':
+        reset()
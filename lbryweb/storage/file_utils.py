@@ -1,5 +1,7 @@
+import logging
 import os
 import re
+import time
 import mimetypes
 
 from wsgiref.util import FileWrapper
@@ -7,16 +9,38 @@ from django.http import StreamingHttpResponse
 
 
 range_re = re.compile(r'bytes\s*=\s*(\d+)\s*-\s*(\d*)', re.I)
+range_spec_re = re.compile(r'^(\d*)\s*-\s*(\d*)$', re.A)
+
+logger = logging.getLogger(__name__)
+
+# Ranges are read in about BLOCKS_PER_RANGE blocks, none smaller than MIN_BLOCK_SIZE
+MIN_BLOCK_SIZE = 8192
+BLOCKS_PER_RANGE = 8
 
 
 class RangeFileWrapper(object):
-    def __init__(self, filelike, blksize=8192, offset=0, length=None):
+    """
+    Iterate over `length` bytes of a file from `offset` on, in blocks of `blksize` bytes.
+
+    With `readahead` set the kernel is told the range will be read sequentially and asked to start
+    reading its first `readahead` bytes. Bytes and reads are counted and logged when it's closed.
+
+    Bytes missing from the file are padded, unless `follow` (see `DownloadFollower`) tells they are yet to be
+    written, then they are waited for.
+    """
+    def __init__(self, filelike, blksize=8192, offset=0, length=None, readahead=None, follow=None):
         self.filelike = filelike
         self.filelike.seek(offset, os.SEEK_SET)
         self.remaining = length
         self.blksize = blksize
+        self.follow = follow
+        self.bytes_read = 0
+        self.reads = 0
+        if readahead is not None:
+            advise_sequential(filelike, offset, length, readahead)
 
     def close(self):
+        logger.debug('Streamed %s bytes in %s reads of up to %s bytes', self.bytes_read, self.reads, self.blksize)
         if hasattr(self.filelike, 'close'):
             self.filelike.close()
 
@@ -27,32 +51,244 @@ class RangeFileWrapper(object):
         if self.remaining is None:
             # If remaining is None, we're reading the entire file.
             data = self.filelike.read(self.blksize)
-            if data:
-                return data
-            raise StopIteration()
+            if not data:
+                raise StopIteration()
         elif self.remaining <= 0:
             raise StopIteration()
         else:
             data = self.filelike.read(min(self.remaining, self.blksize))
+            while not data and self.follow is not None and self.follow(self.filelike):
+                data = self.filelike.read(min(self.remaining, self.blksize))
             if not data:
                 # Pad this to work around extra bytes reported by lbrynet
-                data = self.remaining * b'0'
+                data = min(self.remaining, self.blksize) * b'0'
             self.remaining -= len(data)
-            return data
+        self.bytes_read += len(data)
+        self.reads += 1
+        return data
 
 
-def parse_range_header(range_header, file_size):
-    range_header = range_header.strip()
-    range_match = range_re.match(range_header)
-    if range_match:
+def get_block_size(length, max_block_size):
+    """
+    Return size of blocks to read `length` bytes in, a power of two from MIN_BLOCK_SIZE up to `max_block_size`.
+
+    Short ranges, like those players request when seeking, are read in small blocks so that the first of them
+    goes out sooner, long ones in blocks as large as allowed to take fewer iterations.
+    """
+    block_size = MIN_BLOCK_SIZE
+    while (length is None or block_size * BLOCKS_PER_RANGE < length) and block_size < max_block_size:
+        block_size *= 2
+    return min(block_size, max_block_size)
+
+
+def advise_sequential(filelike, offset, length, readahead):
+    """
+    Tell the kernel a range of the file will be read sequentially and ask it to read
+    the first `readahead` bytes in advance. Does nothing where posix_fadvise isn't available.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        file_descriptor = filelike.fileno()
+        os.posix_fadvise(file_descriptor, offset, length or 0, os.POSIX_FADV_SEQUENTIAL)
+        if readahead:
+            os.posix_fadvise(
+                file_descriptor, offset, min(length, readahead) if length else readahead, os.POSIX_FADV_WILLNEED)
+    except (AttributeError, OSError) as exc:
+        # Not backed by a file descriptor or the file system doesn't take hints
+        logger.debug('No read-ahead hints for %s: %s', filelike, exc)
+
+
+class DownloadStalled(IOError):
+    """
+    File being downloaded hasn't grown for too long to keep waiting for it.
+    """
+
+
+class DownloadFollower(object):
+    """
+    Wait for a file that the daemon is still downloading to grow.
+
+    Called with the file once its end is reached, polls its size sleeping `min_interval` secs at first and
+    twice longer each time up to `max_interval`. Returns True once it has grown and False if the download
+    is over, bytes the daemon reported but didn't write can't be waited for then. Raises `DownloadStalled`
+    when neither the file nor the download has progressed for `timeout` secs or the download was stopped.
+
+    Download progress is checked every `status_interval` secs with `get_status`, which returns the `file_list`
+    item of the file or None when it can't be told.
+    """
+    def __init__(self, get_status, timeout=30, min_interval=0.05, max_interval=1, status_interval=2):
+        self.get_status = get_status
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.status_interval = status_interval
+        self.written_bytes = None
+        self.waits = 0
+        self._status_checked = None
+
+    def __call__(self, filelike):
+        position = filelike.tell()
+        interval = self.min_interval
+        progressed = time.monotonic()
+        while True:
+            if os.fstat(filelike.fileno()).st_size > position:
+                return True
+            now = time.monotonic()
+            if self._status_checked is None or now - self._status_checked >= self.status_interval:
+                self._status_checked = now
+                status = self.get_status()
+                if status is not None:
+                    if status.get('completed') or status.get('status') == 'finished':
+                        # Might have been written since the size was checked
+                        return os.fstat(filelike.fileno()).st_size > position
+                    if status.get('status') == 'stopped':
+                        raise DownloadStalled(f'Download stopped at {status.get("written_bytes")} bytes')
+                    if status.get('written_bytes') != self.written_bytes:
+                        self.written_bytes = status.get('written_bytes')
+                        progressed = now
+            if now - progressed >= self.timeout:
+                raise DownloadStalled(f'File has been at {position} bytes for {self.timeout} secs')
+            self.waits += 1
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_interval)
+
+
+class FileRange(object):
+    """
+    File-like view of `length` bytes of an open file from `offset` on.
+
+    The file is positioned at `offset` and its descriptor is exposed, so a WSGI server whose
+    `wsgi.file_wrapper` uses sendfile has the kernel send the range straight from the page cache.
+    Reads are limited to the range for servers that read the file instead.
+    """
+    def __init__(self, filelike, offset=0, length=None):
+        self.filelike = filelike
+        self.filelike.seek(offset, os.SEEK_SET)
+        self.remaining = length
+
+    def fileno(self):
+        return self.filelike.fileno()
+
+    def read(self, size=-1):
+        if self.remaining is None:
+            return self.filelike.read(size)
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.filelike.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.filelike.close()
+
+
+def parse_ranges(range_header, size, max_ranges=None):
+    """
+    Parse Range header for a representation of `size` bytes as specified by RFC 7233.
+
+    Returns None when the header should be ignored: it's missing, malformed, not in bytes
+    or asks for more than `max_ranges` ranges. Otherwise returns satisfiable ranges as sorted
+    (first byte, last byte) pairs, with overlapping and adjacent ones coalesced,
+    which is an empty list when none of them can be satisfied.
+    """
+    unit, _, range_set = range_header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    for range_spec in range_set.split(','):
+        range_spec = range_spec.strip()
+        if not range_spec:
+            # Empty list elements are allowed
+            continue
+        range_match = range_spec_re.match(range_spec)
+        if not range_match or range_match.groups() == ('', ''):
+            return None
         first_byte, last_byte = range_match.groups()
-        first_byte = int(first_byte) if first_byte else 0
-        last_byte = int(last_byte) if last_byte else file_size - 1
-        if last_byte >= file_size:
-            last_byte = file_size - 1
-    else:
-        first_byte, last_byte = None, None
-    return first_byte, last_byte
+        if not first_byte:
+            # Suffix range, last N bytes
+            suffix_length = int(last_byte)
+            if suffix_length and size:
+                ranges.append((max(size - suffix_length, 0), size - 1))
+            continue
+        first_byte = int(first_byte)
+        if last_byte and int(last_byte) < first_byte:
+            return None
+        last_byte = int(last_byte) if last_byte else size - 1
+        if first_byte < size:
+            ranges.append((first_byte, min(last_byte, size - 1)))
+    if not ranges and not range_set.strip(', \t'):
+        return None
+    ranges = coalesce_ranges(ranges)
+    if max_ranges and len(ranges) > max_ranges:
+        return None
+    return ranges
+
+
+def coalesce_ranges(ranges):
+    coalesced = []
+    for first_byte, last_byte in sorted(ranges):
+        if coalesced and first_byte <= coalesced[-1][1] + 1:
+            coalesced[-1] = (coalesced[-1][0], max(coalesced[-1][1], last_byte))
+        else:
+            coalesced.append((first_byte, last_byte))
+    return coalesced
+
+
+class MultipartRangesWrapper(object):
+    """
+    Iterate over `multipart/byteranges` body of file ranges, see RFC 7233 appendix A.
+
+    Ranges past the end of the file are padded or followed like with `RangeFileWrapper`, each of them is read
+    in blocks sized by `get_block_size` up to `max_blksize`.
+    """
+    def __init__(
+            self, filelike, ranges, size, content_type, boundary, max_blksize=8192, readahead=None, follow=None):
+        self.filelike = filelike
+        self.ranges = ranges
+        self.boundary = boundary
+        self.max_blksize = max_blksize
+        self.readahead = readahead
+        self.follow = follow
+        self.bytes_read = 0
+        self.reads = 0
+        self.part_headers = [
+            (
+                f'--{boundary}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Range: bytes {first_byte}-{last_byte}/{size}\r\n'
+                f'\r\n'
+            ).encode()
+            for first_byte, last_byte in ranges
+        ]
+        self.closing = f'--{boundary}--\r\n'.encode()
+
+    def __len__(self):
+        return (
+            sum(len(part_header) + last_byte - first_byte + 1 + 2
+                for part_header, (first_byte, last_byte) in zip(self.part_headers, self.ranges))
+            + len(self.closing)
+        )
+
+    def __iter__(self):
+        for part_header, (first_byte, last_byte) in zip(self.part_headers, self.ranges):
+            yield part_header
+            length = last_byte - first_byte + 1
+            # Not closed, it would close the file
+            part = RangeFileWrapper(
+                self.filelike, blksize=get_block_size(length, self.max_blksize), offset=first_byte, length=length,
+                readahead=self.readahead, follow=self.follow)
+            yield from part
+            self.bytes_read += part.bytes_read
+            self.reads += part.reads
+            yield b'\r\n'
+        yield self.closing
+
+    def close(self):
+        logger.debug(
+            'Streamed %s bytes of %s ranges in %s reads', self.bytes_read, len(self.ranges), self.reads)
+        if hasattr(self.filelike, 'close'):
+            self.filelike.close()
 
 
 def stream_video(request, file_handle, file_type):
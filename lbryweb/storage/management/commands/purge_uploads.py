@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from storage.models import Upload
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable uploads that have been abandoned along with their files, run it periodically.'
+
+    def handle(self, *args, **options):
+        deleted = 0
+        for upload in Upload.objects.filter(expires__lte=timezone.now()).select_related('uploaded_by'):
+            upload.delete_files()
+            upload.delete()
+            deleted += 1
+        self.stdout.write(f'{deleted} abandoned uploads deleted')
@@ -1,4 +1,6 @@
 import os
+import uuid
+import hashlib
 import logging
 import mimetypes
 from pathlib import Path
@@ -12,6 +14,18 @@ from django.contrib.postgres.fields import JSONField
 logger = logging.getLogger(__name__)
 
 
+def get_publish_file_name(account_id, uploaded_file_name):
+    """
+    Return name an uploaded file is published under in the directory of the account.
+    """
+    filename_hash_bits = ':'.join([
+        account_id,
+        settings.SECRET_KEY,
+        uploaded_file_name
+    ]).encode('utf-8')
+    return hashlib.sha1(filename_hash_bits).hexdigest() + '_' + uploaded_file_name
+
+
 class Content(models.Model):
     downloaded_by = models.ForeignKey('users.User', on_delete=models.CASCADE)
     file_name = models.CharField(max_length=1000)
@@ -37,3 +51,48 @@ class Content(models.Model):
             return 'application/octet-stream'
         else:
             return guessed_type
+
+
+class Upload(models.Model):
+    """
+    File uploaded for publishing in chunks, resumed from `offset` after a broken connection.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey('users.User', on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=1000)
+    length = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    # Pushed back by every chunk, abandoned uploads are deleted by the purge_uploads command
+    expires = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.file_name} {self.offset}/{self.length} ({self.id})'
+
+    @property
+    def is_complete(self):
+        return self.offset == self.length
+
+    def get_directory(self):
+        return os.path.join(settings.LBRY_PUBLISH_SAVE, f'account_{self.uploaded_by.account_id}')
+
+    def get_part_path(self):
+        return os.path.join(self.get_directory(), f'.upload_{self.id.hex}.part')
+
+    def get_publish_path(self):
+        """
+        Return path the complete file is moved to for the daemon to publish it.
+        """
+        return os.path.join(self.get_directory(), get_publish_file_name(self.uploaded_by.account_id, self.file_name))
+
+    def delete_files(self):
+        """
+        Remove the part file, or the file it has been moved to by a publish attempt the daemon failed.
+        """
+        try:
+            os.remove(self.get_part_path())
+        except FileNotFoundError:
+            try:
+                os.remove(self.get_publish_path())
+            except FileNotFoundError:
+                pass
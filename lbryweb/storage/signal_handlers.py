@@ -2,8 +2,9 @@ import logging
 
 from django.dispatch import receiver
 
-from daemon import signals as daemon_signals
+from daemon import signals as daemon_signals, tracing
 from users.models import User
+from . import descriptors
 from .models import Content
 
 
@@ -32,4 +33,6 @@ def create_content_object(sender, account_id, uri, lbrynet_data, file_name, **kw
             uri=uri, file_name=file_name,
         )
     content_instance.lbrynet_data = lbrynet_data
-    content_instance.save()
+    with tracing.span('content_save'):
+        content_instance.save()
+    descriptors.get_cache().invalidate(outpoint=content_instance.outpoint, uri=uri)
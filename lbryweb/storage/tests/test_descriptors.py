@@ -0,0 +1,97 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from users.models import User
+from .. import descriptors
+from ..models import Content
+
+
+class DescriptorCacheTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'what.mp4')
+        with open(self.path, 'wb') as content_file:
+            content_file.write(b'0123456789')
+        user = User.objects.create(username='test@lbry.io', account_id='abc')
+        self.content = Content.objects.create(
+            downloaded_by=user, file_name='what.mp4', uri='what', claim_name='what', outpoint='abc:0',
+            lbrynet_data={'total_bytes': 20, 'suggested_file_name': 'what.mp4'})
+        settings_override = self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache = descriptors.DescriptorCache(max_size=2)
+        self.load = mock.Mock(side_effect=lambda: Content.objects.get(uri='what'))
+
+    def test_get(self):
+        with mock.patch.object(Path, 'stat', autospec=True, side_effect=Path.stat) as stat:
+            descriptor = self.cache.get('uri', 'what', self.load)
+            self.assertEqual(descriptor.path, Path(self.path))
+            self.assertEqual((descriptor.size, descriptor.real_size), (20, 10))
+            self.assertEqual(descriptor.mime_type, 'video/mp4')
+            self.assertEqual(descriptor.mtime_ns, os.stat(self.path).st_mtime_ns)
+            stat.reset_mock()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.cache.get('uri', 'what', self.load), descriptor)
+            self.assertEqual(stat.call_count, 1)
+        self.assertEqual(self.load.call_count, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_file_changed(self):
+        self.cache.get('uri', 'what', self.load)
+        with open(self.path, 'ab') as content_file:
+            content_file.write(b'0123456789')
+        self.assertEqual(self.cache.get('uri', 'what', self.load).real_size, 20)
+        self.assertEqual(self.load.call_count, 1)
+
+    def test_file_removed(self):
+        self.cache.get('uri', 'what', self.load)
+        os.remove(self.path)
+        with self.assertRaises(FileNotFoundError):
+            self.cache.get('uri', 'what', self.load)
+        with open(self.path, 'wb') as content_file:
+            content_file.write(b'0123456789')
+        self.cache.get('uri', 'what', self.load)
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_invalidate(self):
+        self.cache.get('uri', 'what', self.load)
+        self.cache.get('outpoint', 'abc:0', self.load)
+        self.cache.invalidate(outpoint='abc:0')
+        self.cache.get('uri', 'what', self.load)
+        self.cache.get('outpoint', 'abc:0', self.load)
+        self.assertEqual(self.load.call_count, 4)
+
+    def test_ttl(self):
+        cache = descriptors.DescriptorCache(max_size=2, ttl=60)
+        cache.get('uri', 'what', self.load)
+        with mock.patch('time.monotonic', return_value=10 ** 9):
+            cache.get('uri', 'what', self.load)
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_evict_least_recently_used(self):
+        other = mock.Mock(side_effect=lambda: self.content)
+        self.cache.get('uri', 'what', self.load)
+        self.cache.get('uri', 'other', other)
+        self.cache.get('uri', 'what', self.load)
+        self.cache.get('uri', 'third', other)
+        self.cache.get('uri', 'what', self.load)
+        self.assertEqual(self.load.call_count, 1)
+        self.cache.get('uri', 'other', other)
+        self.assertEqual(other.call_count, 3)
+
+    def test_disabled(self):
+        cache = descriptors.DescriptorCache(max_size=0)
+        cache.get('uri', 'what', self.load)
+        cache.get('uri', 'what', self.load)
+        self.assertEqual(self.load.call_count, 2)
+
+    @override_settings(LBRY_CONTENT_DESCRIPTOR_CACHE_SIZE=10)
+    def test_get_cache(self):
+        self.assertIs(descriptors.get_cache(), descriptors.get_cache())
+        self.assertEqual(descriptors.get_cache().max_size, 10)
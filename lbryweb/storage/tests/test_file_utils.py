@@ -0,0 +1,177 @@
+import io
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..file_utils import (
+    MIN_BLOCK_SIZE, DownloadFollower, DownloadStalled, FileRange, MultipartRangesWrapper, RangeFileWrapper,
+    get_block_size, parse_ranges)
+
+
+class FileRangeTest(SimpleTestCase):
+
+    def setUp(self):
+        self.file = tempfile.TemporaryFile()
+        self.file.write(b'0123456789')
+        self.addCleanup(self.file.close)
+
+    def test_read(self):
+        file_range = FileRange(self.file, offset=2, length=5)
+        # Positioned for sendfile
+        self.assertEqual(os.lseek(file_range.fileno(), 0, os.SEEK_CUR), 2)
+        self.assertEqual(file_range.read(3), b'234')
+        self.assertEqual(file_range.read(), b'56')
+        self.assertEqual(file_range.read(), b'')
+
+    def test_read_to_end(self):
+        self.assertEqual(FileRange(self.file, offset=8).read(), b'89')
+
+
+class RangeFileWrapperTest(SimpleTestCase):
+
+    def test_iter(self):
+        with tempfile.TemporaryFile() as range_file:
+            range_file.write(b'0123456789')
+            self.assertEqual(b''.join(RangeFileWrapper(range_file, blksize=3, offset=7, length=5)), b'78900')
+
+    def test_counters(self):
+        with tempfile.TemporaryFile() as range_file:
+            range_file.write(b'0123456789')
+            wrapper = RangeFileWrapper(range_file, blksize=4, offset=2, length=20)
+            # Padding is read in blocks too
+            self.assertEqual(list(wrapper), [b'2345', b'6789', b'0000', b'0000', b'0000'])
+            self.assertEqual((wrapper.bytes_read, wrapper.reads), (20, 5))
+
+    @mock.patch('os.posix_fadvise', create=True)
+    def test_readahead(self, posix_fadvise):
+        with tempfile.TemporaryFile() as range_file:
+            RangeFileWrapper(range_file, offset=100, length=10 ** 6, readahead=4096)
+            posix_fadvise.assert_has_calls([
+                mock.call(range_file.fileno(), 100, 10 ** 6, os.POSIX_FADV_SEQUENTIAL),
+                mock.call(range_file.fileno(), 100, 4096, os.POSIX_FADV_WILLNEED),
+            ])
+            posix_fadvise.reset_mock()
+            RangeFileWrapper(range_file)
+            posix_fadvise.assert_not_called()
+
+    def test_readahead_without_file_descriptor(self):
+        RangeFileWrapper(io.BytesIO(b'0123'), readahead=4096)
+
+    def test_follow(self):
+        with tempfile.TemporaryFile() as range_file:
+            range_file.write(b'01234')
+
+            def follow(filelike):
+                if follow.calls:
+                    # Download is over
+                    return False
+                follow.calls += 1
+                # Written by the daemon meanwhile
+                position = filelike.tell()
+                filelike.seek(0, os.SEEK_END)
+                filelike.write(b'56789')
+                filelike.seek(position)
+                return True
+
+            follow.calls = 0
+            self.assertEqual(
+                b''.join(RangeFileWrapper(range_file, offset=3, length=12, follow=follow)), b'3456789' + b'00000')
+
+
+class GetBlockSizeTest(SimpleTestCase):
+
+    def test_get_block_size(self):
+        self.assertEqual(get_block_size(100, 2 ** 20), MIN_BLOCK_SIZE)
+        self.assertEqual(get_block_size(2 ** 20, 2 ** 20), 2 ** 17)
+        self.assertEqual(get_block_size(2 ** 32, 2 ** 20), 2 ** 20)
+        # Whole file of unknown size
+        self.assertEqual(get_block_size(None, 2 ** 20), 2 ** 20)
+        self.assertEqual(get_block_size(2 ** 32, 1000), 1000)
+
+
+class ParseRangesTest(SimpleTestCase):
+
+    def test_ranges(self):
+        self.assertEqual(parse_ranges('bytes=0-9', 100), [(0, 9)])
+        self.assertEqual(parse_ranges('bytes=90-', 100), [(90, 99)])
+        self.assertEqual(parse_ranges('bytes=90-200', 100), [(90, 99)])
+        self.assertEqual(parse_ranges('Bytes = 1-2 ,, 5-6', 100), [(1, 2), (5, 6)])
+
+    def test_suffix_ranges(self):
+        self.assertEqual(parse_ranges('bytes=-10', 100), [(90, 99)])
+        self.assertEqual(parse_ranges('bytes=-200', 100), [(0, 99)])
+        self.assertEqual(parse_ranges('bytes=-0', 100), [])
+
+    def test_coalesced(self):
+        self.assertEqual(parse_ranges('bytes=50-59,0-9,5-19,20-29,-5', 100), [(0, 29), (50, 59), (95, 99)])
+        self.assertEqual(parse_ranges('bytes=0-,10-20', 100), [(0, 99)])
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_ranges('bytes=100-', 100), [])
+        self.assertEqual(parse_ranges('bytes=-1', 0), [])
+
+    def test_ignored(self):
+        for header in ['', 'bytes', 'bytes=', 'items=0-9', 'bytes=a-9', 'bytes=-', 'bytes=9-0', 'bytes=0-9,x']:
+            with self.subTest(header=header):
+                self.assertIsNone(parse_ranges(header, 100))
+        self.assertIsNone(parse_ranges('bytes=0-0,2-2,4-4', 100, max_ranges=2))
+
+
+class MultipartRangesWrapperTest(SimpleTestCase):
+
+    def test_iter(self):
+        with tempfile.TemporaryFile() as range_file:
+            range_file.write(b'0123456789')
+            parts = MultipartRangesWrapper(range_file, [(1, 2), (8, 11)], 12, 'text/plain', 'xyz', max_blksize=3)
+            body = b''.join(parts)
+            self.assertEqual(body, (
+                b'--xyz\r\nContent-Type: text/plain\r\nContent-Range: bytes 1-2/12\r\n\r\n12\r\n'
+                b'--xyz\r\nContent-Type: text/plain\r\nContent-Range: bytes 8-11/12\r\n\r\n8900\r\n'
+                b'--xyz--\r\n'
+            ))
+            self.assertEqual(len(parts), len(body))
+
+
+class DownloadFollowerTest(SimpleTestCase):
+
+    def setUp(self):
+        self.file = tempfile.TemporaryFile(buffering=0)
+        self.file.write(b'01234')
+        self.addCleanup(self.file.close)
+
+    def follower(self, *statuses, **kwargs):
+        kwargs.setdefault('min_interval', 0)
+        kwargs.setdefault('status_interval', 0)
+        return DownloadFollower(mock.Mock(side_effect=statuses), **kwargs)
+
+    def test_grown(self):
+        def get_status():
+            os.write(self.file.fileno(), b'5')
+            return {'status': 'running', 'written_bytes': 6}
+
+        follower = DownloadFollower(get_status, min_interval=0, timeout=1)
+        self.assertTrue(follower(self.file))
+        self.assertEqual(follower.written_bytes, 6)
+
+    def test_finished(self):
+        self.assertFalse(self.follower({'status': 'finished', 'completed': True})(self.file))
+
+    def test_progressing(self):
+        follower = self.follower(
+            {'status': 'running', 'written_bytes': 1}, None, {'status': 'running', 'written_bytes': 2},
+            {'status': 'finished', 'completed': True}, timeout=1)
+        self.assertFalse(follower(self.file))
+        self.assertEqual(follower.waits, 3)
+
+    def test_stalled(self):
+        follower = DownloadFollower(
+            mock.Mock(return_value={'status': 'running', 'written_bytes': 5}),
+            timeout=0.01, min_interval=0.001, status_interval=0)
+        with self.assertRaises(DownloadStalled):
+            follower(self.file)
+
+    def test_stopped(self):
+        with self.assertRaises(DownloadStalled):
+            self.follower({'status': 'stopped', 'written_bytes': 5})(self.file)
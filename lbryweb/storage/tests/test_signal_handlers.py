@@ -1,9 +1,13 @@
-from django.test import TestCase
+from unittest import mock
+
+from django.test import TestCase, override_settings
 
 from daemon.api import API
 from users.models import User
 from registration.daemon_plug import Account
+from .. import descriptors
 from ..models import Content
+from ..signal_handlers import create_content_object
 
 
 class SignalHandlersTest(TestCase):
@@ -21,3 +25,12 @@ class SignalHandlersTest(TestCase):
         self.assertEqual(instance.uri, uri)
         self.assertTrue(instance.get_physical_file().is_file())
         self.assertEqual(instance.outpoint, response['result']['outpoint'])
+
+    @override_settings(LBRY_CONTENT_DESCRIPTOR_CACHE_SIZE=10)
+    def test_create_content_object_invalidates_descriptors(self):
+        user = User.objects.create(username='test@lbry.io', account_id='abc')
+        lbrynet_data = {'outpoint': 'abc:0', 'claim_name': 'what', 'total_bytes': 10, 'suggested_file_name': 'a.mp4'}
+        with mock.patch.object(descriptors.DescriptorCache, 'invalidate') as invalidate:
+            create_content_object(
+                sender=None, account_id=user.account_id, uri='what', lbrynet_data=lbrynet_data, file_name='a.mp4')
+        invalidate.assert_called_once_with(outpoint='abc:0', uri='what')
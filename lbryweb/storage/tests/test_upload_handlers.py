@@ -0,0 +1,70 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from users.models import User
+from ..upload_handlers import PublishUploadHandler
+
+
+class PublishUploadHandlerTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.data = os.urandom(3 * 1024 * 1024 + 10)
+
+    def upload(self, max_size=None, **files):
+        request = RequestFactory().post('/', {'json_payload': '{}', **files})
+        handler = PublishUploadHandler(
+            request, self.directory.name, get_file_name=lambda file_name: f'final_{file_name}', max_size=max_size)
+        request.upload_handlers = [handler]
+        return handler, request.FILES
+
+    def make_file(self, name, data):
+        upload = BytesIO(data)
+        upload.name = name
+        return upload
+
+    def test_upload(self):
+        handler, files = self.upload(file=self.make_file('video.mp4', self.data))
+        uploaded_file = files['file']
+        path = os.path.join(self.directory.name, 'final_video.mp4')
+        self.assertEqual(uploaded_file.path, path)
+        self.assertEqual(uploaded_file.size, len(self.data))
+        self.assertEqual(uploaded_file.content_hash, hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(uploaded_file.read(), self.data)
+        with open(path, 'rb') as saved_file:
+            self.assertEqual(saved_file.read(), self.data)
+        # Nothing else is left in the directory
+        self.assertEqual(os.listdir(self.directory.name), ['final_video.mp4'])
+
+    def test_replaces_previous_upload(self):
+        self.upload(file=self.make_file('video.mp4', b'old'))
+        self.upload(file=self.make_file('video.mp4', b'new'))
+        with open(os.path.join(self.directory.name, 'final_video.mp4'), 'rb') as saved_file:
+            self.assertEqual(saved_file.read(), b'new')
+
+    def test_other_fields_skipped(self):
+        _, files = self.upload(other=self.make_file('other.txt', b'other'))
+        self.assertNotIn('other', files)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_too_large(self):
+        handler, files = self.upload(max_size=2 * 1024 * 1024, file=self.make_file('video.mp4', self.data))
+        self.assertTrue(handler.too_large)
+        self.assertNotIn('file', files)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    @override_settings(LBRY_PUBLISH_MAX_SIZE=10)
+    def test_view_rejects_too_large(self):
+        user = User.objects.create(username='test@lbry.io', account_id='abc')
+        self.client.force_login(user)
+        with self.settings(LBRY_PUBLISH_SAVE=self.directory.name):
+            response = self.client.post(
+                reverse('publish'), {'file': self.make_file('video.mp4', self.data), 'json_payload': '{}'})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, 'account_abc')), [])
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import responses
+from django.conf import settings
+from django.http import UnreadablePostError
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from daemon.api import API
+from users.models import User
+from .. import views
+from ..models import Upload
+
+
+PUBLISH_PAYLOAD = json.dumps({
+    'jsonrpc': '2.0',
+    'method': 'publish',
+    'params': {'name': 'video', 'bid': '0.1', 'file_path': '__POST_FILE__'},
+    'id': 1,
+})
+
+
+class UploadViewsTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = self.settings(LBRY_PUBLISH_SAVE=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(username='test@lbry.io', account_id='abc')
+        self.client.force_login(self.user)
+        self.data = os.urandom(1000)
+
+    def create(self, **upload_data):
+        return self.client.post(
+            reverse('uploads'), json.dumps(upload_data or {'file_name': 'video.mp4', 'length': len(self.data)}),
+            content_type='application/json')
+
+    def send(self, url, offset, data):
+        return self.client.patch(
+            url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_upload(self):
+        response = self.create()
+        self.assertEqual(response.status_code, 201)
+        url = response['Location']
+        upload = Upload.objects.get()
+        self.assertEqual(url, reverse('upload', kwargs={'upload_id': upload.pk}))
+        self.assertEqual(response.json()['offset'], 0)
+
+        response = self.send(url, 0, self.data[:400])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], '400')
+        # Resumed from the offset it's at
+        response = self.client.head(url)
+        self.assertEqual(response['Upload-Offset'], '400')
+        response = self.send(url, 400, self.data[400:])
+        self.assertEqual(response.json()['offset'], len(self.data))
+
+        # Written right into the account directory
+        with open(os.path.join(self.directory.name, 'account_abc', f'.upload_{upload.pk.hex}.part'), 'rb') as part:
+            self.assertEqual(part.read(), self.data)
+
+    @mock.patch.object(views.UploadView, 'chunk_size', 100)
+    def test_connection_broken(self):
+        url = self.create()['Location']
+        with mock.patch.object(WSGIRequest, 'read', side_effect=[self.data[:100], UnreadablePostError()]):
+            with self.assertRaises(UnreadablePostError):
+                self.send(url, 0, self.data[:400])
+        # Bytes received before it broke are kept
+        self.assertEqual(self.client.head(url)['Upload-Offset'], '100')
+        response = self.send(url, 100, self.data[100:])
+        self.assertEqual(response.json()['offset'], len(self.data))
+        with open(Upload.objects.get().get_part_path(), 'rb') as part:
+            self.assertEqual(part.read(), self.data)
+
+    def test_content_length_required(self):
+        url = self.create()['Location']
+        response = self.client.patch(
+            url, self.data[:400], content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET='0',
+            CONTENT_LENGTH='')
+        self.assertEqual(response.status_code, 411)
+        self.assertEqual(Upload.objects.get().offset, 0)
+
+    def test_offset_mismatch(self):
+        url = self.create()['Location']
+        self.send(url, 0, self.data[:400])
+        response = self.send(url, 0, self.data[:400])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '400')
+
+    def test_past_length(self):
+        url = self.create()['Location']
+        response = self.send(url, 900, self.data[:400])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Upload.objects.get().offset, 0)
+
+    def test_invalid(self):
+        self.assertEqual(self.create(file_name='..', length=10).status_code, 400)
+        self.assertEqual(self.create(file_name='video.mp4').status_code, 400)
+        with self.settings(LBRY_PUBLISH_MAX_SIZE=10):
+            self.assertEqual(self.create().status_code, 413)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_file_name_sanitized(self):
+        self.create(file_name='../../etc/video.mp4', length=10)
+        self.assertEqual(Upload.objects.get().file_name, 'video.mp4')
+
+    def test_other_account(self):
+        url = self.create()['Location']
+        self.client.force_login(User.objects.create(username='other@lbry.io', account_id='other'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.send(url, 0, self.data).status_code, 404)
+
+    def test_delete(self):
+        url = self.create()['Location']
+        part_path = Upload.objects.get().get_part_path()
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(Upload.objects.exists())
+        self.assertFalse(os.path.exists(part_path))
+
+    @responses.activate
+    def test_publish(self):
+        responses.add(responses.POST, API.url, json={'jsonrpc': '2.0', 'result': {'txid': 'abc'}})
+        url = self.create()['Location']
+        publish_url = reverse('upload_publish', kwargs={'upload_id': Upload.objects.get().pk})
+        self.send(url, 0, self.data[:400])
+        # Not complete yet
+        response = self.client.post(publish_url, {'json_payload': PUBLISH_PAYLOAD})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(responses.calls), 0)
+
+        self.send(url, 400, self.data[400:])
+        response = self.client.post(publish_url, {'json_payload': PUBLISH_PAYLOAD})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['result'], {'txid': 'abc'})
+        file_name = hashlib.sha1(f'abc:{settings.SECRET_KEY}:video.mp4'.encode()).hexdigest() + '_video.mp4'
+        params = json.loads(responses.calls[0].request.body)['params']
+        self.assertEqual(params['file_path'], os.path.join(settings.LBRY_PUBLISH_FEED, 'account_abc', file_name))
+        self.assertEqual(params['account_id'], 'abc')
+        with open(os.path.join(self.directory.name, 'account_abc', file_name), 'rb') as published_file:
+            self.assertEqual(published_file.read(), self.data)
+        self.assertFalse(Upload.objects.exists())
+
+    @responses.activate
+    def test_purge_failed_publish(self):
+        responses.add(responses.POST, API.url, json={'jsonrpc': '2.0', 'error': {'code': -32500, 'message': 'Failed'}})
+        url = self.create()['Location']
+        upload = Upload.objects.get()
+        self.send(url, 0, self.data)
+        response = self.client.post(
+            reverse('upload_publish', kwargs={'upload_id': upload.pk}), {'json_payload': PUBLISH_PAYLOAD})
+        self.assertNotEqual(response.status_code, 200)
+        # Left under the name it's published with, for the publish to be retried
+        self.assertFalse(os.path.exists(upload.get_part_path()))
+        self.assertTrue(os.path.exists(upload.get_publish_path()))
+        Upload.objects.update(expires=timezone.now() - timedelta(seconds=1))
+        call_command('purge_uploads', stdout=StringIO())
+        self.assertFalse(os.path.exists(upload.get_publish_path()))
+
+    @override_settings(LBRY_PUBLISH_UPLOAD_TTL=60)
+    def test_purge_uploads(self):
+        self.create()
+        self.create()
+        expired = Upload.objects.first()
+        Upload.objects.filter(pk=expired.pk).update(expires=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('purge_uploads', stdout=out)
+        self.assertIn('1 abandoned uploads deleted', out.getvalue())
+        self.assertEqual(Upload.objects.count(), 1)
+        self.assertFalse(os.path.exists(expired.get_part_path()))
+        self.assertTrue(os.path.exists(Upload.objects.get().get_part_path()))
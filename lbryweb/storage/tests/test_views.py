@@ -2,13 +2,20 @@ import time
 import json
 import hashlib
 import os
+import tempfile
 from io import BytesIO
 from datetime import datetime
+from pathlib import Path
+from unittest import mock
 
 import pytest
 import responses
-from django.test import TestCase
+from django.http import FileResponse
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
 from django.contrib import auth
 from django.conf import settings
 
@@ -16,6 +23,7 @@ from users.models import User
 from registration.daemon_plug import Account
 from daemon.api import API
 
+from ..file_utils import DownloadStalled
 from ..models import Content
 
 
@@ -192,6 +200,254 @@ class StorageViewTest(TestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class ContentViewTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.data = bytes(range(256)) * 4
+        with open(os.path.join(self.directory.name, 'what.mp4'), 'wb') as content_file:
+            content_file.write(self.data)
+        self.user = User.objects.create(username='test@lbry.io', account_id='abc')
+        Content.objects.create(
+            downloaded_by=self.user, file_name='what.mp4', uri='what', claim_name='what', outpoint='abc:0',
+            lbrynet_data={'total_bytes': len(self.data), 'suggested_file_name': 'what.mp4'})
+        self.url = reverse('content', kwargs={'uri': 'what', 'account_id': 'abc'})
+        self.client.force_login(self.user)
+
+    def get(self, **kwargs):
+        with self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name):
+            response = self.client.get(self.url, **kwargs)
+            return response, b''.join(response.streaming_content)
+
+    def test_get(self):
+        response, content = self.get()
+        self.assertEqual(response.status_code, 200)
+        # Its file is handed to wsgi.file_wrapper
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(content, self.data)
+
+    def test_get_range(self):
+        response, content = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(content, self.data[100:200])
+
+    def test_get_range_past_end_of_file(self):
+        # Daemon reports more bytes than there are on disk
+        Content.objects.update(lbrynet_data={'total_bytes': len(self.data) + 10, 'suggested_file_name': 'what.mp4'})
+        response, content = self.get(HTTP_RANGE='bytes=1000-')
+        self.assertNotIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Length'], '34')
+        self.assertEqual(content, self.data[1000:] + b'0' * 10)
+
+    def test_get_suffix_range(self):
+        response, content = self.get(HTTP_RANGE='bytes=-24')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1023/{len(self.data)}')
+        self.assertEqual(content, self.data[-24:])
+
+    def test_get_multiple_ranges(self):
+        response, content = self.get(HTTP_RANGE='bytes=500-509, 0-9, 5-14')
+        self.assertEqual(response.status_code, 206)
+        content_type, boundary = response['Content-Type'].split('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        self.assertEqual(response['Content-Length'], str(len(content)))
+        # Overlapping ranges are sent once, in order
+        self.assertEqual(content, (
+            f'--{boundary}\r\nContent-Type: video/mp4\r\nContent-Range: bytes 0-14/1024\r\n\r\n'.encode()
+            + self.data[0:15] + b'\r\n'
+            + f'--{boundary}\r\nContent-Type: video/mp4\r\nContent-Range: bytes 500-509/1024\r\n\r\n'.encode()
+            + self.data[500:510] + b'\r\n'
+            + f'--{boundary}--\r\n'.encode()
+        ))
+
+    @override_settings(LBRY_CONTENT_MAX_RANGES=2)
+    def test_get_too_many_ranges(self):
+        response, content = self.get(HTTP_RANGE='bytes=0-0, 2-2, 4-4')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, self.data)
+
+    def test_get_unsatisfiable_range(self):
+        with self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name):
+            response = self.client.get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_head(self):
+        with self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name), \
+                mock.patch.object(Path, 'open', side_effect=AssertionError('File opened')):
+            response = self.client.head(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.content, b'')
+
+    def test_validators(self):
+        response, _ = self.get()
+        etag = response['ETag']
+        self.assertRegex(etag, r'^"[0-9a-f]{40}"$')
+        mtime = os.stat(os.path.join(self.directory.name, 'what.mp4')).st_mtime
+        self.assertEqual(response['Last-Modified'], http_date(mtime))
+        self.assertEqual(self.get()[0]['ETag'], etag)
+        # Changes along with the file
+        os.utime(os.path.join(self.directory.name, 'what.mp4'), (mtime + 10, mtime + 10))
+        self.assertNotEqual(self.get()[0]['ETag'], etag)
+
+    def test_not_modified(self):
+        etag, last_modified = self.get()[0]['ETag'], self.get()[0]['Last-Modified']
+        with self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name):
+            for headers in [{'HTTP_IF_NONE_MATCH': etag}, {'HTTP_IF_MODIFIED_SINCE': last_modified}]:
+                for method in [self.client.get, self.client.head]:
+                    with self.subTest(headers=headers, method=method):
+                        response = method(self.url, **headers)
+                        self.assertEqual(response.status_code, 304)
+                        self.assertEqual(response['ETag'], etag)
+                        self.assertEqual(response['Cache-Control'], settings.LBRY_CONTENT_CACHE_CONTROL)
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_precondition_failed(self):
+        with self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name):
+            response = self.client.get(self.url, HTTP_IF_MATCH='"other"')
+        self.assertEqual(response.status_code, 412)
+
+    def test_if_range(self):
+        etag, last_modified = self.get()[0]['ETag'], self.get()[0]['Last-Modified']
+        for if_range in [etag, last_modified]:
+            with self.subTest(if_range=if_range):
+                response, content = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=if_range)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(content, self.data[10:20])
+        # The file has changed or can't be told apart, the whole of it is sent
+        for if_range in ['"other"', f'W/{etag}', 'Sat, 29 Oct 1994 19:43:31 GMT']:
+            with self.subTest(if_range=if_range):
+                response, content = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=if_range)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(content, self.data)
+
+    @override_settings(LBRY_CONTENT_CACHE_CONTROL='public, max-age=60', LBRY_CONTENT_INCOMPLETE_CACHE_CONTROL='')
+    def test_cache_control(self):
+        self.assertEqual(self.get()[0]['Cache-Control'], 'public, max-age=60')
+        Content.objects.update(lbrynet_data={'total_bytes': len(self.data) + 10, 'suggested_file_name': 'what.mp4'})
+        self.assertNotIn('Cache-Control', self.get()[0])
+
+    def truncate_file(self, size):
+        path = os.path.join(self.directory.name, 'what.mp4')
+        with open(path, 'wb') as content_file:
+            content_file.write(self.data[:size])
+        return path
+
+    @override_settings(LBRY_CONTENT_FOLLOW=True, LBRY_CONTENT_FOLLOW_STATUS_INTERVAL=0)
+    @responses.activate
+    def test_get_following_download(self):
+        path = self.truncate_file(1000)
+
+        def file_list(request):
+            # The daemon writes the rest meanwhile
+            with open(path, 'ab') as content_file:
+                content_file.write(self.data[1000:])
+            result = [{'outpoint': 'abc:0', 'status': 'running', 'completed': False, 'written_bytes': 1000}]
+            return 200, {}, json.dumps({'jsonrpc': '2.0', 'result': result})
+
+        responses.add_callback(responses.POST, API.url, callback=file_list, content_type='application/json')
+        # Starts past the end of the file on disk
+        response, content = self.get(HTTP_RANGE='bytes=1010-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1010-1023/{len(self.data)}')
+        self.assertEqual(content, self.data[1010:])
+        self.assertEqual(json.loads(responses.calls[0].request.body)['params'], {'outpoint': 'abc:0'})
+
+    @override_settings(
+        LBRY_CONTENT_FOLLOW=True, LBRY_CONTENT_FOLLOW_STATUS_INTERVAL=0, LBRY_CONTENT_FOLLOW_TIMEOUT=0,
+        LBRY_DAEMONS=['http://daemon1:5279', 'http://daemon2:5279'])
+    @responses.activate
+    def test_get_following_download_of_other_account(self):
+        self.truncate_file(1000)
+        User.objects.filter(pk=self.user.pk).update(account_data={'daemon_url': 'http://daemon2:5279'})
+        self.client.force_login(User.objects.create(
+            username='other@lbry.io', account_id='other', account_data={'daemon_url': 'http://daemon1:5279'}))
+        result = [{'outpoint': 'abc:0', 'status': 'finished', 'completed': True, 'written_bytes': 1000}]
+        responses.add(responses.POST, 'http://daemon2:5279', json={'jsonrpc': '2.0', 'result': result})
+        # Checked with the daemon that has the file rather than the one of the requester
+        response, content = self.get()
+        self.assertEqual(content, self.data[:1000] + b'0' * 24)
+
+    @override_settings(LBRY_CONTENT_FOLLOW=True, LBRY_CONTENT_FOLLOW_STATUS_INTERVAL=0)
+    @responses.activate
+    def test_get_following_finished_download(self):
+        self.truncate_file(1000)
+        result = [{'outpoint': 'abc:0', 'status': 'finished', 'completed': True, 'written_bytes': 1000}]
+        responses.add(responses.POST, API.url, json={'jsonrpc': '2.0', 'result': result})
+        # Bytes the daemon has reported but not written are padded
+        response, content = self.get()
+        self.assertEqual(content, self.data[:1000] + b'0' * 24)
+
+    @override_settings(
+        LBRY_CONTENT_FOLLOW=True, LBRY_CONTENT_FOLLOW_STATUS_INTERVAL=0, LBRY_CONTENT_FOLLOW_TIMEOUT=0)
+    @responses.activate
+    def test_get_following_stalled_download(self):
+        self.truncate_file(1000)
+        result = [{'outpoint': 'abc:0', 'status': 'running', 'completed': False, 'written_bytes': 1000}]
+        responses.add(responses.POST, API.url, json={'jsonrpc': '2.0', 'result': result})
+        # Breaks the response off rather than sending wrong bytes
+        with self.assertRaises(DownloadStalled):
+            self.get()
+
+    @override_settings(LBRY_CONTENT_DESCRIPTOR_CACHE_SIZE=10)
+    def test_descriptor_cached(self):
+        with self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name), \
+                CaptureQueriesContext(connection) as queries:
+            for first_byte in range(0, 300, 100):
+                response = self.client.get(self.url, HTTP_RANGE=f'bytes={first_byte}-{first_byte + 99}')
+                self.assertEqual(b''.join(response.streaming_content), self.data[first_byte:first_byte + 100])
+        self.assertEqual(len([query for query in queries if 'storage_content' in query['sql']]), 1)
+
+    @override_settings(LBRY_CONTENT_SENDFILE=False)
+    def test_get_without_sendfile(self):
+        response, content = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertNotIsInstance(response, FileResponse)
+        self.assertEqual(content, self.data[10:20])
+
+    @override_settings(LBRY_CONTENT_OFFLOAD='nginx', LBRY_CONTENT_OFFLOAD_LOCATION='/protected/')
+    def test_get_offload_nginx(self):
+        Content.objects.update(file_name='what now.mp4')
+        os.rename(os.path.join(self.directory.name, 'what.mp4'), os.path.join(self.directory.name, 'what now.mp4'))
+        with self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name):
+            response = self.client.get(self.url, HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/what%20now.mp4')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(LBRY_CONTENT_OFFLOAD='apache')
+    def test_get_offload_apache(self):
+        with self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.directory.name, 'what.mp4'))
+        self.assertEqual(response.content, b'')
+
+    @override_settings(LBRY_CONTENT_OFFLOAD='nginx')
+    def test_get_offload_past_end_of_file(self):
+        Content.objects.update(lbrynet_data={'total_bytes': len(self.data) + 10, 'suggested_file_name': 'what.mp4'})
+        with self.settings(LBRY_DOWNLOAD_DIRECTORY=self.directory.name):
+            # Within the file on disk
+            response = self.client.get(self.url, HTTP_RANGE=f'bytes=0-{len(self.data) - 1}')
+        self.assertIn('X-Accel-Redirect', response)
+        # Has to be padded
+        response, content = self.get()
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(content, self.data + b'0' * 10)
+        response, content = self.get(HTTP_RANGE='bytes=1000-')
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(response.status_code, 206)
+
+
 class PublishViewTest(TestCase):
     maxDiff = None
 
@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers, StopUpload
+
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class PublishedFile(UploadedFile):
+    """
+    Uploaded file already saved at its final `path`, along with the SHA-256 `content_hash` of its content.
+    """
+
+    def __init__(self, file, path, content_hash, **kwargs):
+        super().__init__(file, **kwargs)
+        self.path = path
+        self.content_hash = content_hash
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class PublishUploadHandler(FileUploadHandler):
+    """
+    Stream the file uploaded in `field_name` straight into `directory`, hashing it on the way.
+
+    The file is written under a temporary name next to its final one, given by `get_file_name` called with
+    the uploaded file name, and renamed once complete, so a publish costs a single write to disk and constant
+    memory. Uploads over `max_size` bytes are aborted and `too_large` is set. Files in other fields are skipped.
+
+    Under ASGI, Django spools the whole request body before the handler sees it, so a publish is written to disk
+    twice there and oversized uploads are only rejected once fully received.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, request, directory, get_file_name, field_name='file', max_size=None):
+        super().__init__(request)
+        self.directory = directory
+        self.get_file_name = get_file_name
+        self.upload_field_name = field_name
+        self.max_size = max_size
+        self.too_large = False
+        # Not named `file`, Django would close files that have been handed over
+        self.part_file = None
+        self.hash = None
+        self.size = 0
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        if field_name != self.upload_field_name:
+            raise SkipFile()
+        super().new_file(field_name, file_name, *args, **kwargs)
+        if self.content_length and self.max_size and self.content_length > self.max_size:
+            self.abort()
+        os.makedirs(self.directory, exist_ok=True)
+        self.part_file = tempfile.NamedTemporaryFile(
+            dir=self.directory, prefix=f'.{file_name}.', suffix='.part', delete=False)
+        self.hash = hashlib.sha256()
+        self.size = 0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.max_size and self.size > self.max_size:
+            self.abort()
+        self.hash.update(raw_data)
+        self.part_file.write(raw_data)
+
+    def file_complete(self, file_size):
+        path = os.path.join(self.directory, self.get_file_name(self.file_name))
+        os.replace(self.part_file.name, path)
+        self.part_file.seek(0)
+        published_file = PublishedFile(
+            self.part_file, path, self.hash.hexdigest(), name=self.file_name, content_type=self.content_type,
+            size=file_size, charset=self.charset, content_type_extra=self.content_type_extra)
+        logger.debug('Saved uploaded file %s to %s (sha256 %s)', self.file_name, path, published_file.content_hash)
+        self.part_file = None
+        return published_file
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def abort(self):
+        self.too_large = True
+        self.discard()
+        raise StopUpload(connection_reset=True)
+
+    def discard(self):
+        """
+        Remove the file being written, if any.
+        """
+        if self.part_file is None:
+            return
+        self.part_file.close()
+        try:
+            os.remove(self.part_file.name)
+        except FileNotFoundError:
+            pass
+        self.part_file = None
@@ -1,17 +1,29 @@
+from django.conf import settings
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 
 from . import views
 
 
+if settings.LBRY_ASYNC_VIEWS:
+    ContentPublishView = views.AsyncContentPublishView
+else:
+    ContentPublishView = views.ContentPublishView
+
 urlpatterns = [
     path(
         'content/',
-        csrf_exempt(views.ContentPublishView.as_view()),
+        csrf_exempt(ContentPublishView.as_view()),
         name='publish'),
     path('content/<account_id>/<uri>', views.ContentView.as_view(), name='content'),
     path(
         'content/<account_id>/outpoints/<outpoint>/<file_name>',
         views.ContentOutpointsView.as_view(),
         name='content_outpoints'),
+    path('uploads/', csrf_exempt(views.UploadsView.as_view()), name='uploads'),
+    path('uploads/<uuid:upload_id>', csrf_exempt(views.UploadView.as_view()), name='upload'),
+    path(
+        'uploads/<uuid:upload_id>/publish',
+        csrf_exempt(views.UploadPublishView.as_view()),
+        name='upload_publish'),
 ]
@@ -1,76 +1,244 @@
 import os
+import fcntl
 import logging
 import hashlib
 import json
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import quote
 
+from asgiref.sync import sync_to_async
 from django.views import View
 from django.shortcuts import get_object_or_404
 from django.http import (
-    StreamingHttpResponse, Http404, HttpResponse, HttpResponseForbidden,
+    FileResponse, StreamingHttpResponse, Http404, HttpResponse, HttpResponseForbidden,
     JsonResponse, HttpResponseBadRequest)
-from django.core.files.storage import FileSystemStorage
+from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
 
-from daemon.api import API
-from . import file_utils
-from .models import Content
+from daemon.api import API, AsyncAPI
+from daemon.exceptions import DaemonException, DaemonUnavailable
+from main.views import AsyncView, service_unavailable
+from . import descriptors, file_utils
+from .models import Content, Upload, get_publish_file_name
+from .upload_handlers import PublishUploadHandler, UploadTooLarge
 
 
 logger = logging.getLogger(__name__)
 
 
 class ContentView(View):
+    lookup_field = 'uri'
 
     def get_instance(self, request, **kwargs):
         return get_object_or_404(
             # Content.objects.filter(downloaded_by=request.user), uri=kwargs['uri'])
-            Content.objects.all(), uri=kwargs['uri'])
+            Content.objects.select_related('downloaded_by'), **{self.lookup_field: kwargs[self.lookup_field]})
+
+    def get_descriptor(self, request, **kwargs):
+        """
+        Return descriptor of the requested content, only hitting the database when it isn't cached.
+
+        Descriptors are shared by all users, the cache has to be keyed by user too if content gets restricted.
+        """
+        return descriptors.get_cache().get(
+            self.lookup_field, kwargs[self.lookup_field], lambda: self.get_instance(request, **kwargs))
+
+    def head(self, request, *args, **kwargs):
+        """
+        Answer size and type of the content as known by the daemon, without opening its file.
+        """
+        if not request.user.is_authenticated:
+            raise Http404()
+        descriptor = self.get_descriptor(request, **kwargs)
+        cache_headers = self.get_cache_headers(descriptor)
+        response = get_conditional_response(
+            request, etag=cache_headers['ETag'], last_modified=int(descriptor.mtime),
+            response=HttpResponse(content_type=descriptor.mime_type))
+        if response.status_code == 200:
+            response['Content-Length'] = str(descriptor.size)
+            response['Accept-Ranges'] = 'bytes'
+        return self.set_headers(response, cache_headers)
 
     def get(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             raise Http404()
-        content_instance = self.get_instance(request, **kwargs)
-        file_size = content_instance.lbrynet_data['total_bytes']
-        real_file_size = content_instance.get_physical_file().stat().st_size
+        descriptor = self.get_descriptor(request, **kwargs)
+        file_size = descriptor.size
+        real_file_size = descriptor.real_size
         if real_file_size != file_size:
             logger.warning(
                 'File mismatch: %s - %s (%s bytes difference)',
                 file_size, real_file_size, file_size - real_file_size
             )
-        file_handle = content_instance.get_physical_file().open(mode='rb')
-        file_type = content_instance.get_mime_type()
-        first_byte, last_byte = file_utils.parse_range_header(
-            request.META.get('HTTP_RANGE', ''), file_size)
+        cache_headers = self.get_cache_headers(descriptor)
+        last_modified = int(descriptor.mtime)
+        response = get_conditional_response(request, etag=cache_headers['ETag'], last_modified=last_modified)
+        if response is not None:
+            # Not modified or a precondition has failed
+            return self.set_headers(response, cache_headers)
+        file_type = descriptor.mime_type
+        range_header = request.META.get('HTTP_RANGE', '')
+        if range_header and not if_range_passes(request, cache_headers['ETag'], last_modified):
+            # Changed since the client got the part it has, it needs the whole file
+            range_header = ''
+        ranges = file_utils.parse_ranges(range_header, file_size, max_ranges=settings.LBRY_CONTENT_MAX_RANGES)
+        follow = self.get_follower(request, descriptor) if real_file_size < file_size else None
         logger.info(
-            'Requested range %s-%s out of %s (%s on disk)',
-            first_byte, last_byte, file_size, real_file_size
+            'Requested ranges %s out of %s (%s on disk)',
+            ranges, file_size, real_file_size
         )
-        if first_byte is not None:
-            if first_byte > real_file_size:
-                return HttpResponse('', status=416)
-            response = StreamingHttpResponse(
-                file_utils.RangeFileWrapper(file_handle, offset=first_byte, length=file_size),
-                status=206, content_type=file_type
-            )
-            response['Content-Length'] = str(last_byte - first_byte + 1)
+        if ranges is not None:
+            ranges = [
+                (first_byte, last_byte) for first_byte, last_byte in ranges
+                if first_byte <= real_file_size or follow is not None
+            ]
+            if not ranges:
+                response = HttpResponse('', status=416)
+                response['Content-Range'] = f'bytes */{file_size}'
+                return self.set_headers(response, cache_headers)
+        # The front-end server only knows the file on disk, which can be shorter than reported by the daemon
+        if settings.LBRY_CONTENT_OFFLOAD and (file_size if ranges is None else ranges[-1][1] + 1) <= real_file_size:
+            return self.set_headers(self.offload_file(descriptor, file_type), cache_headers)
+        file_handle = descriptor.path.open(mode='rb')
+        if ranges is None:
+            length = file_size
+            response = self.stream_file(file_handle, 0, length, real_file_size, file_type, follow=follow)
+        elif len(ranges) == 1:
+            first_byte, last_byte = ranges[0]
+            length = last_byte - first_byte + 1
+            response = self.stream_file(
+                file_handle, first_byte, length, real_file_size, file_type, status=206, follow=follow)
             response['Content-Range'] = f'bytes {first_byte}-{last_byte}/{file_size}'
         else:
+            parts = file_utils.MultipartRangesWrapper(
+                file_handle, ranges, file_size, file_type, boundary=uuid.uuid4().hex,
+                max_blksize=settings.LBRY_CONTENT_BLOCK_SIZE, readahead=self.get_readahead(), follow=follow)
+            length = len(parts)
             response = StreamingHttpResponse(
-                file_utils.FileWrapper(file_handle),
-                content_type=file_type
-            )
-            response['Content-Length'] = file_size
+                parts, status=206, content_type=f'multipart/byteranges; boundary={parts.boundary}')
+        response['Content-Length'] = str(length)
+        response['Accept-Ranges'] = 'bytes'
+        return self.set_headers(response, cache_headers)
+
+    def get_cache_headers(self, descriptor):
+        """
+        Return validators and caching policy of the described file in its current state.
+
+        The strong ETag changes whenever the file does, like while it's being downloaded.
+        Downloads that are complete never change so they can be cached for as long as
+        `LBRY_CONTENT_CACHE_CONTROL` says, incomplete ones get `LBRY_CONTENT_INCOMPLETE_CACHE_CONTROL`.
+        """
+        validator = f'{descriptor.outpoint}:{descriptor.real_size}:{descriptor.mtime_ns}'
+        if descriptor.real_size >= descriptor.size:
+            cache_control = settings.LBRY_CONTENT_CACHE_CONTROL
+        else:
+            cache_control = settings.LBRY_CONTENT_INCOMPLETE_CACHE_CONTROL
+        return {
+            'ETag': f'"{hashlib.sha1(validator.encode()).hexdigest()}"',
+            'Last-Modified': http_date(descriptor.mtime),
+            'Cache-Control': cache_control,
+        }
+
+    def set_headers(self, response, headers):
+        for header, value in headers.items():
+            if value:
+                response[header] = value
+        return response
+
+    def offload_file(self, descriptor, content_type):
+        """
+        Return response telling the front-end server to send the file, ranges included, by itself.
+
+        With 'nginx' offload the file is redirected to under `LBRY_CONTENT_OFFLOAD_LOCATION`, which has to be
+        an internal location aliased to `LBRY_DOWNLOAD_DIRECTORY`. With 'apache' its path is passed in
+        X-Sendfile header handled by mod_xsendfile.
+        """
+        response = HttpResponse(content_type=content_type)
+        if settings.LBRY_CONTENT_OFFLOAD == 'nginx':
+            response['X-Accel-Redirect'] = (
+                f'{settings.LBRY_CONTENT_OFFLOAD_LOCATION}{quote(descriptor.file_name)}')
+        elif settings.LBRY_CONTENT_OFFLOAD == 'apache':
+            response['X-Sendfile'] = str(descriptor.path)
+        else:
+            raise ImproperlyConfigured(
+                f'Unknown LBRY_CONTENT_OFFLOAD {settings.LBRY_CONTENT_OFFLOAD!r}, use "nginx" or "apache"')
         response['Accept-Ranges'] = 'bytes'
         return response
 
+    def stream_file(self, file_handle, offset, length, real_file_size, content_type, status=200, follow=None):
+        """
+        Return response streaming `length` bytes of the file from `offset`.
 
-class ContentOutpointsView(ContentView):
+        Django hands files of `FileResponse` to `wsgi.file_wrapper` so the WSGI server can use sendfile.
+        Ranges reaching past the end of the file on disk are streamed in Python, waiting for the missing bytes
+        with `follow` or padded.
+        """
+        block_size = file_utils.get_block_size(length, settings.LBRY_CONTENT_BLOCK_SIZE)
+        if settings.LBRY_CONTENT_SENDFILE and offset + length <= real_file_size:
+            response = FileResponse(
+                file_utils.FileRange(file_handle, offset=offset, length=length),
+                status=status, content_type=content_type)
+            # Only used when the server reads the file
+            response.block_size = block_size
+            return response
+        return StreamingHttpResponse(
+            file_utils.RangeFileWrapper(
+                file_handle, blksize=block_size, offset=offset, length=length, readahead=self.get_readahead(),
+                follow=follow),
+            status=status, content_type=content_type)
 
-    def get_instance(self, request, **kwargs):
-        return get_object_or_404(
-            # Content.objects.filter(downloaded_by=request.user), outpoint=kwargs['outpoint'])
-            Content.objects.all(), outpoint=kwargs['outpoint'])
+    def get_readahead(self):
+        return settings.LBRY_CONTENT_READAHEAD if settings.LBRY_CONTENT_FADVISE else None
+
+    def get_follower(self, request, descriptor):
+        """
+        Return follower waiting for the bytes the daemon is yet to write to the described file,
+        None if they are to be padded.
+
+        The download is checked on the daemon of the account that started it, whoever is requesting the file.
+        """
+        if not settings.LBRY_CONTENT_FOLLOW:
+            return None
+        api_client = API(descriptor.account_id)
+
+        def get_status():
+            try:
+                files = api_client.call('file_list', outpoint=descriptor.outpoint)
+            except DaemonException as exc:
+                logger.warning('Could not check download of %s: %s', descriptor.outpoint, exc)
+                return None
+            return files[0] if files else None
+
+        return file_utils.DownloadFollower(
+            get_status, timeout=settings.LBRY_CONTENT_FOLLOW_TIMEOUT,
+            status_interval=settings.LBRY_CONTENT_FOLLOW_STATUS_INTERVAL)
+
+
+def if_range_passes(request, etag, last_modified):
+    """
+    Tell whether the Range header of the request is to be honoured as far as its If-Range header goes.
+
+    Ranges only apply to the representation If-Range has, identified by a strong ETag or an exact date.
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range == etag
+    if if_range.startswith('W/'):
+        # Weak ETags can't be used for ranges
+        return False
+    return parse_http_date_safe(if_range) == last_modified
+
+
+class ContentOutpointsView(ContentView):
+    lookup_field = 'outpoint'
 
 
 class ContentPublishView(View):
@@ -81,33 +249,242 @@ class ContentPublishView(View):
         if not request.user.is_authenticated:
             return HttpResponseForbidden()
         api_client = API(request.user.account_id)
-        storage = FileSystemStorage(location=os.path.join(
-            settings.LBRY_PUBLISH_SAVE, f'account_{request.user.account_id}'))
         try:
-            uploaded_file = request.FILES[self.file_field]
-            filename_hash_bits = ':'.join([
-                request.user.account_id,
-                settings.SECRET_KEY,
-                uploaded_file.name
-            ]).encode('utf-8')
-            final_filename = hashlib.sha1(filename_hash_bits).hexdigest() + '_' + uploaded_file.name
-            storage.save(final_filename, uploaded_file)
-            saved_file_path = storage.path(final_filename)
-            logger.debug(
-                'Saving uploaded file %s to %s', uploaded_file.name, saved_file_path)
-            # This is for running lbryweb outside of Docker
-            # because we don't see the same file paths
-            feed_file_path = os.path.join(
-                settings.LBRY_PUBLISH_FEED,
-                f'account_{request.user.account_id}',
-                final_filename
-            )
-            client_payload = json.loads(request.POST[self.json_payload_field])
+            feed_file_path, client_payload = self.save_upload(request)
             response = api_client.publish(feed_file_path, client_payload)
             return JsonResponse(response)
         except KeyError as exc:
             logger.error('Exception while parsing request: %s', exc)
             return HttpResponseBadRequest(f'Proxy exception: {exc}')
+        except UploadTooLarge as exc:
+            logger.warning('Rejected PUBLISH request: %s', exc)
+            return HttpResponse(str(exc), status=413)
+        except DaemonUnavailable as exc:
+            logger.warning('Daemon unavailable for PUBLISH request: %s', exc)
+            return service_unavailable(exc)
+        except Exception as exc:
+            logger.error('Exception while processing PUBLISH request: %s', exc)
+            return HttpResponseBadRequest(f'Proxy exception: {exc}')
+
+    def save_upload(self, request):
+        """
+        Save uploaded file into account publishing directory, streaming it there as it's received.
+
+        Under ASGI the body has already been spooled by Django by then, see `AsyncContentPublishView`.
+
+        Returns file path as seen by the daemon and client payload for the `publish` call.
+        """
+        upload_handler = PublishUploadHandler(
+            request,
+            directory=os.path.join(settings.LBRY_PUBLISH_SAVE, f'account_{request.user.account_id}'),
+            get_file_name=lambda file_name: self.get_file_name(request, file_name),
+            field_name=self.file_field,
+            max_size=settings.LBRY_PUBLISH_MAX_SIZE,
+        )
+        request.upload_handlers = [upload_handler]
+        try:
+            uploaded_file = request.FILES.get(self.file_field)
+        except Exception:
+            # Connection lost or malformed body, don't leave the partial file behind
+            upload_handler.discard()
+            raise
+        if upload_handler.too_large:
+            raise UploadTooLarge(f'Uploaded file is larger than {settings.LBRY_PUBLISH_MAX_SIZE} bytes')
+        if uploaded_file is None:
+            raise KeyError(self.file_field)
+        uploaded_file.close()
+        final_filename = os.path.basename(uploaded_file.path)
+        logger.debug(
+            'Saved uploaded file %s to %s (%s bytes, sha256 %s)',
+            uploaded_file.name, uploaded_file.path, uploaded_file.size, uploaded_file.content_hash)
+        client_payload = json.loads(request.POST[self.json_payload_field])
+        return self.get_feed_file_path(request, final_filename), client_payload
+
+    def get_feed_file_path(self, request, final_filename):
+        # This is for running lbryweb outside of Docker
+        # because we don't see the same file paths
+        return os.path.join(
+            settings.LBRY_PUBLISH_FEED,
+            f'account_{request.user.account_id}',
+            final_filename
+        )
+
+    def get_file_name(self, request, uploaded_file_name):
+        return get_publish_file_name(request.user.account_id, uploaded_file_name)
+
+
+def get_upload(request, upload_id):
+    return get_object_or_404(
+        Upload.objects.select_related('uploaded_by'),
+        pk=upload_id, uploaded_by=request.user, expires__gt=timezone.now())
+
+
+def get_upload_expiry():
+    return timezone.now() + timedelta(seconds=settings.LBRY_PUBLISH_UPLOAD_TTL)
+
+
+def upload_response(upload, status=200):
+    response = JsonResponse({
+        'upload_id': str(upload.pk),
+        'file_name': upload.file_name,
+        'offset': upload.offset,
+        'length': upload.length,
+    }, status=status)
+    response['Upload-Offset'] = str(upload.offset)
+    return response
+
+
+class UploadsView(View):
+
+    def post(self, request, *args, **kwargs):
+        """
+        Start a resumable upload of a file for publishing, described by its `file_name` and `length` in JSON.
+        """
+        if not request.user.is_authenticated:
+            return HttpResponseForbidden()
+        try:
+            upload_data = json.loads(request.body)
+            file_name = os.path.basename(str(upload_data['file_name']).replace('\\', '/'))
+            length = int(upload_data['length'])
+        except (ValueError, TypeError, KeyError) as exc:
+            return HttpResponseBadRequest(f'Invalid upload: {exc}')
+        if file_name in ('', '.', '..') or length < 0:
+            return HttpResponseBadRequest('Invalid upload: file name or length')
+        if settings.LBRY_PUBLISH_MAX_SIZE and length > settings.LBRY_PUBLISH_MAX_SIZE:
+            return HttpResponse(
+                f'Uploaded file is larger than {settings.LBRY_PUBLISH_MAX_SIZE} bytes', status=413)
+        upload = Upload.objects.create(
+            uploaded_by=request.user, file_name=file_name, length=length, expires=get_upload_expiry())
+        os.makedirs(upload.get_directory(), exist_ok=True)
+        open(upload.get_part_path(), 'wb').close()
+        response = upload_response(upload, status=201)
+        response['Location'] = reverse('upload', kwargs={'upload_id': upload.pk})
+        return response
+
+
+class UploadView(View):
+    """
+    Resumable upload of a file for publishing.
+
+    Chunks are sent in PATCH (or PUT) bodies with the `Upload-Offset` header, which has to be the offset
+    the upload is at. A client whose connection broke gets the offset and carries on from there, bytes
+    of the broken chunk that have been received are kept.
+    """
+    chunk_size = 1024 * 1024
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return HttpResponseForbidden()
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, upload_id, *args, **kwargs):
+        return upload_response(get_upload(request, upload_id))
+
+    def patch(self, request, upload_id, *args, **kwargs):
+        upload = get_upload(request, upload_id)
+        if not request.META.get('CONTENT_LENGTH'):
+            # Chunks are read up to their length, chunked bodies aren't supported
+            return HttpResponse('Content-Length header is required', status=411)
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            chunk_length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest('Upload-Offset and Content-Length headers are required')
+        if offset + chunk_length > upload.length:
+            return HttpResponseBadRequest(f'Chunk ends past the upload length of {upload.length} bytes')
+        with open(upload.get_part_path(), 'r+b') as part_file:
+            try:
+                fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another chunk is being written
+                return upload_response(upload, status=423)
+            upload.refresh_from_db()
+            if offset != upload.offset:
+                return upload_response(upload, status=409)
+            part_file.seek(offset)
+            received = 0
+            try:
+                while received < chunk_length:
+                    data = request.read(min(self.chunk_size, chunk_length - received))
+                    if not data:
+                        break
+                    part_file.write(data)
+                    received += len(data)
+            finally:
+                # Also when the connection breaks, for the client to resume after what has been received
+                part_file.flush()
+                upload.offset = offset + received
+                upload.expires = get_upload_expiry()
+                upload.save(update_fields=['offset', 'expires'])
+        logger.debug('Received %s bytes of upload %s at %s', received, upload.pk, offset)
+        return upload_response(upload)
+
+    put = patch
+
+    def delete(self, request, upload_id, *args, **kwargs):
+        upload = get_upload(request, upload_id)
+        upload.delete_files()
+        upload.delete()
+        return HttpResponse(status=204)
+
+
+class UploadPublishView(ContentPublishView):
+    """
+    Publish a file uploaded in chunks once all of it has been received, the upload is over then.
+    """
+
+    def post(self, request, upload_id, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return HttpResponseForbidden()
+        self.upload = get_upload(request, upload_id)
+        if not self.upload.is_complete:
+            return upload_response(self.upload, status=409)
+        response = super().post(request, *args, **kwargs)
+        if response.status_code == 200:
+            self.upload.delete()
+        return response
+
+    def save_upload(self, request):
+        publish_path = self.upload.get_publish_path()
+        part_path = self.upload.get_part_path()
+        # Gone if it was moved by an earlier attempt the daemon failed to publish, which is retried from there
+        if os.path.exists(part_path):
+            # Bytes past the offset come from chunks that broke before it was saved
+            os.truncate(part_path, self.upload.length)
+            os.replace(part_path, publish_path)
+        client_payload = json.loads(request.POST[self.json_payload_field])
+        return self.get_feed_file_path(request, os.path.basename(publish_path)), client_payload
+
+
+def is_authenticated(request):
+    return request.user.is_authenticated
+
+
+class AsyncContentPublishView(AsyncView, ContentPublishView):
+    """
+    Version of `ContentPublishView` that doesn't occupy a worker while the daemon publishes, served under ASGI.
+
+    Django's ASGI handler spools the whole request body to a temporary file before any view runs, so uploads
+    here are written to disk twice and `LBRY_PUBLISH_MAX_SIZE` only applies once they have been received.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        if not await sync_to_async(is_authenticated)(request):
+            return HttpResponseForbidden()
+        api_client = AsyncAPI(request.user.account_id)
+        try:
+            feed_file_path, client_payload = await sync_to_async(self.save_upload)(request)
+            response = await api_client.publish(feed_file_path, client_payload)
+            return JsonResponse(response)
+        except KeyError as exc:
+            logger.error('Exception while parsing request: %s', exc)
+            return HttpResponseBadRequest(f'Proxy exception: {exc}')
+        except UploadTooLarge as exc:
+            logger.warning('Rejected PUBLISH request: %s', exc)
+            return HttpResponse(str(exc), status=413)
+        except DaemonUnavailable as exc:
+            logger.warning('Daemon unavailable for PUBLISH request: %s', exc)
+            return service_unavailable(exc)
         except Exception as exc:
             logger.error('Exception while processing PUBLISH request: %s', exc)
             return HttpResponseBadRequest(f'Proxy exception: {exc}')